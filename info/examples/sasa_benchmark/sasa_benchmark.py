@@ -0,0 +1,68 @@
+# Compares the speed and accuracy of the analytical LCPO estimate of
+# the solvent accessible surface area against the Shrake-Rupley areas
+# for the lysozyme example structure. Run from this directory.
+import time
+
+import numpy as np
+
+from geomm.sasa import shrake_rupley, lcpo, fit_lcpo_parameters
+
+# Bondi van der Waals radii in nm
+RADII = {'H' : 0.12, 'C' : 0.17, 'N' : 0.155, 'O' : 0.152, 'S' : 0.18}
+
+N_FRAMES = 20
+N_FIT_FRAMES = 5
+
+def read_pdb(path):
+
+    coords = []
+    elements = []
+    with open(path) as rf:
+        for line in rf:
+            if line.startswith(('ATOM', 'HETATM')):
+                coords.append([float(line[30:38]), float(line[38:46]), float(line[46:54])])
+                elements.append(line[76:78].strip())
+
+    # angstroms to nm
+    return np.array(coords) / 10, np.array(elements)
+
+def timed(func, *args, **kwargs):
+
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+coords, elements = read_pdb('../lysozyme_pxylene.pdb')
+radii = np.array([RADII[element] for element in elements])
+
+# thermal-like fluctuations around the structure
+rng = np.random.RandomState(0)
+traj = coords + rng.normal(scale=0.01, size=(N_FRAMES,) + coords.shape)
+
+reference, sr_time = timed(shrake_rupley, traj, radii)
+
+# the default parameters and parameters fit for each element on a few
+# frames, evaluated on the others
+_, element_types = np.unique(elements, return_inverse=True)
+parameters = fit_lcpo_parameters(traj[:N_FIT_FRAMES], radii, reference[:N_FIT_FRAMES],
+                                 atom_types=element_types)
+
+test_reference = reference[N_FIT_FRAMES:]
+default_areas, lcpo_time = timed(lcpo, traj[N_FIT_FRAMES:], radii)
+fit_areas, _ = timed(lcpo, traj[N_FIT_FRAMES:], radii, parameters=parameters)
+
+n_test = N_FRAMES - N_FIT_FRAMES
+
+print("{} atoms, {} frames".format(coords.shape[0], N_FRAMES))
+print("Shrake-Rupley (960 points): {:.1f} ms per frame".format(1000 * sr_time / N_FRAMES))
+print("LCPO: {:.1f} ms per frame, {:.1f}x faster".format(
+    1000 * lcpo_time / n_test, (sr_time / N_FRAMES) / (lcpo_time / n_test)))
+
+for label, areas in (('default parameters', default_areas),
+                     ('fit parameters', fit_areas)):
+
+    total_error = np.abs(areas.sum(axis=1) - test_reference.sum(axis=1)) / test_reference.sum(axis=1)
+    atom_rmse = np.sqrt(np.mean((areas - test_reference)**2))
+
+    print("LCPO with {}: total area error {:.1f}%, per atom RMSE {:.4f} nm^2".format(
+        label, 100 * total_error.mean(), atom_rmse))
@@ -3,13 +3,14 @@
 
 import io
 import re
+import sys
 from glob import glob
 from os.path import basename
 from os.path import dirname
 from os.path import join
 from os.path import splitext
 
-from setuptools import setup, find_packages
+from setuptools import setup, find_packages, Extension
 
 import itertools as it
 
@@ -17,6 +18,37 @@ import itertools as it
 from Cython.Build import cythonize
 import numpy as np
 
+# OpenMP flags for the parallel loops in the cython extensions, Apple
+# clang does not ship OpenMP so the loops just run serially there
+if sys.platform == 'win32':
+    openmp_compile_args = ['/openmp']
+    openmp_link_args = []
+elif sys.platform == 'darwin':
+    openmp_compile_args = []
+    openmp_link_args = []
+else:
+    openmp_compile_args = ['-fopenmp']
+    openmp_link_args = ['-fopenmp']
+
+extensions = [
+    Extension('geomm.pyqcprot',
+              ["src/geomm/pyqcprot.pyx"],
+              include_dirs=[np.get_include()],
+              extra_compile_args=openmp_compile_args,
+              extra_link_args=openmp_link_args,
+    ),
+    Extension('geomm._distance',
+              ["src/geomm/_distance.pyx"],
+              extra_compile_args=openmp_compile_args,
+              extra_link_args=openmp_link_args,
+    ),
+    Extension('geomm._sasa',
+              ["src/geomm/_sasa.pyx"],
+              extra_compile_args=openmp_compile_args,
+              extra_link_args=openmp_link_args,
+    ),
+]
+
 # the basic needed requirements for a package
 base_requirements = [
     'numpy',
@@ -63,7 +95,7 @@ setup(
     tests_require=['pytest', 'tox'],
 
     include_dirs=[np.get_include()],
-    ext_modules = cythonize("src/geomm/pyqcprot.pyx"),
+    ext_modules = cythonize(extensions),
 
 
     # package
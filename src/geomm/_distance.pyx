@@ -0,0 +1,101 @@
+"""
+Compiled kernels for `geomm.distance`.
+
+All of the functions accept float32 or float64 coordinates, the
+distances are computed in double precision.
+
+.. autofunction:: PairDistances
+
+"""
+
+import cython
+from cython cimport floating
+from cython.parallel cimport prange
+
+cdef extern from "math.h" nogil:
+    double sqrt(double x)
+    double nearbyint(double x)
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef void _frame_distances(const floating[:, :, ::1] coords,
+                           Py_ssize_t frame_idx,
+                           const Py_ssize_t[:, ::1] pairs,
+                           const double[:, ::1] unitcell_side_lengths,
+                           double[:, :] out) noexcept nogil:
+    """The distances of all the pairs in a single frame."""
+
+    cdef Py_ssize_t pair_idx, i, j
+    cdef double dx, dy, dz
+    cdef double lx = 0.0
+    cdef double ly = 0.0
+    cdef double lz = 0.0
+    cdef double inv_lx = 0.0
+    cdef double inv_ly = 0.0
+    cdef double inv_lz = 0.0
+    cdef bint pbc = unitcell_side_lengths is not None
+
+    if pbc:
+        lx = unitcell_side_lengths[frame_idx, 0]
+        ly = unitcell_side_lengths[frame_idx, 1]
+        lz = unitcell_side_lengths[frame_idx, 2]
+        inv_lx = 1.0 / lx
+        inv_ly = 1.0 / ly
+        inv_lz = 1.0 / lz
+
+    for pair_idx in range(pairs.shape[0]):
+        i = pairs[pair_idx, 0]
+        j = pairs[pair_idx, 1]
+
+        dx = <double>coords[frame_idx, j, 0] - <double>coords[frame_idx, i, 0]
+        dy = <double>coords[frame_idx, j, 1] - <double>coords[frame_idx, i, 1]
+        dz = <double>coords[frame_idx, j, 2] - <double>coords[frame_idx, i, 2]
+
+        if pbc:
+            # minimum image convention
+            dx -= lx * nearbyint(dx * inv_lx)
+            dy -= ly * nearbyint(dy * inv_ly)
+            dz -= lz * nearbyint(dz * inv_lz)
+
+        out[frame_idx, pair_idx] = sqrt(dx * dx + dy * dy + dz * dz)
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def PairDistances(const floating[:, :, ::1] coords,
+                  const Py_ssize_t[:, ::1] pairs,
+                  const double[:, ::1] unitcell_side_lengths,
+                  double[:, :] out,
+                  int num_threads=0):
+    """
+    Calculate the distances between pairs of atoms for a stack of
+    frames.
+
+    The frames are distributed over OpenMP threads with the GIL
+    released.
+
+    Parameters
+    ----------
+    coords : memoryview, float64 or float32
+        the frames, shape (n_frames, n_atoms, 3)
+    pairs : memoryview, intp
+        the atom indices of each pair, shape (n_pairs, 2)
+    unitcell_side_lengths : memoryview, float64 (optional)
+        the side lengths of the rectangular unitcell of each frame,
+        shape (n_frames, 3). If given the minimum image distances are
+        computed.
+    out : memoryview, float64
+        array of shape (n_frames, n_pairs) to store the distances in
+    num_threads : int (optional)
+        number of threads to use, if 0 the OpenMP default is used
+    """
+
+    cdef Py_ssize_t frame_idx
+    cdef Py_ssize_t n_frames = coords.shape[0]
+
+    if num_threads > 0:
+        for frame_idx in prange(n_frames, nogil=True, schedule='static',
+                                num_threads=num_threads):
+            _frame_distances(coords, frame_idx, pairs, unitcell_side_lengths, out)
+    else:
+        for frame_idx in prange(n_frames, nogil=True, schedule='static'):
+            _frame_distances(coords, frame_idx, pairs, unitcell_side_lengths, out)
@@ -0,0 +1,363 @@
+"""
+Compiled kernels for `geomm.sasa`.
+
+The coordinates can be float32 or float64, the burial tests are done
+in double precision.
+
+.. autofunction:: NeighborLists
+.. autofunction:: AtomAreas
+.. autofunction:: AtomBurial
+.. autofunction:: LCPOTerms
+
+"""
+
+import cython
+from cython cimport floating
+from cython.parallel cimport prange, parallel
+
+from libc.stdlib cimport calloc, free
+
+cdef extern from "math.h" nogil:
+    double M_PI
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def NeighborLists(const Py_ssize_t[:, ::1] pairs,
+                  const double[::1] distances,
+                  Py_ssize_t[::1] neighbor_starts,
+                  Py_ssize_t[::1] neighbor_idxs,
+                  double[::1] neighbor_distances):
+    """
+    Convert a list of unique pairs of atoms to the neighbor lists of
+    each atom in compressed (CSR) form, with a counting sort.
+
+    Parameters
+    ----------
+    pairs : memoryview, intp
+        the unique pairs of atoms, shape (n_pairs, 2)
+    distances : memoryview, float64
+        the distance of each pair, shape (n_pairs,)
+    neighbor_starts : memoryview, intp
+        array of shape (n_atoms + 1,) to store the start of the
+        neighbors of each atom in
+    neighbor_idxs : memoryview, intp
+        array of shape (2 * n_pairs,) to store the neighbors in
+    neighbor_distances : memoryview, float64
+        array of shape (2 * n_pairs,) to store the distance to each
+        neighbor in
+    """
+
+    cdef Py_ssize_t pair_idx, atom_idx, i, j
+    cdef Py_ssize_t n_atoms = neighbor_starts.shape[0] - 1
+
+    with nogil:
+        for atom_idx in range(n_atoms + 1):
+            neighbor_starts[atom_idx] = 0
+
+        # count the neighbors of each atom, offset by one
+        for pair_idx in range(pairs.shape[0]):
+            neighbor_starts[pairs[pair_idx, 0] + 1] += 1
+            neighbor_starts[pairs[pair_idx, 1] + 1] += 1
+
+        for atom_idx in range(n_atoms):
+            neighbor_starts[atom_idx + 1] += neighbor_starts[atom_idx]
+
+        # fill each atom's list, the starts are used as the insertion
+        # positions which leaves each at the start of the next atom
+        for pair_idx in range(pairs.shape[0]):
+            i = pairs[pair_idx, 0]
+            j = pairs[pair_idx, 1]
+
+            neighbor_idxs[neighbor_starts[i]] = j
+            neighbor_distances[neighbor_starts[i]] = distances[pair_idx]
+            neighbor_starts[i] += 1
+
+            neighbor_idxs[neighbor_starts[j]] = i
+            neighbor_distances[neighbor_starts[j]] = distances[pair_idx]
+            neighbor_starts[j] += 1
+
+        # shift the starts back
+        for atom_idx in range(n_atoms, 0, -1):
+            neighbor_starts[atom_idx] = neighbor_starts[atom_idx - 1]
+        neighbor_starts[0] = 0
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef Py_ssize_t _accessible_points(const floating[:, ::1] coords,
+                                   const double[::1] radii,
+                                   const double[:, ::1] sphere_points,
+                                   const Py_ssize_t[::1] neighbor_starts,
+                                   const Py_ssize_t[::1] neighbor_idxs,
+                                   Py_ssize_t atom_idx,
+                                   unsigned char *buried_points) noexcept nogil:
+    """The number of accessible points of a single atom, if
+    buried_points is not NULL whether each point is buried is written
+    to it."""
+
+    cdef Py_ssize_t point_idx, k, j
+    cdef Py_ssize_t n_points = sphere_points.shape[0]
+    cdef Py_ssize_t start = neighbor_starts[atom_idx]
+    cdef Py_ssize_t end = neighbor_starts[atom_idx + 1]
+    cdef Py_ssize_t last = start
+    cdef Py_ssize_t n_accessible = 0
+    cdef double radius = radii[atom_idx]
+    cdef double cx = coords[atom_idx, 0]
+    cdef double cy = coords[atom_idx, 1]
+    cdef double cz = coords[atom_idx, 2]
+    cdef double px, py, pz, dx, dy, dz, r
+    cdef bint buried
+
+    for point_idx in range(n_points):
+        px = cx + radius * sphere_points[point_idx, 0]
+        py = cy + radius * sphere_points[point_idx, 1]
+        pz = cz + radius * sphere_points[point_idx, 2]
+
+        # neighboring points are usually buried by the same atom so
+        # start from the last one that buried a point
+        buried = False
+        for k in range(end - start):
+            j = last + k
+            if j >= end:
+                j -= end - start
+            r = radii[neighbor_idxs[j]]
+            dx = px - coords[neighbor_idxs[j], 0]
+            dy = py - coords[neighbor_idxs[j], 1]
+            dz = pz - coords[neighbor_idxs[j], 2]
+            if dx * dx + dy * dy + dz * dz < r * r:
+                buried = True
+                last = j
+                break
+
+        if not buried:
+            n_accessible += 1
+
+        if buried_points != NULL:
+            buried_points[point_idx] = buried
+
+    return n_accessible
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def AtomAreas(const floating[:, ::1] coords,
+              const double[::1] radii,
+              const double[:, ::1] sphere_points,
+              const Py_ssize_t[::1] neighbor_starts,
+              const Py_ssize_t[::1] neighbor_idxs,
+              double[::1] areas,
+              int num_threads=0):
+    """
+    Calculate the solvent accessible area of each atom in a frame by
+    counting the points of its sphere that are not buried by any of
+    its neighbors.
+
+    The atoms are distributed over OpenMP threads with the GIL
+    released.
+
+    Parameters
+    ----------
+    coords : memoryview, float64 or float32
+        the coordinates of the atoms, shape (n_atoms, 3)
+    radii : memoryview, float64
+        the radius of each atom including the probe radius,
+        shape (n_atoms,)
+    sphere_points : memoryview, float64
+        points on the unit sphere, shape (n_points, 3)
+    neighbor_starts : memoryview, intp
+        the start of the neighbors of each atom in neighbor_idxs,
+        shape (n_atoms + 1,)
+    neighbor_idxs : memoryview, intp
+        the indices of the neighbors of all the atoms
+    areas : memoryview, float64
+        array of shape (n_atoms,) to store the areas in
+    num_threads : int (optional)
+        number of threads to use, if 0 the OpenMP default is used
+    """
+
+    cdef Py_ssize_t atom_idx
+    cdef Py_ssize_t n_atoms = coords.shape[0]
+    cdef double n_points = sphere_points.shape[0]
+
+    if num_threads > 0:
+        for atom_idx in prange(n_atoms, nogil=True, schedule='guided',
+                               num_threads=num_threads):
+            areas[atom_idx] = (4.0 * M_PI * radii[atom_idx] * radii[atom_idx]
+                               * _accessible_points(coords, radii, sphere_points,
+                                                    neighbor_starts, neighbor_idxs,
+                                                    atom_idx, NULL)
+                               / n_points)
+    else:
+        for atom_idx in prange(n_atoms, nogil=True, schedule='guided'):
+            areas[atom_idx] = (4.0 * M_PI * radii[atom_idx] * radii[atom_idx]
+                               * _accessible_points(coords, radii, sphere_points,
+                                                    neighbor_starts, neighbor_idxs,
+                                                    atom_idx, NULL)
+                               / n_points)
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def AtomBurial(const floating[:, ::1] coords,
+               const double[::1] radii,
+               const double[:, ::1] sphere_points,
+               const Py_ssize_t[::1] neighbor_starts,
+               const Py_ssize_t[::1] neighbor_idxs,
+               const Py_ssize_t[::1] atom_idxs,
+               unsigned char[:, ::1] buried,
+               int num_threads=0):
+    """
+    Determine which of the sphere points of a subset of the atoms in
+    a frame are buried by their neighbors.
+
+    Parameters
+    ----------
+    coords : memoryview, float64 or float32
+        the coordinates of the atoms, shape (n_atoms, 3)
+    radii : memoryview, float64
+        the radius of each atom including the probe radius,
+        shape (n_atoms,)
+    sphere_points : memoryview, float64
+        points on the unit sphere, shape (n_points, 3)
+    neighbor_starts : memoryview, intp
+        the start of the neighbors of each atom in neighbor_idxs,
+        shape (n_atoms + 1,)
+    neighbor_idxs : memoryview, intp
+        the indices of the neighbors of all the atoms
+    atom_idxs : memoryview, intp
+        the indices of the atoms to compute, shape (n_selected,)
+    buried : memoryview, uint8
+        array of shape (n_selected, n_points), set to 1 for the buried
+        points and 0 for the accessible ones
+    num_threads : int (optional)
+        number of threads to use, if 0 the OpenMP default is used
+    """
+
+    cdef Py_ssize_t k
+    cdef Py_ssize_t n_selected = atom_idxs.shape[0]
+
+    if n_selected == 0:
+        return
+
+    if num_threads > 0:
+        for k in prange(n_selected, nogil=True, schedule='guided',
+                        num_threads=num_threads):
+            _accessible_points(coords, radii, sphere_points,
+                               neighbor_starts, neighbor_idxs,
+                               atom_idxs[k], &buried[k, 0])
+    else:
+        for k in prange(n_selected, nogil=True, schedule='guided'):
+            _accessible_points(coords, radii, sphere_points,
+                               neighbor_starts, neighbor_idxs,
+                               atom_idxs[k], &buried[k, 0])
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef void _atom_lcpo_terms(const double[::1] radii,
+                           const Py_ssize_t[::1] neighbor_starts,
+                           const Py_ssize_t[::1] neighbor_idxs,
+                           const double[::1] overlaps,
+                           Py_ssize_t i,
+                           unsigned char *is_neighbor,
+                           double[:, ::1] terms) noexcept nogil:
+    """The LCPO terms of a single atom, is_neighbor is zeroed scratch
+    space of length n_atoms."""
+
+    cdef Py_ssize_t a, b, j
+    cdef double neighbor_sum
+    cdef double pair_sum = 0.0
+    cdef double triple_sum = 0.0
+    cdef double product_sum = 0.0
+
+    for a in range(neighbor_starts[i], neighbor_starts[i + 1]):
+        is_neighbor[neighbor_idxs[a]] = 1
+
+    for a in range(neighbor_starts[i], neighbor_starts[i + 1]):
+        j = neighbor_idxs[a]
+
+        # the overlaps of j with the other neighbors of i
+        neighbor_sum = 0.0
+        for b in range(neighbor_starts[j], neighbor_starts[j + 1]):
+            # without a branch, which would be mispredicted often
+            neighbor_sum = neighbor_sum + is_neighbor[neighbor_idxs[b]] * overlaps[b]
+
+        pair_sum = pair_sum + overlaps[a]
+        triple_sum = triple_sum + neighbor_sum
+        product_sum = product_sum + overlaps[a] * neighbor_sum
+
+    for a in range(neighbor_starts[i], neighbor_starts[i + 1]):
+        is_neighbor[neighbor_idxs[a]] = 0
+
+    terms[i, 0] = 4.0 * M_PI * radii[i] * radii[i]
+    terms[i, 1] = pair_sum
+    terms[i, 2] = triple_sum
+    terms[i, 3] = product_sum
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def LCPOTerms(const double[::1] radii,
+              const Py_ssize_t[::1] neighbor_starts,
+              const Py_ssize_t[::1] neighbor_idxs,
+              const double[::1] overlaps,
+              double[:, ::1] terms,
+              int num_threads=0):
+    """
+    Calculate the four terms of the LCPO approximation of the solvent
+    accessible area of each atom: the area of its sphere, the sum of
+    its overlaps with its neighbors, the sum of the overlaps between
+    each pair of its neighbors, and the sum of its overlap with each
+    neighbor times that neighbor's overlaps with the others.
+
+    The atoms of several frames can be computed together by giving
+    neighbor lists with the atoms of each frame offset.
+
+    Parameters
+    ----------
+    radii : memoryview, float64
+        the radius of each atom including the probe radius,
+        shape (n_atoms,)
+    neighbor_starts : memoryview, intp
+        the start of the neighbors of each atom in neighbor_idxs,
+        shape (n_atoms + 1,)
+    neighbor_idxs : memoryview, intp
+        the indices of the overlapping neighbors of all the atoms
+    overlaps : memoryview, float64
+        the area of the sphere of each atom buried by each of its
+        neighbors, in the same order as neighbor_idxs
+    terms : memoryview, float64
+        array of shape (n_atoms, 4) to store the terms in
+    num_threads : int (optional)
+        number of threads to use, if 0 the OpenMP default is used
+    """
+
+    cdef Py_ssize_t atom_idx
+    cdef Py_ssize_t n_atoms = radii.shape[0]
+    cdef unsigned char *is_neighbor
+    cdef Py_ssize_t n_failed = 0
+
+    if n_atoms == 0:
+        return
+
+    # each thread has its own scratch space, the atoms of a thread
+    # that could not allocate it are counted so the error is raised
+    # after the loop
+    if num_threads > 0:
+        with nogil, parallel(num_threads=num_threads):
+            is_neighbor = <unsigned char *> calloc(n_atoms, sizeof(unsigned char))
+            for atom_idx in prange(n_atoms, schedule='guided'):
+                if is_neighbor == NULL:
+                    n_failed += 1
+                else:
+                    _atom_lcpo_terms(radii, neighbor_starts, neighbor_idxs, overlaps,
+                                     atom_idx, is_neighbor, terms)
+            free(is_neighbor)
+    else:
+        with nogil, parallel():
+            is_neighbor = <unsigned char *> calloc(n_atoms, sizeof(unsigned char))
+            for atom_idx in prange(n_atoms, schedule='guided'):
+                if is_neighbor == NULL:
+                    n_failed += 1
+                else:
+                    _atom_lcpo_terms(radii, neighbor_starts, neighbor_idxs, overlaps,
+                                     atom_idx, is_neighbor, terms)
+            free(is_neighbor)
+
+    if n_failed > 0:
+        raise MemoryError("Could not allocate the LCPO scratch space")
@@ -0,0 +1,126 @@
+import numpy as np
+
+from geomm.theobald_qcp import QCPReference
+
+def _iter_chunks(chunks):
+    """Start a new pass over the chunks of frames."""
+
+    if callable(chunks):
+        return iter(chunks())
+
+    chunks_iter = iter(chunks)
+
+    if chunks_iter is chunks:
+        raise TypeError("chunks must be an iterable which can be iterated over "
+                        "multiple times (e.g. a list) or a function returning "
+                        "a new iterator, not an iterator")
+
+    return chunks_iter
+
+def iterative_average_structure(chunks, ref_coords=None, idxs=None,
+                                weights=None, tol=1e-6, max_iterations=50,
+                                num_threads=None):
+    """Compute the average structure of a trajectory by iterative
+    superposition, streaming over chunks of frames.
+
+    In each pass every frame is superimposed (with Theobald-QCP) onto
+    the current average and the new average is computed from the
+    superimposed frames. Only the running sum of the superimposed
+    coordinates is kept between chunks so the memory use does not
+    depend on the length of the trajectory. This is repeated until
+    the RMSD between consecutive averages is less than `tol`.
+
+    Parameters
+    ----------
+
+    chunks : iterable of arraylike of shape (chunk_n_frames, n_atoms, 3) or callable
+        The frames in chunks. Since multiple passes are made this
+        must either be iterable multiple times (e.g. a list of arrays
+        or slices of an h5py dataset) or a function which returns a
+        new iterator over the chunks on every call.
+
+    ref_coords : arraylike of shape (n_atoms, 3), optional
+        The initial reference structure, if not given the first frame
+        is used.
+       (Default = None)
+
+    idxs : arraylike of int, optional
+        Indices of the atoms that are used for the alignment and the
+        convergence test, the average is computed for all atoms.
+       (Default = None)
+
+    weights : arraylike, optional
+        Weights of the aligned coordinates (e.g. masses).
+       (Default = None)
+
+    tol : float, optional
+        The RMSD (over the aligned atoms) between the averages of two
+        consecutive passes at which the average is considered
+        converged.
+       (Default = 1e-6)
+
+    max_iterations : int, optional
+        The maximum number of passes over the frames.
+       (Default = 50)
+
+    num_threads : int, optional
+        Number of OpenMP threads for the alignments.
+       (Default = None)
+
+    Returns
+    -------
+
+    average_coords : arraylike of shape (n_atoms, 3)
+        The average structure, in the frame of reference of the
+        initial reference structure.
+
+    n_iterations : int
+        The number of passes that were made.
+
+    """
+
+    assert max_iterations > 0, "max_iterations must be positive"
+
+    if ref_coords is None:
+        ref_coords = np.array(next(_iter_chunks(chunks))[0], dtype=np.float64)
+
+    average_coords = np.array(ref_coords, dtype=np.float64)
+
+    if idxs is not None:
+        idxs = np.asarray(idxs)
+
+    for n_iterations in range(1, max_iterations + 1):
+
+        reference = QCPReference(average_coords, idxs=idxs, weights=weights)
+
+        coords_sum = np.zeros(average_coords.shape, dtype=np.float64)
+        n_frames = 0
+
+        for chunk in _iter_chunks(chunks):
+
+            # read the chunk into memory (e.g. for h5py datasets)
+            chunk = np.asarray(chunk)
+
+            sup_coords, _, _ = reference.superimpose(chunk,
+                                                     num_threads=num_threads)
+
+            coords_sum += sup_coords.sum(axis=0)
+            n_frames += chunk.shape[0]
+
+        assert n_frames > 0, "No frames were given"
+
+        new_average_coords = coords_sum / n_frames
+
+        if idxs is not None:
+            change = new_average_coords[idxs] - average_coords[idxs]
+        else:
+            change = new_average_coords - average_coords
+
+        change_rmsd = np.sqrt(np.sum(np.square(change)) / change.shape[0])
+
+        average_coords = new_average_coords
+
+        if change_rmsd < tol:
+            break
+
+    return average_coords, n_iterations
@@ -0,0 +1,490 @@
+"""Clustering of frames by their RMSD after optimal superposition
+(Theobald-QCP) without computing the full pairwise RMSD matrix.
+
+Distance evaluations are avoided using the triangle inequality,
+which the RMSD satisfies, and the radius of gyration difference as a
+lower bound on the RMSD.
+
+"""
+
+import numpy as np
+
+from geomm.pyqcprot import RMSDOneToMany, AssignNearestBatch
+from geomm.theobald_qcp import _centered_frames, _coords_dtype
+from geomm.pairwise_rmsd import pairwise_rmsd
+
+class _FrameDistances(object):
+    """The centered frames and their inner products, computed once,
+    to evaluate RMSDs between any of them."""
+
+    def __init__(self, coords, idxs=None, weights=None, num_threads=None):
+
+        assert len(coords.shape) == 3, \
+            "coords should be a rank 3 array of shape (n_frames, n_atoms, 3)"
+        assert coords.shape[2] == 3, "coordinates are not of 3 dimensions"
+
+        if weights is not None:
+            weights = np.ascontiguousarray(weights, dtype=np.float64)
+
+        self.coords, self.Gs = _centered_frames(coords, idxs=idxs,
+                                                weights=weights)
+        self.weights = weights
+        self.n_frames = self.coords.shape[0]
+        self.n_coords = self.coords.shape[1]
+
+        if weights is not None:
+            assert weights.shape[0] == self.n_coords, \
+                "Number of weights given does not match the number of coordinates"
+
+        if num_threads is None:
+            num_threads = 0
+        self.num_threads = num_threads
+
+        # the square roots of the inner products scaled so that the
+        # difference of two of them is a lower bound on their RMSD
+        self.rg = np.sqrt(self.Gs / self.n_coords)
+
+        # number of RMSDs that were actually computed
+        self.n_evaluations = 0
+
+    def rmsds(self, frame_idx, frame_idxs):
+        """RMSDs between one frame and a set of frames."""
+
+        frame_idxs = np.ascontiguousarray(frame_idxs, dtype=np.intp)
+        rmsds = np.empty((frame_idxs.shape[0],), dtype=np.float64)
+
+        RMSDOneToMany(self.coords, self.Gs, frame_idx, frame_idxs,
+                      self.n_coords, rmsds, self.weights,
+                      num_threads=self.num_threads)
+
+        self.n_evaluations += frame_idxs.shape[0]
+
+        return rmsds
+
+    def lower_bounds(self, frame_idx, frame_idxs):
+        """Lower bounds on the RMSDs between one frame and a set of
+        frames from their radii of gyration."""
+
+        return np.abs(self.rg[frame_idxs] - self.rg[frame_idx])
+
+    def center_distances(self, center_idxs):
+        """The square matrix of RMSDs between the centers."""
+
+        n_centers = len(center_idxs)
+        center_distances = np.zeros((n_centers, n_centers))
+        for i in range(n_centers - 1):
+            center_distances[i, i+1:] = self.rmsds(center_idxs[i],
+                                                   center_idxs[i+1:])
+            center_distances[i+1:, i] = center_distances[i, i+1:]
+
+        return center_distances
+
+def _assign(frame_distances, center_idxs, labels, distances):
+    """Reassign frames to their closest center, given their exact
+    distance to their current center, using the center to center
+    distances and the radius of gyration bounds to skip
+    evaluations. Modifies `labels` and `distances` in place."""
+
+    center_distances = frame_distances.center_distances(center_idxs)
+
+    for center_i, center_idx in enumerate(center_idxs):
+
+        # a frame i currently assigned to center a can only be closer
+        # to center c if d(a, c) < 2 d(i, a) since d(i, c) >= d(a, c)
+        # - d(i, a)
+        candidates = np.flatnonzero(
+            (labels != center_i) &
+            (center_distances[labels, center_i] < 2.0 * distances))
+
+        candidates = candidates[
+            frame_distances.lower_bounds(center_idx, candidates) <
+            distances[candidates]]
+
+        if candidates.shape[0] == 0:
+            continue
+
+        rmsds = frame_distances.rmsds(center_idx, candidates)
+
+        closer = rmsds < distances[candidates]
+        labels[candidates[closer]] = center_i
+        distances[candidates[closer]] = rmsds[closer]
+
+def kcenters(coords, n_clusters, idxs=None, weights=None, first_center=0,
+             num_threads=None):
+    """Cluster frames with the k-centers algorithm (Gonzalez's
+    farthest-point clustering) using the RMSD after optimal
+    superposition as the distance.
+
+    Each new center is the frame farthest from its current center. A
+    frame only needs its distance to the new center computed if it
+    is farther from its current center than half the distance between
+    the two centers, the others are skipped by the triangle
+    inequality.
+
+    Parameters
+    ----------
+
+    coords : arraylike of shape (n_frames, n_atoms, 3)
+        The frames to cluster.
+
+    n_clusters : int
+        The number of clusters.
+
+    idxs : arraylike of int, optional
+        Indices of the atoms that are used for the alignment and RMSD.
+       (Default = None)
+
+    weights : arraylike, optional
+        Weights of the aligned coordinates (e.g. masses).
+       (Default = None)
+
+    first_center : int, optional
+        Index of the frame that is the first center.
+       (Default = 0)
+
+    num_threads : int, optional
+        Number of OpenMP threads for the RMSD calculations.
+       (Default = None)
+
+    Returns
+    -------
+
+    center_idxs : arraylike of int of shape (n_clusters,)
+        The indices of the frames that are the cluster centers. If
+        there are fewer distinct frames than clusters there are only
+        as many centers as distinct frames.
+
+    labels : arraylike of int of shape (n_frames,)
+        The cluster of each frame, as an index into `center_idxs`.
+
+    distances : arraylike of float of shape (n_frames,)
+        The RMSD of each frame to its cluster center.
+
+    """
+
+    frame_distances = _FrameDistances(coords, idxs=idxs, weights=weights,
+                                      num_threads=num_threads)
+
+    return _kcenters(frame_distances, n_clusters, first_center)
+
+def _kcenters(frame_distances, n_clusters, first_center):
+
+    n_frames = frame_distances.n_frames
+
+    assert 0 < n_clusters <= n_frames, \
+        "The number of clusters must be between 1 and the number of frames"
+
+    center_idxs = [first_center]
+    labels = np.zeros((n_frames,), dtype=np.intp)
+    distances = frame_distances.rmsds(first_center, np.arange(n_frames))
+    distances[first_center] = 0.0
+
+    for center_i in range(1, n_clusters):
+
+        new_center_idx = int(np.argmax(distances))
+
+        # every frame is at an RMSD of 0 from a center, there are
+        # fewer distinct frames than clusters
+        if distances[new_center_idx] == 0.0:
+            break
+
+        # distances from the new center to the existing ones
+        center_distances = frame_distances.rmsds(new_center_idx, center_idxs)
+
+        # d(i, new) >= d(new, a) - d(i, a) >= d(i, a) so only frames
+        # with d(i, a) > d(new, a) / 2 can change
+        candidates = np.flatnonzero(distances > 0.5 * center_distances[labels])
+
+        candidates = candidates[
+            frame_distances.lower_bounds(new_center_idx, candidates) <
+            distances[candidates]]
+
+        rmsds = frame_distances.rmsds(new_center_idx, candidates)
+
+        closer = rmsds < distances[candidates]
+        labels[candidates[closer]] = center_i
+        distances[candidates[closer]] = rmsds[closer]
+
+        # the center itself, in case of ties
+        labels[new_center_idx] = center_i
+        distances[new_center_idx] = 0.0
+
+        center_idxs.append(new_center_idx)
+
+    return np.array(center_idxs), labels, distances
+
+def kmedoids(coords, n_clusters, idxs=None, weights=None, max_iterations=100,
+             n_medoid_candidates=100, block_size=256, random_state=None,
+             num_threads=None):
+    """Cluster frames with the k-medoids algorithm using the RMSD after
+    optimal superposition as the distance.
+
+    The medoids are initialized with `kcenters`. Then the frames are
+    alternately assigned to their closest medoid and each medoid is
+    replaced by the member of its cluster with the smallest total
+    distance to the other members, until the medoids do not change.
+
+    In the assignment step the triangle inequality with the
+    distances between the medoids (as in Elkan's k-means) and the
+    radius of gyration bound avoid most distance evaluations, so no
+    pairwise matrix over all frames is needed.
+
+    In the update step each candidate medoid of a cluster with
+    members C costs up to |C| RMSD evaluations, so considering every
+    member would cost |C|**2 per cluster (about N**2/k per iteration).
+    Therefore only `n_medoid_candidates` members are considered, which
+    bounds the cost to n_medoid_candidates*N per iteration. Lower
+    bounds from the triangle inequality through the current medoid
+    and the radii of gyration skip candidates that can not improve on
+    the best one, and the sum of a candidate is computed in blocks and
+    stopped once it can no longer be better.
+
+    Parameters
+    ----------
+
+    coords : arraylike of shape (n_frames, n_atoms, 3)
+        The frames to cluster.
+
+    n_clusters : int
+        The number of clusters.
+
+    idxs : arraylike of int, optional
+        Indices of the atoms that are used for the alignment and RMSD.
+       (Default = None)
+
+    weights : arraylike, optional
+        Weights of the aligned coordinates (e.g. masses).
+       (Default = None)
+
+    max_iterations : int, optional
+        Maximum number of assignment and update steps.
+       (Default = 100)
+
+    n_medoid_candidates : int or None, optional
+        Only this many randomly chosen members of each cluster (and the
+        current medoid) are considered as the new medoid, which bounds
+        the cost of the update step for large clusters. If None all
+        members are considered, which is exact but quadratic in the
+        cluster sizes.
+       (Default = 100)
+
+    block_size : int, optional
+        The number of members the distances of a candidate are computed
+        for at a time before checking whether it can still be better
+        than the best one.
+       (Default = 256)
+
+    random_state : int or numpy.random.Generator, optional
+        Seed for choosing the medoid candidates.
+       (Default = None)
+
+    num_threads : int, optional
+        Number of OpenMP threads for the RMSD calculations.
+       (Default = None)
+
+    Returns
+    -------
+
+    medoid_idxs : arraylike of int of shape (n_clusters,)
+        The indices of the frames that are the medoids. If there are
+        fewer distinct frames than clusters there are only as many
+        medoids as distinct frames.
+
+    labels : arraylike of int of shape (n_frames,)
+        The cluster of each frame, as an index into `medoid_idxs`.
+
+    distances : arraylike of float of shape (n_frames,)
+        The RMSD of each frame to its medoid.
+
+    """
+
+    rng = np.random.default_rng(random_state)
+
+    frame_distances = _FrameDistances(coords, idxs=idxs, weights=weights,
+                                      num_threads=num_threads)
+
+    medoid_idxs, labels, distances = _kcenters(frame_distances, n_clusters, 0)
+
+    for _ in range(max_iterations):
+
+        # update step
+        new_medoid_idxs = medoid_idxs.copy()
+        for cluster_i in range(medoid_idxs.shape[0]):
+
+            members = np.flatnonzero(labels == cluster_i)
+
+            if (n_medoid_candidates is not None and
+                members.shape[0] > n_medoid_candidates):
+                candidates = rng.choice(members, size=n_medoid_candidates,
+                                        replace=False)
+                candidates = np.union1d(candidates, [medoid_idxs[cluster_i]])
+            else:
+                candidates = members
+
+            # the current medoid's cost is known already
+            best_idx = medoid_idxs[cluster_i]
+            best_cost = distances[members].sum()
+
+            # lower bounds on the distances from each candidate to the
+            # members, by the triangle inequality through the current
+            # medoid and from the radii of gyration
+            member_distances = distances[members]
+            bounds = [np.maximum(np.abs(distances[candidate_idx] - member_distances),
+                                 frame_distances.lower_bounds(candidate_idx, members))
+                      for candidate_idx in candidates]
+
+            # the most promising candidates first
+            for candidate_i in np.argsort([bound.sum() for bound in bounds]):
+                candidate_idx = candidates[candidate_i]
+                if candidate_idx == best_idx:
+                    continue
+
+                # the remaining bound is the sum of the bounds of the
+                # members not computed yet
+                remaining = np.cumsum(bounds[candidate_i][::-1])[::-1]
+                if remaining[0] >= best_cost:
+                    continue
+
+                cost = 0.0
+                for start in range(0, members.shape[0], block_size):
+                    stop = min(start + block_size, members.shape[0])
+                    cost += frame_distances.rmsds(candidate_idx, members[start:stop]).sum()
+
+                    # can't be better than the best one
+                    if stop < members.shape[0] and cost + remaining[stop] >= best_cost:
+                        break
+                else:
+                    if cost < best_cost:
+                        best_idx, best_cost = candidate_idx, cost
+
+            new_medoid_idxs[cluster_i] = best_idx
+
+        if np.array_equal(new_medoid_idxs, medoid_idxs):
+            break
+
+        medoid_idxs = new_medoid_idxs
+
+        # exact distances to the (possibly moved) medoid of each
+        # frame's current cluster, then reassign
+        for cluster_i, medoid_idx in enumerate(medoid_idxs):
+            members = np.flatnonzero(labels == cluster_i)
+            distances[members] = frame_distances.rmsds(medoid_idx, members)
+            distances[medoid_idx] = 0.0
+
+        _assign(frame_distances, medoid_idxs, labels, distances)
+
+    return medoid_idxs, labels, distances
+
+def assign_nearest(coords, ref_coords, idxs=None, weights=None,
+                   ref_distances=True, num_threads=None):
+    """Assign each frame to the reference (e.g. cluster center) with
+    the smallest RMSD after optimal superposition.
+
+    The references are centered and have their inner products
+    computed once. For each frame the references are visited in order
+    of their radius of gyration difference to the frame, which is a
+    lower bound on the RMSD, so the search stops once this bound is
+    larger than the best RMSD found. If `ref_distances` is True the
+    RMSDs between the references are computed up front and references
+    that can not be closer than the best one so far by the triangle
+    inequality are skipped as well. The frames are split over threads.
+
+    Parameters
+    ----------
+
+    coords : arraylike of shape (n_frames, n_atoms, 3)
+        The frames to assign.
+
+    ref_coords : arraylike of shape (n_refs, n_atoms, 3)
+        The reference structures.
+
+    idxs : arraylike of int, optional
+        Indices of the atoms that are used for the alignment and RMSD.
+       (Default = None)
+
+    weights : arraylike, optional
+        Weights of the aligned coordinates (e.g. masses).
+       (Default = None)
+
+    ref_distances : bool or arraylike of shape (n_refs, n_refs), optional
+        Whether to use the RMSDs between the references for pruning,
+        which costs n_refs*(n_refs-1)/2 RMSD calculations up front.
+        The matrix can also be given directly if it is already known.
+       (Default = True)
+
+    num_threads : int, optional
+        Number of OpenMP threads.
+       (Default = None)
+
+    Returns
+    -------
+
+    labels : arraylike of int of shape (n_frames,)
+        The index of the closest reference for each frame.
+
+    distances : arraylike of float of shape (n_frames,)
+        The RMSD of each frame to its closest reference.
+
+    """
+
+    assert len(coords.shape) == 3, \
+        "coords should be a rank 3 array of shape (n_frames, n_atoms, 3)"
+    assert len(ref_coords.shape) == 3, \
+        "ref_coords should be a rank 3 array of shape (n_refs, n_atoms, 3)"
+    assert coords.shape[1:] == ref_coords.shape[1:], \
+        "Number of coordinates are not the same"
+    assert coords.shape[2] == 3, "coordinates are not of 3 dimensions"
+    assert ref_coords.shape[0] > 0, "No references given"
+
+    if weights is not None:
+        weights = np.ascontiguousarray(weights, dtype=np.float64)
+
+    # the references are centered once and sorted by their radius of
+    # gyration
+    centered_refs, ref_Gs = _centered_frames(ref_coords, idxs=idxs,
+                                             weights=weights)
+    n_coords = centered_refs.shape[1]
+
+    if weights is not None:
+        assert weights.shape[0] == n_coords, \
+            "Number of weights given does not match the number of coordinates"
+
+    ref_rgs = np.sqrt(ref_Gs / n_coords)
+    order = np.argsort(ref_rgs, kind='stable')
+
+    centered_refs = np.ascontiguousarray(centered_refs[order], dtype=np.float64)
+    ref_Gs = np.ascontiguousarray(ref_Gs[order])
+    ref_rgs = np.ascontiguousarray(ref_rgs[order])
+
+    if ref_distances is True:
+        ref_distances = pairwise_rmsd(centered_refs, weights=weights,
+                                      condensed=False, num_threads=num_threads)
+    elif ref_distances is False or ref_distances is None:
+        ref_distances = np.zeros((0, 0))
+    else:
+        ref_distances = np.asarray(ref_distances, dtype=np.float64)
+        assert ref_distances.shape == (order.shape[0], order.shape[0]), \
+            "ref_distances should be of shape (n_refs, n_refs)"
+        ref_distances = np.ascontiguousarray(ref_distances[np.ix_(order, order)])
+
+    if idxs is not None:
+        coords = coords[:, idxs]
+
+    coords = np.ascontiguousarray(coords, dtype=_coords_dtype(coords))
+
+    n_frames = coords.shape[0]
+    labels = np.empty((n_frames,), dtype=np.intp)
+    distances = np.empty((n_frames,), dtype=np.float64)
+    n_evaluations = np.empty((n_frames,), dtype=np.intp)
+
+    if num_threads is None:
+        num_threads = 0
+
+    AssignNearestBatch(coords, centered_refs, ref_Gs, ref_rgs, ref_distances,
+                       n_coords, labels, distances, n_evaluations, weights,
+                       num_threads=num_threads)
+
+    # back to the order the references were given in
+    labels = order[labels]
+
+    return labels, distances
@@ -0,0 +1,330 @@
+"""Contacts between groups of atoms (e.g. residues) and their
+(weighted) frequencies over trajectories.
+
+Atoms within a cutoff of each other are found with a neighbor search (see
+`geomm.neighbors`) and reduced to contacts between the groups they
+belong to. The frequencies are accumulated into a sparse matrix over
+the groups as frames stream through, so no dense per frame distance
+matrices are ever built.
+
+"""
+
+import numpy as np
+import scipy.sparse
+
+from geomm.neighbors import neighbor_pairs
+
+def group_index_array(groups_idxs, n_atoms):
+    """Convert a collection of the atom indices of each group (as used
+    in `geomm.grouping`) to an array of the group index of each atom.
+
+    Parameters
+    ----------
+
+    groups_idxs : list of arraylike of int
+        The atom indices of each group.
+
+    n_atoms : int
+        The total number of atoms.
+
+    Returns
+    -------
+
+    group_idxs : arraylike of int of shape (n_atoms,)
+        The group index of each atom, -1 for atoms not in a group.
+
+    """
+
+    group_idxs = np.full((n_atoms,), -1, dtype=np.intp)
+
+    for group_idx, idxs in enumerate(groups_idxs):
+        assert np.all(group_idxs[idxs] == -1), \
+            "An atom can only be in one group"
+        group_idxs[idxs] = group_idx
+
+    return group_idxs
+
+def contact_pairs(coords, group_idxs, cutoff, unitcell_side_lengths=None,
+                  box_vectors=None):
+    """The pairs of groups with any atoms within a cutoff of each other
+    in a single frame.
+
+    Parameters
+    ----------
+
+    coords : arraylike of shape (n_atoms, 3)
+        The coordinates of the frame.
+
+    group_idxs : arraylike of int of shape (n_atoms,)
+        The group index of each atom, atoms with a negative index are
+        ignored. See `group_index_array`.
+
+    cutoff : float
+        The distance between atoms for a contact.
+
+    unitcell_side_lengths : arraylike of shape (3,), optional
+        The lengths of the sides of a rectangular unitcell, for
+        minimum image distances.
+       (Default = None)
+
+    box_vectors : arraylike of shape (3, 3), optional
+        The box vectors (as rows) of a triclinic unitcell.
+       (Default = None)
+
+    Returns
+    -------
+
+    pairs : arraylike of int of shape (n_contacts, 2)
+        The unique pairs of groups (i < j) in contact, contacts within
+        a group are not included.
+
+    """
+
+    assert len(coords.shape) == 2 and coords.shape[1] == 3, \
+        "coords should be of shape (n_atoms, 3)"
+
+    group_idxs = np.asarray(group_idxs)
+    assert group_idxs.shape == (coords.shape[0],), \
+        "There should be a group index for each atom"
+
+    # only the atoms in groups
+    atom_idxs = np.flatnonzero(group_idxs >= 0)
+    coords = np.asarray(coords, dtype=np.float64)[atom_idxs]
+    atom_groups = group_idxs[atom_idxs]
+
+    if atom_idxs.shape[0] == 0:
+        return np.zeros((0, 2), dtype=np.intp)
+
+    atom_pairs, _ = neighbor_pairs(coords, cutoff,
+                                   unitcell_side_lengths=unitcell_side_lengths,
+                                   box_vectors=box_vectors)
+
+    # each pair of groups once, ordered
+    group_i = np.minimum(atom_groups[atom_pairs[:, 0]], atom_groups[atom_pairs[:, 1]])
+    group_j = np.maximum(atom_groups[atom_pairs[:, 0]], atom_groups[atom_pairs[:, 1]])
+
+    between = group_i < group_j
+    n_groups = atom_groups.max() + 1
+    flat_pairs = np.unique(group_i[between] * n_groups + group_j[between])
+
+    return np.stack([flat_pairs // n_groups, flat_pairs % n_groups], axis=1)
+
+class ContactFrequencies(object):
+    """Accumulates the (weighted) frequencies of contacts between
+    groups of atoms over frames.
+
+    A pair of groups is in contact in a frame if any of their atoms
+    are within the cutoff of each other. The weight of each frame
+    (e.g. the weight of a walker in a weighted ensemble simulation) is
+    added for each of the contacts in it. The contacts are collected
+    in coordinate (COO) form and summed into a CSR matrix every
+    `buffer_size` contacts.
+
+    Parameters
+    ----------
+
+    group_idxs : arraylike of int of shape (n_atoms,)
+        The group index of each atom, atoms with a negative index are
+        ignored. See `group_index_array`.
+
+    cutoff : float
+        The distance between atoms for a contact.
+
+    unitcell_side_lengths : arraylike of shape (3,), optional
+        The lengths of the sides of a rectangular unitcell for all
+        frames, can also be given for each frame.
+       (Default = None)
+
+    box_vectors : arraylike of shape (3, 3), optional
+        The box vectors (as rows) of a triclinic unitcell for all
+        frames, can also be given for each frame.
+       (Default = None)
+
+    buffer_size : int, optional
+        The number of contacts to collect before summing them into the
+        sparse matrix.
+       (Default = 2**20)
+
+    Attributes
+    ----------
+
+    n_groups : int
+        The number of groups.
+
+    total_weight : float
+        The sum of the weights of all the frames added.
+
+    n_frames : int
+        The number of frames added.
+
+    """
+
+    def __init__(self, group_idxs, cutoff, unitcell_side_lengths=None,
+                 box_vectors=None, buffer_size=2**20):
+
+        self.group_idxs = np.asarray(group_idxs, dtype=np.intp)
+        self.n_groups = int(self.group_idxs.max()) + 1
+        self.cutoff = cutoff
+        self.unitcell_side_lengths = unitcell_side_lengths
+        self.box_vectors = box_vectors
+        self.buffer_size = buffer_size
+
+        self.total_weight = 0.0
+        self.n_frames = 0
+
+        self._counts = scipy.sparse.csr_matrix((self.n_groups, self.n_groups),
+                                               dtype=np.float64)
+        self._pairs = []
+        self._weights = []
+        self._n_buffered = 0
+
+    def add_frame(self, coords, weight=1.0, unitcell_side_lengths=None,
+                  box_vectors=None):
+        """Add the contacts of a single frame.
+
+        Parameters
+        ----------
+
+        coords : arraylike of shape (n_atoms, 3)
+            The coordinates of the frame.
+
+        weight : float, optional
+            The weight of the frame.
+           (Default = 1.0)
+
+        unitcell_side_lengths : arraylike of shape (3,), optional
+            The unitcell of this frame, if not given the one given on
+            construction is used.
+           (Default = None)
+
+        box_vectors : arraylike of shape (3, 3), optional
+            The unitcell of this frame, if not given the one given on
+            construction is used.
+           (Default = None)
+
+        """
+
+        if unitcell_side_lengths is None and box_vectors is None:
+            unitcell_side_lengths = self.unitcell_side_lengths
+            box_vectors = self.box_vectors
+
+        pairs = contact_pairs(coords, self.group_idxs, self.cutoff,
+                              unitcell_side_lengths=unitcell_side_lengths,
+                              box_vectors=box_vectors)
+
+        self._pairs.append(pairs)
+        self._weights.append(np.full((pairs.shape[0],), weight, dtype=np.float64))
+        self._n_buffered += pairs.shape[0]
+
+        self.total_weight += weight
+        self.n_frames += 1
+
+        if self._n_buffered >= self.buffer_size:
+            self._flush()
+
+    def add_frames(self, coords, weights=None, unitcell_side_lengths=None,
+                   box_vectors=None):
+        """Add the contacts of a stack of frames.
+
+        Parameters
+        ----------
+
+        coords : arraylike of shape (n_frames, n_atoms, 3)
+            The frames.
+
+        weights : arraylike of shape (n_frames,), optional
+            The weight of each frame, if None each has a weight of 1.
+           (Default = None)
+
+        unitcell_side_lengths : arraylike of shape (n_frames, 3), optional
+            The unitcell of each frame.
+           (Default = None)
+
+        box_vectors : arraylike of shape (n_frames, 3, 3), optional
+            The unitcell of each frame.
+           (Default = None)
+
+        """
+
+        n_frames = coords.shape[0]
+
+        if weights is None:
+            weights = np.ones((n_frames,))
+
+        assert len(weights) == n_frames, \
+            "There should be a weight for each frame"
+
+        for frame_idx in range(n_frames):
+            self.add_frame(coords[frame_idx], weight=weights[frame_idx],
+                           unitcell_side_lengths=(None if unitcell_side_lengths is None
+                                                  else unitcell_side_lengths[frame_idx]),
+                           box_vectors=(None if box_vectors is None
+                                        else box_vectors[frame_idx]))
+
+    def _flush(self):
+        """Sum the buffered contacts into the sparse matrix."""
+
+        if self._n_buffered == 0:
+            return
+
+        pairs = np.concatenate(self._pairs)
+        weights = np.concatenate(self._weights)
+
+        # duplicates are summed in the conversion
+        self._counts = self._counts + scipy.sparse.coo_matrix(
+            (weights, (pairs[:, 0], pairs[:, 1])),
+            shape=(self.n_groups, self.n_groups)).tocsr()
+
+        self._pairs = []
+        self._weights = []
+        self._n_buffered = 0
+
+    def counts(self, symmetric=True):
+        """The summed weights of the frames each pair of groups is in
+        contact in.
+
+        Parameters
+        ----------
+
+        symmetric : bool, optional
+            If False only the upper triangle (i < j) is given.
+           (Default = True)
+
+        Returns
+        -------
+
+        counts : scipy.sparse.csr_matrix of shape (n_groups, n_groups)
+
+        """
+
+        self._flush()
+
+        if symmetric:
+            return (self._counts + self._counts.T).tocsr()
+
+        return self._counts.copy()
+
+    def frequencies(self, symmetric=True):
+        """The weighted fraction of frames each pair of groups is in
+        contact in, i.e. the counts divided by the total weight.
+
+        Parameters
+        ----------
+
+        symmetric : bool, optional
+            If False only the upper triangle (i < j) is given.
+           (Default = True)
+
+        Returns
+        -------
+
+        frequencies : scipy.sparse.csr_matrix of shape (n_groups, n_groups)
+
+        """
+
+        counts = self.counts(symmetric=symmetric)
+
+        if self.total_weight > 0:
+            counts = counts / self.total_weight
+
+        return scipy.sparse.csr_matrix(counts)
@@ -2,13 +2,187 @@ import numpy as np
 import scipy.spatial.distance as dist
 from scipy.spatial import KDTree
 
-def distance():
-    return None
+from geomm._distance import PairDistances
+from geomm.neighbors import periodic_minimum_distance, CellList, minimum_image
+
+def atom_pairs(idxs_a, idxs_b=None):
+    """The pairs of atom indices for the distances between two
+    selections of atoms, or within one selection.
+
+    Parameters
+    ----------
+
+    idxs_a : arraylike of int
+        The first selection of atoms.
+
+    idxs_b : arraylike of int, optional
+        The second selection of atoms. If None, the unique pairs
+        (i < j in the order of `idxs_a`) within `idxs_a` are given.
+       (Default = None)
+
+    Returns
+    -------
+
+    pairs : arraylike of int of shape (n_pairs, 2)
+        For two selections all the pairs in row-major order, so that
+        the distances of `distance` can be reshaped to
+        (..., len(idxs_a), len(idxs_b)).
+
+    """
+
+    idxs_a = np.asarray(idxs_a, dtype=np.intp)
+
+    if idxs_b is None:
+        i, j = np.triu_indices(idxs_a.shape[0], k=1)
+        return np.stack([idxs_a[i], idxs_a[j]], axis=1)
+
+    idxs_b = np.asarray(idxs_b, dtype=np.intp)
+
+    return np.stack([np.repeat(idxs_a, idxs_b.shape[0]),
+                     np.tile(idxs_b, idxs_a.shape[0])], axis=1)
+
+def distance(coords, pairs=None, unitcell_side_lengths=None, out=None,
+             filename=None, block_size=2**20, num_threads=None):
+    """Calculate the distances between pairs of atoms, for a single
+    frame or a stack of frames.
+
+    The distances are computed by a compiled kernel in blocks of
+    frames and written directly into the output, which can be a
+    memory-mapped array so that the (n_frames, n_pairs) array never
+    has to be held in memory.
+
+    Parameters
+    ----------
+
+    coords : arraylike of shape (n_atoms, 3) or (n_frames, n_atoms, 3)
+        The coordinates of the frame or frames.
+
+    pairs : arraylike of int of shape (n_pairs, 2), optional
+        The indices of the atoms of each pair, see `atom_pairs` for
+        the pairs between or within selections. If None, all unique
+        pairs of atoms.
+       (Default = None)
+
+    unitcell_side_lengths : arraylike of shape (3,) or (n_frames, 3), optional
+        The lengths of the sides of a rectangular unitcell, for all
+        frames or for each frame. If given the minimum image distances
+        are computed.
+       (Default = None)
+
+    out : arraylike, optional
+        A preallocated array of shape (n_pairs,) for a single frame or
+        (n_frames, n_pairs) to write the distances into.
+       (Default = None)
+
+    filename : str, optional
+        If given the output is created as a memory-mapped float64
+        '.npy' file at this path. Exclusive with `out`.
+       (Default = None)
+
+    block_size : int, optional
+        The number of distances (frames times pairs) that are computed
+        at a time, only matters when `out` is not float64 and the
+        blocks go through a buffer.
+       (Default = 2**20)
+
+    num_threads : int, optional
+        Number of OpenMP threads to use, if None the OpenMP default is
+        used.
+       (Default = None)
+
+    Returns
+    -------
+
+    distances : arraylike of shape (n_pairs,) or (n_frames, n_pairs)
+        The distances, this is `out` or the memory-mapped array if
+        either was given.
+
+    """
+
+    single_frame = len(coords.shape) == 2
+    if single_frame:
+        coords = coords[np.newaxis]
 
-def minimum_distance(coordsA, coordsB):
+    assert len(coords.shape) == 3 and coords.shape[2] == 3, \
+        "coords should be of shape (n_atoms, 3) or (n_frames, n_atoms, 3)"
+    assert not (out is not None and filename is not None), \
+        "Only one of out or filename can be given"
+    assert block_size > 0, "block_size must be positive"
+
+    n_frames, n_atoms = coords.shape[:2]
+
+    # single precision coordinates are not upcast
+    if coords.dtype == np.float32:
+        coords = np.ascontiguousarray(coords)
+    else:
+        coords = np.ascontiguousarray(coords, dtype=np.float64)
+
+    if pairs is None:
+        pairs = atom_pairs(np.arange(n_atoms))
+
+    pairs = np.ascontiguousarray(np.reshape(pairs, (-1, 2)), dtype=np.intp)
+    n_pairs = pairs.shape[0]
+
+    assert np.all((pairs >= 0) & (pairs < n_atoms)), \
+        "Pair indices are out of range"
+
+    if unitcell_side_lengths is not None:
+        unitcell_side_lengths = np.asarray(unitcell_side_lengths, dtype=np.float64)
+        unitcell_side_lengths = np.ascontiguousarray(
+            np.broadcast_to(unitcell_side_lengths.reshape((-1, 3)), (n_frames, 3)))
+
+    out_shape = (n_pairs,) if single_frame else (n_frames, n_pairs)
+
+    if filename is not None:
+        out = np.lib.format.open_memmap(filename, mode='w+',
+                                        dtype=np.float64, shape=out_shape)
+    elif out is None:
+        out = np.empty(out_shape, dtype=np.float64)
+
+    assert out.shape == out_shape, \
+        "out should be of shape {}".format(out_shape)
+
+    out_frames = out[np.newaxis] if single_frame else out
+
+    if num_threads is None:
+        num_threads = 0
+
+    if out.dtype == np.float64:
+        PairDistances(coords, pairs, unitcell_side_lengths, out_frames,
+                      num_threads=num_threads)
+
+        return out
+
+    # otherwise go through a float64 buffer a block of frames at a time
+    n_block_frames = max(1, block_size // max(1, n_pairs))
+    buffer = np.empty((min(n_block_frames, n_frames), n_pairs), dtype=np.float64)
+
+    for start in range(0, n_frames, n_block_frames):
+        stop = min(start + n_block_frames, n_frames)
+        block = buffer[:stop - start]
+
+        if unitcell_side_lengths is not None:
+            block_lengths = unitcell_side_lengths[start:stop]
+        else:
+            block_lengths = None
+
+        PairDistances(coords[start:stop], pairs, block_lengths, block,
+                      num_threads=num_threads)
+
+        out_frames[start:stop] = block
+
+    return out
+
+def minimum_distance(coordsA, coordsB, unitcell_side_lengths=None,
+                     box_vectors=None, cutoff=None):
     """Calculate the minimum distance between members of coordsA and coordsB.
     Uses a fast binary search algorithm of order N*log(N).
 
+    If a periodic unitcell is given the minimum image distance is
+    computed using a cell list instead (see
+    `geomm.neighbors.periodic_minimum_distance`), so the coordinates do
+    not have to be grouped into the same image beforehand.
+
     Parameters
     ----------
 
@@ -18,11 +192,351 @@ def minimum_distance(coordsA, coordsB):
     coordsB : arraylike, shape (Natoms_B, 3)
         Second set of coordinates.
 
+    unitcell_side_lengths : arraylike of shape (3,), optional
+        The lengths of the sides of a rectangular unitcell.
+       (Default = None)
+
+    box_vectors : arraylike of shape (3, 3), optional
+        The box vectors (as rows) of a triclinic unitcell.
+       (Default = None)
+
+    cutoff : float, optional
+        Only search for distances up to the cutoff (inclusive), if
+        there are none inf is returned.
+       (Default = None)
+
     """
 
     # make sure the number of dimensions is 3
     assert (coordsA.shape[1] == 3) and (coordsB.shape[1] == 3), \
         "Minimum distance expecting arrays of shape (N, 3)"
 
+    if unitcell_side_lengths is not None or box_vectors is not None:
+        return periodic_minimum_distance(coordsA, coordsB,
+                                         unitcell_side_lengths=unitcell_side_lengths,
+                                         box_vectors=box_vectors, cutoff=cutoff)
+
     tree = KDTree(coordsA)
+
+    if cutoff is not None:
+        # the upper bound of the tree is strict, while the cell list
+        # includes pairs at exactly the cutoff
+        return(tree.query(coordsB,
+                          distance_upper_bound=np.nextafter(cutoff, np.inf))[0].min())
+
     return(tree.query(coordsB)[0].min())
+
+def _first_within(tree, small_coords, large_coords, large_positions, nearest, bound,
+                  cutoff):
+    """The first pair within the cutoff among the candidates from a
+    tree built with earlier positions of the small selection, as
+    (small, large) positions, or None."""
+
+    # the nearest atoms at the tree positions are usually the nearest
+    # ones now too
+    distances = np.linalg.norm(large_coords[large_positions] - small_coords[nearest], axis=1)
+    within = np.flatnonzero(distances <= cutoff)
+    if within.shape[0] > 0:
+        return nearest[within[0]], large_positions[within[0]]
+
+    # otherwise check all the atoms of the tree within the bound
+    for large_pos, neighbors in zip(large_positions,
+                                    tree.query_ball_point(large_coords[large_positions],
+                                                          bound)):
+        neighbors = np.asarray(neighbors, dtype=np.intp)
+        distances = np.linalg.norm(small_coords[neighbors] - large_coords[large_pos], axis=1)
+        within = np.flatnonzero(distances <= cutoff)
+        if within.shape[0] > 0:
+            return neighbors[within[0]], large_pos
+
+    return None
+
+def _closest_pair(tree, small_coords, large_coords, displacement, cutoff):
+    """The distance and (small, large) positions of the closest pair,
+    from a tree built with positions of the small selection at most
+    `displacement` from the current ones, or None if there is no pair
+    within the cutoff."""
+
+    bound = np.inf if cutoff is None else np.nextafter(cutoff + displacement, np.inf)
+    tree_distances, nearest = tree.query(large_coords, distance_upper_bound=bound)
+
+    found = np.flatnonzero(nearest < small_coords.shape[0])
+    if found.shape[0] == 0:
+        return None
+
+    if displacement == 0.0:
+        closest = found[np.argmin(tree_distances[found])]
+        return tree_distances[closest], nearest[closest], closest
+
+    # the current distances to the nearest atoms at the tree positions
+    # bound the minimum distance from above
+    upper = np.linalg.norm(large_coords[found] - small_coords[nearest[found]], axis=1).min()
+    if cutoff is not None:
+        upper = min(upper, cutoff)
+
+    # any pair at most that far apart now is within this radius at the
+    # tree positions, only those are checked exactly
+    radius = np.nextafter(upper + displacement, np.inf)
+    candidates = found[tree_distances[found] <= radius]
+    neighbors = tree.query_ball_point(large_coords[candidates], radius)
+
+    small_pos = np.concatenate([np.asarray(n, dtype=np.intp) for n in neighbors])
+    large_pos = np.repeat(candidates, [len(n) for n in neighbors])
+    if small_pos.shape[0] == 0:
+        return None
+
+    distances = np.linalg.norm(large_coords[large_pos] - small_coords[small_pos], axis=1)
+    closest = np.argmin(distances)
+    if cutoff is not None and distances[closest] > cutoff:
+        return None
+
+    return distances[closest], small_pos[closest], large_pos[closest]
+
+def minimum_distance_trajectory(coords, idxs_a, idxs_b, unitcell_side_lengths=None,
+                                box_vectors=None, cutoff=None, below_cutoff=False,
+                                return_pairs=False, block_size=1024, skin=None):
+    """Calculate the minimum distance between two selections of atoms
+    for each frame of a trajectory.
+
+    A search tree (or a cell list for periodic unitcells) is built for
+    the smaller selection only and queried with the atoms of the
+    larger one.
+
+    With `below_cutoff` only whether any pair is within the cutoff is
+    determined, which is usually much cheaper:
+
+    - the closest pair of the previous frame is checked first, for
+      consecutive frames it is likely still within the cutoff,
+    - without a periodic unitcell, only the atoms of the larger
+      selection within the cutoff of the bounding box of the smaller
+      one are queried, if there are none the frame is done,
+    - the atoms are queried in blocks and the search of a frame stops
+      at the first block with a pair within the cutoff.
+
+    Without a periodic unitcell the tree is reused for the following
+    frames, in both modes, until an atom of the smaller selection has
+    moved more than `skin` from where the tree was built. The tree is
+    queried with the bounds widened by that displacement and only the
+    candidate pairs it gives are checked exactly. With a periodic
+    unitcell a new cell list is built for every frame. Pairs at
+    exactly the cutoff are within it, with and without a periodic
+    unitcell.
+
+    Parameters
+    ----------
+
+    coords : arraylike of shape (n_frames, n_atoms, 3)
+        The trajectory.
+
+    idxs_a : arraylike of int
+        The indices of the atoms of the first selection.
+
+    idxs_b : arraylike of int
+        The indices of the atoms of the second selection.
+
+    unitcell_side_lengths : arraylike of shape (3,) or (n_frames, 3), optional
+        The lengths of the sides of a rectangular unitcell, for all
+        frames or each frame.
+       (Default = None)
+
+    box_vectors : arraylike of shape (3, 3) or (n_frames, 3, 3), optional
+        The box vectors (as rows) of a triclinic unitcell, for all
+        frames or each frame.
+       (Default = None)
+
+    cutoff : float, optional
+        Only search for distances up to the cutoff, frames without a
+        pair within it get a distance of inf. Required for
+        `below_cutoff`.
+       (Default = None)
+
+    below_cutoff : bool, optional
+        Return whether any pair is within the cutoff for each frame
+        instead of the minimum distances.
+       (Default = False)
+
+    return_pairs : bool, optional
+        Also return the atom indices of the closest pair of each frame
+        (for `below_cutoff` the pair found within the cutoff), -1 for
+        frames without a pair within the cutoff.
+       (Default = False)
+
+    block_size : int, optional
+        The number of atoms queried at a time for `below_cutoff`.
+       (Default = 1024)
+
+    skin : float, optional
+        How far the atoms of the smaller selection can move before the
+        tree is rebuilt, if None half the cutoff for `below_cutoff`
+        and otherwise half the minimum distance of the frame the tree
+        was built for.
+       (Default = None)
+
+    Returns
+    -------
+
+    min_distances : arraylike of shape (n_frames,)
+        The minimum distances, or booleans for `below_cutoff`.
+
+    pairs : arraylike of int of shape (n_frames, 2)
+        The atom indices (in the selections a and b order) of the
+        closest pairs, only if `return_pairs` is True.
+
+    """
+
+    assert len(coords.shape) == 3 and coords.shape[2] == 3, \
+        "coords should be a rank 3 array of shape (n_frames, n_atoms, 3)"
+    assert not (below_cutoff and cutoff is None), \
+        "A cutoff is needed for below_cutoff"
+    assert unitcell_side_lengths is None or box_vectors is None, \
+        "Only one of unitcell_side_lengths or box_vectors can be given"
+
+    n_frames = coords.shape[0]
+
+    idxs_a = np.asarray(idxs_a, dtype=np.intp)
+    idxs_b = np.asarray(idxs_b, dtype=np.intp)
+
+    # the tree is built for the smaller selection
+    swapped = idxs_a.shape[0] > idxs_b.shape[0]
+    if swapped:
+        small_idxs, large_idxs = idxs_b, idxs_a
+    else:
+        small_idxs, large_idxs = idxs_a, idxs_b
+
+    # the box vectors of each frame
+    boxes = None
+    if unitcell_side_lengths is not None:
+        lengths = np.broadcast_to(np.asarray(unitcell_side_lengths, dtype=np.float64),
+                                  (n_frames, 3))
+        boxes = lengths[:, :, np.newaxis] * np.eye(3)
+    elif box_vectors is not None:
+        boxes = np.broadcast_to(np.asarray(box_vectors, dtype=np.float64),
+                                (n_frames, 3, 3))
+
+    if below_cutoff:
+        results = np.zeros((n_frames,), dtype=bool)
+    else:
+        results = np.full((n_frames,), np.inf)
+
+    # pairs as (small, large) positions in the selections
+    pairs = np.full((n_frames, 2), -1, dtype=np.intp)
+
+    if below_cutoff and skin is None:
+        skin = 0.5 * cutoff
+
+    tree = None
+    tree_coords = None
+    tree_skin = skin
+
+    for frame_idx in range(n_frames):
+        small_coords = coords[frame_idx, small_idxs]
+        large_coords = coords[frame_idx, large_idxs]
+
+        if below_cutoff:
+
+            # the closest pair of the previous frame
+            if frame_idx > 0 and pairs[frame_idx - 1, 0] >= 0:
+                small_pos, large_pos = pairs[frame_idx - 1]
+                diff = large_coords[large_pos] - small_coords[small_pos]
+                if boxes is not None:
+                    diff = minimum_image(diff, box_vectors=boxes[frame_idx])
+
+                if np.linalg.norm(diff) <= cutoff:
+                    results[frame_idx] = True
+                    pairs[frame_idx] = pairs[frame_idx - 1]
+                    continue
+
+            if boxes is None:
+                # only the atoms near the smaller selection
+                lower = small_coords.min(axis=0) - cutoff
+                upper = small_coords.max(axis=0) + cutoff
+                candidates = np.flatnonzero(np.all((large_coords >= lower) &
+                                                   (large_coords <= upper), axis=1))
+
+                if candidates.shape[0] == 0:
+                    continue
+
+                # reuse the tree until the atoms moved more than the skin
+                if tree is not None:
+                    displacement = np.sqrt(np.max(np.sum(
+                        np.square(small_coords - tree_coords), axis=1)))
+                if tree is None or displacement > skin:
+                    tree = KDTree(small_coords)
+                    tree_coords = small_coords
+                    displacement = 0.0
+
+                # any pair within the cutoff now is within this bound
+                # at the positions the tree was built with
+                bound = np.nextafter(cutoff + displacement, np.inf)
+
+                for start in range(0, candidates.shape[0], block_size):
+                    block = candidates[start:start + block_size]
+                    _, nearest = tree.query(large_coords[block], distance_upper_bound=bound)
+
+                    # atoms with no tree neighbor within the bound have
+                    # no pair within the cutoff
+                    found = np.flatnonzero(nearest < small_idxs.shape[0])
+                    if found.shape[0] == 0:
+                        continue
+
+                    pair = _first_within(tree, small_coords, large_coords, block[found],
+                                         nearest[found], bound, cutoff)
+                    if pair is not None:
+                        results[frame_idx] = True
+                        pairs[frame_idx] = pair
+                        break
+
+            else:
+                cell_list = CellList(small_coords, cutoff, box_vectors=boxes[frame_idx])
+                for start in range(0, large_idxs.shape[0], block_size):
+                    pair = cell_list.first_neighbor(large_coords[start:start + block_size])
+
+                    if pair is not None:
+                        results[frame_idx] = True
+                        pairs[frame_idx] = (pair[1], start + pair[0])
+                        break
+
+        elif boxes is None:
+
+            # reuse the tree until the atoms moved more than the skin
+            if tree is not None:
+                displacement = np.sqrt(np.max(np.sum(
+                    np.square(small_coords - tree_coords), axis=1)))
+            rebuilt = tree is None or displacement > tree_skin
+            if rebuilt:
+                tree = KDTree(small_coords)
+                tree_coords = small_coords
+                displacement = 0.0
+
+            pair = _closest_pair(tree, small_coords, large_coords, displacement, cutoff)
+            if pair is not None:
+                results[frame_idx] = pair[0]
+                pairs[frame_idx] = pair[1:]
+
+            # the number of candidate pairs grows quickly with the
+            # skin relative to the minimum distance
+            if rebuilt and skin is None:
+                tree_skin = 0.5 * (results[frame_idx] if pair is not None else cutoff)
+
+        else:
+            min_distance, pair = periodic_minimum_distance(large_coords, small_coords,
+                                                           box_vectors=boxes[frame_idx],
+                                                           cutoff=cutoff, return_pair=True)
+
+            if pair is not None:
+                results[frame_idx] = min_distance
+                pairs[frame_idx] = (pair[1], pair[0])
+
+    if not return_pairs:
+        return results
+
+    # from positions in the selections to atom indices
+    found = pairs[:, 0] >= 0
+    atom_pairs = np.full((n_frames, 2), -1, dtype=np.intp)
+    atom_pairs[found, 0] = small_idxs[pairs[found, 0]]
+    atom_pairs[found, 1] = large_idxs[pairs[found, 1]]
+
+    if swapped:
+        atom_pairs = atom_pairs[:, ::-1]
+
+    return results, np.ascontiguousarray(atom_pairs)
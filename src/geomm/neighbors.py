@@ -0,0 +1,464 @@
+"""Neighbor searches in periodic systems using cell lists.
+
+The atoms are binned into a grid of cells in the fractional
+coordinates of the unitcell, with each cell at least as wide as the
+cutoff, so that all the atoms within the cutoff of a point are in the
+cell of the point or one of its neighbours (across the periodic
+boundaries). Both rectangular unitcells (given by their side lengths)
+and triclinic unitcells (given by their box vectors, as rows) are
+supported.
+
+"""
+
+import itertools as it
+
+import numpy as np
+from scipy.spatial import KDTree
+
+def _box_matrix(unitcell_side_lengths=None, box_vectors=None):
+    """The box vectors (as rows) of a rectangular or triclinic
+    unitcell and whether it is triclinic."""
+
+    assert (unitcell_side_lengths is None) != (box_vectors is None), \
+        "Exactly one of unitcell_side_lengths or box_vectors must be given"
+
+    if box_vectors is None:
+        unitcell_side_lengths = np.asarray(unitcell_side_lengths, dtype=np.float64)
+        assert unitcell_side_lengths.shape == (3,), \
+            "Unitcell side lengths are not of dimension 3"
+        return np.diag(unitcell_side_lengths), False
+
+    box_vectors = np.asarray(box_vectors, dtype=np.float64)
+    assert box_vectors.shape == (3, 3), \
+        "Box vectors should be of shape (3, 3)"
+
+    triclinic = np.count_nonzero(box_vectors - np.diag(np.diagonal(box_vectors))) > 0
+
+    return box_vectors, triclinic
+
+def minimum_image(diffs, unitcell_side_lengths=None, box_vectors=None):
+    """The shortest periodic images of displacement vectors.
+
+    Parameters
+    ----------
+
+    diffs : arraylike of shape (..., 3)
+        The displacement vectors.
+
+    unitcell_side_lengths : arraylike of shape (3,), optional
+        The lengths of the sides of a rectangular unitcell.
+       (Default = None)
+
+    box_vectors : arraylike of shape (3, 3), optional
+        The box vectors (as rows) of a triclinic unitcell, instead of
+        the side lengths.
+       (Default = None)
+
+    Returns
+    -------
+
+    image_diffs : arraylike of shape (..., 3)
+        The displacement vectors of the shortest images.
+
+    """
+
+    box, triclinic = _box_matrix(unitcell_side_lengths=unitcell_side_lengths,
+                                 box_vectors=box_vectors)
+
+    return _minimum_image(np.asarray(diffs, dtype=np.float64), box,
+                          np.linalg.inv(box), triclinic)
+
+# the lattice translations to the neighbouring images
+_IMAGE_SHIFTS = np.array(list(it.product((-1, 0, 1), repeat=3)), dtype=np.float64)
+
+def _minimum_image(diffs, box, inv_box, triclinic):
+    """`minimum_image` with the box matrix and its inverse given."""
+
+    # wrap the fractional displacements into [-0.5, 0.5]
+    fractional = diffs @ inv_box
+    fractional -= np.round(fractional)
+    image_diffs = fractional @ box
+
+    if triclinic:
+        # for a skewed unitcell the wrapped image is not always the
+        # shortest, but one of its neighbours is
+        candidates = image_diffs[..., np.newaxis, :] + _IMAGE_SHIFTS @ box
+        shortest = np.argmin(np.sum(np.square(candidates), axis=-1), axis=-1)
+        image_diffs = np.take_along_axis(candidates, shortest[..., np.newaxis, np.newaxis],
+                                         axis=-2)[..., 0, :]
+
+    return image_diffs
+
+class CellList(object):
+    """Atoms binned into a periodic grid of cells for finding the
+    atoms within a cutoff of other points.
+
+    Build it once for a set of atoms to query it with many sets of
+    points.
+
+    Parameters
+    ----------
+
+    coords : arraylike of shape (n_atoms, 3)
+        The atoms to bin, they do not need to be wrapped into the
+        unitcell.
+
+    cutoff : float
+        The distance within which neighbours are searched for, the
+        cells are at least this wide.
+
+    unitcell_side_lengths : arraylike of shape (3,), optional
+        The lengths of the sides of a rectangular unitcell.
+       (Default = None)
+
+    box_vectors : arraylike of shape (3, 3), optional
+        The box vectors (as rows) of a triclinic unitcell, instead of
+        the side lengths. The unitcell should be reduced (as usual
+        for simulations), i.e. not more skewed than necessary.
+       (Default = None)
+
+    Attributes
+    ----------
+
+    n_cells : arraylike of int of shape (3,)
+        The number of cells along each box vector.
+
+    """
+
+    def __init__(self, coords, cutoff, unitcell_side_lengths=None, box_vectors=None):
+
+        assert len(coords.shape) == 2 and coords.shape[1] == 3, \
+            "coords should be of shape (n_atoms, 3)"
+        assert cutoff > 0, "cutoff must be positive"
+
+        self.cutoff = cutoff
+        self.box, self.triclinic = _box_matrix(unitcell_side_lengths=unitcell_side_lengths,
+                                               box_vectors=box_vectors)
+        self.inv_box = np.linalg.inv(self.box)
+
+        self.coords = np.asarray(coords, dtype=np.float64)
+        n_atoms = self.coords.shape[0]
+
+        # the widths of the unitcell perpendicular to the faces
+        volume = abs(np.linalg.det(self.box))
+        face_areas = np.linalg.norm(np.cross(self.box[[1, 2, 0]], self.box[[2, 0, 1]]),
+                                    axis=1)
+        widths = volume / face_areas
+
+        # there is no point in many more cells than atoms, larger
+        # cells are still correct
+        max_cells = max(1, int(np.ceil(2 * n_atoms ** (1/3))))
+        self.n_cells = np.clip(np.floor(widths / cutoff).astype(int), 1, max_cells)
+
+        cell_idxs = self._cells(self.coords)
+
+        # the atoms sorted by cell, the atoms of cell i are
+        # self.sorted_idxs[self.cell_starts[i]:self.cell_starts[i+1]]
+        self.sorted_idxs = np.argsort(cell_idxs, kind='stable')
+        self.cell_starts = np.zeros((np.prod(self.n_cells) + 1,), dtype=np.intp)
+        self.cell_starts[1:] = np.cumsum(np.bincount(cell_idxs,
+                                                     minlength=np.prod(self.n_cells)))
+
+        # the neighbouring cells starting with the cell itself, with
+        # fewer than 3 cells along an axis the same cell would be
+        # visited more than once
+        axis_offsets = [list(dict.fromkeys(offset % n for offset in (0, -1, 1)))
+                        for n in self.n_cells]
+        self.offsets = np.array(list(it.product(*axis_offsets)), dtype=int)
+
+    def _grid_cells(self, coords):
+        """The grid position of the cell of each point."""
+
+        fractional = coords @ self.inv_box
+        fractional -= np.floor(fractional)
+
+        return np.minimum((fractional * self.n_cells).astype(int), self.n_cells - 1)
+
+    def _cells(self, coords):
+        """The flat index of the cell of each point."""
+
+        return np.ravel_multi_index(self._grid_cells(coords).T, self.n_cells)
+
+    def _offset_candidates(self, grid_cells, offset):
+        """The pairs of points and atoms in the cell of the points
+        shifted by `offset`."""
+
+        neighbor_cells = np.ravel_multi_index(((grid_cells + offset) % self.n_cells).T,
+                                              self.n_cells)
+
+        starts = self.cell_starts[neighbor_cells]
+        counts = self.cell_starts[neighbor_cells + 1] - starts
+
+        # expand the ranges of atoms of each cell without a loop
+        point_idxs = np.repeat(np.arange(grid_cells.shape[0]), counts)
+        positions = (np.arange(point_idxs.shape[0])
+                     - np.repeat(np.cumsum(counts) - counts, counts)
+                     + np.repeat(starts, counts))
+
+        return point_idxs, self.sorted_idxs[positions]
+
+    def _distances(self, coords, point_idxs, atom_idxs):
+        """The minimum image distances of pairs of points and atoms."""
+
+        diffs = _minimum_image(self.coords[atom_idxs] - coords[point_idxs],
+                               self.box, self.inv_box, self.triclinic)
+
+        return np.linalg.norm(diffs, axis=1)
+
+    def neighbors(self, coords):
+        """All the pairs of points and atoms within the cutoff.
+
+        Parameters
+        ----------
+
+        coords : arraylike of shape (n_points, 3)
+            The points to find the neighbouring atoms of.
+
+        Returns
+        -------
+
+        pairs : arraylike of int of shape (n_pairs, 2)
+            The index of the point and the atom of each pair.
+
+        distances : arraylike of shape (n_pairs,)
+            The minimum image distance of each pair.
+
+        """
+
+        coords = np.asarray(coords, dtype=np.float64).reshape((-1, 3))
+        grid_cells = self._grid_cells(coords)
+
+        pairs = []
+        distances = []
+        for offset in self.offsets:
+            point_idxs, atom_idxs = self._offset_candidates(grid_cells, offset)
+            offset_distances = self._distances(coords, point_idxs, atom_idxs)
+
+            within = offset_distances <= self.cutoff
+            pairs.append(np.stack([point_idxs[within], atom_idxs[within]], axis=1))
+            distances.append(offset_distances[within])
+
+        return np.concatenate(pairs), np.concatenate(distances)
+
+    def first_neighbor(self, coords):
+        """Any pair of a point and an atom within the cutoff, the search
+        stops at the first neighbouring cell with such a pair.
+
+        Parameters
+        ----------
+
+        coords : arraylike of shape (n_points, 3)
+            The points.
+
+        Returns
+        -------
+
+        pair : tuple of int
+            The index of the point and the atom, or None if no atom is
+            within the cutoff of a point.
+
+        """
+
+        coords = np.asarray(coords, dtype=np.float64).reshape((-1, 3))
+        grid_cells = self._grid_cells(coords)
+
+        # the offsets start with the cells of the points themselves
+        for offset in self.offsets:
+            point_idxs, atom_idxs = self._offset_candidates(grid_cells, offset)
+            offset_distances = self._distances(coords, point_idxs, atom_idxs)
+
+            within = np.flatnonzero(offset_distances <= self.cutoff)
+            if within.shape[0] > 0:
+                return (point_idxs[within[0]], atom_idxs[within[0]])
+
+        return None
+
+    def minimum_distance(self, coords, return_pair=False):
+        """The minimum distance between any of the points and the
+        atoms, if it is within the cutoff.
+
+        Only the cells neighbouring the points are searched, so the
+        smaller the cutoff the less work is done.
+
+        Parameters
+        ----------
+
+        coords : arraylike of shape (n_points, 3)
+            The points.
+
+        return_pair : bool, optional
+            Also return the indices of the closest point and atom.
+           (Default = False)
+
+        Returns
+        -------
+
+        min_distance : float
+            The minimum distance, or inf if no atom is within the
+            cutoff of a point.
+
+        pair : tuple of int
+            The index of the point and the atom, or None if no atom is
+            within the cutoff. Only if `return_pair` is True.
+
+        """
+
+        coords = np.asarray(coords, dtype=np.float64).reshape((-1, 3))
+        grid_cells = self._grid_cells(coords)
+
+        min_distance = np.inf
+        pair = None
+        for offset in self.offsets:
+            point_idxs, atom_idxs = self._offset_candidates(grid_cells, offset)
+
+            if point_idxs.shape[0] == 0:
+                continue
+
+            offset_distances = self._distances(coords, point_idxs, atom_idxs)
+            closest = np.argmin(offset_distances)
+
+            if offset_distances[closest] < min_distance:
+                min_distance = offset_distances[closest]
+                pair = (point_idxs[closest], atom_idxs[closest])
+
+        if min_distance > self.cutoff:
+            min_distance = np.inf
+            pair = None
+
+        if return_pair:
+            return min_distance, pair
+
+        return min_distance
+
+def neighbor_pairs(coords, cutoff, unitcell_side_lengths=None, box_vectors=None):
+    """All the unique pairs of atoms within a cutoff of each other,
+    using a cell list for periodic unitcells and a search tree
+    otherwise.
+
+    Parameters
+    ----------
+
+    coords : arraylike of shape (n_atoms, 3)
+        The coordinates.
+
+    cutoff : float
+        The distance within which pairs are found.
+
+    unitcell_side_lengths : arraylike of shape (3,), optional
+        The lengths of the sides of a rectangular unitcell, for
+        minimum image distances.
+       (Default = None)
+
+    box_vectors : arraylike of shape (3, 3), optional
+        The box vectors (as rows) of a triclinic unitcell.
+       (Default = None)
+
+    Returns
+    -------
+
+    pairs : arraylike of int of shape (n_pairs, 2)
+        The indices of the atoms of each pair (i < j).
+
+    distances : arraylike of shape (n_pairs,)
+        The (minimum image) distance of each pair.
+
+    """
+
+    assert len(coords.shape) == 2 and coords.shape[1] == 3, \
+        "coords should be of shape (n_atoms, 3)"
+
+    coords = np.asarray(coords, dtype=np.float64)
+
+    if coords.shape[0] == 0:
+        return np.zeros((0, 2), dtype=np.intp), np.zeros((0,))
+
+    if unitcell_side_lengths is None and box_vectors is None:
+        # without periodic images a search tree is much faster
+        pairs = KDTree(coords).query_pairs(cutoff, output_type='ndarray')
+        pairs = pairs.astype(np.intp, copy=False).reshape((-1, 2))
+
+        # like the cell list the tree includes pairs at exactly the cutoff
+        diffs = coords[pairs[:, 1]] - coords[pairs[:, 0]]
+        distances = np.sqrt(np.einsum('ij,ij->i', diffs, diffs))
+
+        return pairs, distances
+
+    cell_list = CellList(coords, cutoff, unitcell_side_lengths=unitcell_side_lengths,
+                         box_vectors=box_vectors)
+    pairs, distances = cell_list.neighbors(coords)
+
+    unique = pairs[:, 0] < pairs[:, 1]
+
+    return pairs[unique], distances[unique]
+
+def periodic_minimum_distance(coordsA, coordsB, unitcell_side_lengths=None,
+                              box_vectors=None, cutoff=None, return_pair=False):
+    """The minimum image distance between any members of coordsA and
+    coordsB in a periodic unitcell, using a cell list.
+
+    Parameters
+    ----------
+
+    coordsA : arraylike, shape (Natoms_A, 3)
+        First set of coordinates.
+
+    coordsB : arraylike, shape (Natoms_B, 3)
+        Second set of coordinates, these are binned into the cells.
+
+    unitcell_side_lengths : arraylike of shape (3,), optional
+        The lengths of the sides of a rectangular unitcell.
+       (Default = None)
+
+    box_vectors : arraylike of shape (3, 3), optional
+        The box vectors (as rows) of a triclinic unitcell, instead of
+        the side lengths.
+       (Default = None)
+
+    cutoff : float, optional
+        Only search for distances up to the cutoff, if there are none
+        inf is returned. If None, the search starts at the mean
+        spacing of the atoms and the cutoff is doubled until a pair
+        is found.
+       (Default = None)
+
+    return_pair : bool, optional
+        Also return the indices of the closest atoms of A and B.
+       (Default = False)
+
+    Returns
+    -------
+
+    min_distance : float
+
+    pair : tuple of int
+        Only if `return_pair` is True.
+
+    """
+
+    box, _ = _box_matrix(unitcell_side_lengths=unitcell_side_lengths,
+                         box_vectors=box_vectors)
+
+    if cutoff is not None:
+        cell_list = CellList(coordsB, cutoff, box_vectors=box)
+        return cell_list.minimum_distance(coordsA, return_pair=return_pair)
+
+    # no minimum image distance is longer than this, with that cutoff
+    # all pairs are searched
+    max_distance = 0.5 * np.sum(np.linalg.norm(box, axis=1))
+
+    cutoff = min(max_distance,
+                 (abs(np.linalg.det(box)) / max(1, coordsB.shape[0])) ** (1/3))
+
+    while True:
+        cell_list = CellList(coordsB, cutoff, box_vectors=box)
+        min_distance, pair = cell_list.minimum_distance(coordsA, return_pair=True)
+
+        if pair is not None or cutoff >= max_distance:
+            break
+
+        cutoff = min(2 * cutoff, max_distance)
+
+    if return_pair:
+        return min_distance, pair
+
+    return min_distance
@@ -0,0 +1,138 @@
+import numpy as np
+
+from geomm.pyqcprot import PairwiseRMSDTiles
+from geomm.theobald_qcp import _centered_frames
+
+def condensed_size(n_frames):
+    """The number of elements in the condensed (upper triangle)
+    form of a square pairwise matrix of n_frames."""
+
+    return n_frames * (n_frames - 1) // 2
+
+def condensed_index(n_frames, i, j):
+    """Index into the condensed form of a pairwise matrix for the
+    element (i, j), using the same ordering as
+    `scipy.spatial.distance.squareform`.
+
+    """
+
+    i, j = min(i, j), max(i, j)
+
+    assert i != j, "The diagonal is not part of the condensed form"
+
+    return n_frames * i - (i * (i + 1)) // 2 + j - i - 1
+
+def pairwise_rmsd(coords, idxs=None, weights=None, condensed=True,
+                  out=None, filename=None, tile_size=64, num_threads=None):
+    """Compute the RMSD after optimal superposition (Theobald-QCP)
+    between all pairs of frames.
+
+    Each frame is centered and has its self inner product computed
+    only once, after that each pair costs only the cross inner product
+    and the eigenvalue solve. The pairs are computed in square tiles
+    of frames (which should fit into cache) that are distributed over
+    threads. The results are written directly into the output, which
+    can be a memory-mapped array so that the matrix never has to be
+    held in memory.
+
+    Parameters
+    ----------
+
+    coords : arraylike of shape (n_frames, n_atoms, 3)
+        The frames to compare.
+
+    idxs : arraylike of int, optional
+        Indices of the atoms that are used for the alignment and RMSD.
+       (Default = None)
+
+    weights : arraylike, optional
+        Weights of the coordinates (e.g. masses).
+       (Default = None)
+
+    condensed : bool, optional
+        If True return only the upper triangle in the condensed form
+        used by `scipy.spatial.distance` (see `condensed_index`),
+        otherwise the full square matrix.
+       (Default = True)
+
+    out : arraylike, optional
+        A preallocated C-contiguous float64 array to write the results
+        into, of shape (n_frames*(n_frames-1)//2,) when condensed or
+        (n_frames, n_frames) otherwise. For example a
+        `numpy.lib.format.open_memmap` array.
+       (Default = None)
+
+    filename : str, optional
+        If given the output is created as a memory-mapped '.npy' file
+        at this path. Exclusive with `out`.
+       (Default = None)
+
+    tile_size : int, optional
+        Number of frames along each side of a tile.
+       (Default = 64)
+
+    num_threads : int, optional
+        Number of threads to use, if None the OpenMP default is used.
+       (Default = None)
+
+    Returns
+    -------
+
+    rmsds : arraylike
+        The pairwise RMSDs, this is `out` or the memory-mapped array
+        if either was given.
+
+    """
+
+    assert len(coords.shape) == 3, \
+        "coords should be a rank 3 array of shape (n_frames, n_atoms, 3)"
+    assert coords.shape[2] == 3, "coordinates are not of 3 dimensions"
+    assert not (out is not None and filename is not None), \
+        "Only one of out or filename can be given"
+    assert tile_size > 0, "tile_size must be positive"
+
+    n_frames = coords.shape[0]
+
+    if condensed:
+        out_shape = (condensed_size(n_frames),)
+    else:
+        out_shape = (n_frames, n_frames)
+
+    if filename is not None:
+        out = np.lib.format.open_memmap(filename, mode='w+',
+                                        dtype=np.float64, shape=out_shape)
+    elif out is None:
+        out = np.empty(out_shape, dtype=np.float64)
+
+    assert out.shape == out_shape, \
+        "out should be of shape {}".format(out_shape)
+    assert out.dtype == np.float64 and out.flags['C_CONTIGUOUS'], \
+        "out must be a C-contiguous float64 array"
+
+    if weights is not None:
+        weights = np.ascontiguousarray(weights, dtype=np.float64)
+
+    # the centered frames and their traces are shared by all pairs
+    centered_coords, Gs = _centered_frames(coords, idxs=idxs, weights=weights)
+    n_coords = centered_coords.shape[1]
+
+    if weights is not None:
+        assert weights.shape[0] == n_coords, \
+            "Number of weights given does not match the number of coordinates"
+
+    # the tiles in the upper triangle (including the diagonal tiles)
+    n_tiles = -(-n_frames // tile_size)
+    tile_rows, tile_cols = np.triu_indices(n_tiles)
+
+    if num_threads is None:
+        num_threads = 0
+
+    PairwiseRMSDTiles(centered_coords, Gs, n_coords,
+                      out.reshape(-1), condensed,
+                      tile_rows.astype(np.intp), tile_cols.astype(np.intp),
+                      tile_size, weights, num_threads=num_threads)
+
+    if isinstance(out, np.memmap):
+        out.flush()
+
+    return out
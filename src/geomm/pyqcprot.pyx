@@ -126,6 +126,9 @@ reference:
 Functions
 ---------
 
+All of the functions accept float32 or float64 coordinates, in both
+cases the inner products are accumulated in double precision.
+
 Users will typically use the :func:`CalcRMSDRotationalMatrix` function.
 
 .. autofunction:: CalcRMSDRotationalMatrix
@@ -134,33 +137,52 @@ Users will typically use the :func:`CalcRMSDRotationalMatrix` function.
 
 .. autofunction:: FastCalcRMSDAndRotation
 
+.. autofunction:: CalcRMSDRotationalMatrixBatch
+
+.. autofunction:: PairwiseRMSDTiles
+
+.. autofunction:: RMSDWithinBatch
+
+.. autofunction:: RMSDOneToMany
+
+.. autofunction:: AssignNearestBatch
+
+.. autofunction:: CalcRMSDRotationalMatrixSequential
+
+.. autofunction:: SelectionRMSDBatch
+
+.. autofunction:: WeightedRMSDRotationalMatrixBatch
+
 """
 
 import numpy as np
 cimport numpy as np
 
 import cython
+from cython cimport floating
+from cython.parallel cimport prange
 
-cdef extern from "math.h":
+cdef extern from "math.h" nogil:
     double sqrt(double x)
     double fabs(double x)
+    const double INFINITY
 
 @cython.boundscheck(False)
 @cython.wraparound(False)
-def InnerProduct(np.ndarray[np.float64_t, ndim=1] A,
-                 np.ndarray[np.float64_t, ndim=2] coords1,
-                 np.ndarray[np.float64_t, ndim=2] coords2,
+def InnerProduct(double[::1] A,
+                 const floating[:, :] coords1,
+                 const floating[:, :] coords2,
                  int N,
-                 np.ndarray[np.float64_t, ndim=1] weight):
+                 const double[::1] weight):
     """Calculate the inner product of two structures.
 
     Parameters
     ----------
     A : ndarray np.float64_t
         result inner product array, modified in place
-    coords1 : ndarray np.float64_t
+    coords1 : ndarray np.float64_t or np.float32_t
         reference structure
-    coord2 : ndarray np.float64_t
+    coord2 : ndarray np.float64_t or np.float32_t
         candidate structure
     N : int
         size of system
@@ -185,6 +207,27 @@ def InnerProduct(np.ndarray[np.float64_t, ndim=1] A,
        Array size changed from 3xN to Nx3.
     """
 
+    cdef double E0
+    cdef const double *weight_ptr = NULL
+
+    if weight is not None:
+        weight_ptr = &weight[0]
+
+    with nogil:
+        E0 = _inner_product(&A[0], coords1, coords2, N, weight_ptr)
+
+    return E0
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef double _inner_product(double *A,
+                           const floating[:, :] coords1,
+                           const floating[:, :] coords2,
+                           int N,
+                           const double *weight) noexcept nogil:
+    """Kernel of :func:`InnerProduct`. If `weight` is NULL the
+    unweighted inner product is computed."""
+
     cdef double          x1, x2, y1, y2, z1, z2
     cdef unsigned int    i
     cdef double          G1, G2
@@ -194,7 +237,7 @@ def InnerProduct(np.ndarray[np.float64_t, ndim=1] A,
 
     A[0] = A[1] = A[2] = A[3] = A[4] = A[5] = A[6] = A[7] = A[8] = 0.0
 
-    if (weight is not None):
+    if (weight != NULL):
         for i in range(N):
             x1 = weight[i] * coords1[i, 0]
             y1 = weight[i] * coords1[i, 1]
@@ -250,19 +293,20 @@ def InnerProduct(np.ndarray[np.float64_t, ndim=1] A,
 
 @cython.boundscheck(False)
 @cython.wraparound(False)
-def CalcRMSDRotationalMatrix(np.ndarray[np.float64_t, ndim=2] ref,
-                             np.ndarray[np.float64_t, ndim=2] conf,
+def CalcRMSDRotationalMatrix(const floating[:, :] ref,
+                             const floating[:, :] conf,
                              int N,
-                             np.ndarray[np.float64_t, ndim=1] rot,
-                             np.ndarray[np.float64_t, ndim=1] weights):
+                             double[::1] rot,
+                             const double[::1] weights,
+                             double[::1] quat=None):
     """
     Calculate the RMSD & rotational matrix.
 
     Parameters
     ----------
-    ref : ndarray, np.float64_t
+    ref : ndarray, np.float64_t or np.float32_t
         reference structure coordinates
-    conf : ndarray, np.float64_t
+    conf : ndarray, np.float64_t or np.float32_t
         condidate structure coordinates
     N : int
         size of the system
@@ -270,6 +314,10 @@ def CalcRMSDRotationalMatrix(np.ndarray[np.float64_t, ndim=2] ref,
         array to store rotation matrix. Must be flat
     weights : ndarray, npfloat64_t (optional)
         weights for each component
+    quat : ndarray, np.float64_t (optional)
+        array of length 4 to store the rotation as a unit quaternion
+        (w, x, y, z) in. The rotation matrix is the transpose of the
+        usual matrix of this quaternion.
 
     Returns
     -------
@@ -279,14 +327,30 @@ def CalcRMSDRotationalMatrix(np.ndarray[np.float64_t, ndim=2] ref,
     .. versionchanged:: 0.16.0
        Array size changed from 3xN to Nx3.
     """
-    cdef double E0
-    cdef np.ndarray[np.float64_t, ndim = 1] A = np.zeros(9,dtype = np.float64)
+    cdef double E0, rmsd
+    cdef double A[9]
+    cdef double *rot_ptr = NULL
+    cdef double *quat_ptr = NULL
+    cdef const double *weight_ptr = NULL
+
+    if rot is not None:
+        rot_ptr = &rot[0]
+
+    if quat is not None:
+        quat_ptr = &quat[0]
 
-    E0 = InnerProduct(A, conf, ref, N, weights)
-    return FastCalcRMSDAndRotation(rot, A, E0, N)
+    if weights is not None:
+        weight_ptr = &weights[0]
 
-def FastCalcRMSDAndRotation(np.ndarray[np.float64_t, ndim=1] rot,
-                            np.ndarray[np.float64_t, ndim=1] A,
+    with nogil:
+        E0 = _inner_product(A, conf, ref, N, weight_ptr)
+        rmsd = _fast_calc_rmsd_and_rotation_guess(rot_ptr, quat_ptr, A, E0, N,
+                                                  E0, NULL, NULL)
+
+    return rmsd
+
+def FastCalcRMSDAndRotation(double[::1] rot,
+                            const double[::1] A,
                             double E0, int N):
     """
     Calculate the RMSD, and/or the optimal rotation matrix.
@@ -311,6 +375,94 @@ def FastCalcRMSDAndRotation(np.ndarray[np.float64_t, ndim=1] rot,
     .. versionchanged:: 0.16.0
        Array sized changed from 3xN to Nx3.
     """
+    cdef double rmsd
+    cdef double *rot_ptr = NULL
+
+    if rot is not None:
+        rot_ptr = &rot[0]
+
+    with nogil:
+        rmsd = _fast_calc_rmsd_and_rotation(rot_ptr, &A[0], E0, N)
+
+    return rmsd
+
+cdef double _fast_calc_rmsd_and_rotation(double *rot, const double *A,
+                                         double E0, int N) noexcept nogil:
+    """Kernel of :func:`FastCalcRMSDAndRotation` working on raw
+    pointers. If `rot` is NULL only the RMSD is computed."""
+
+    return _fast_calc_rmsd_and_rotation_guess(rot, NULL, A, E0, N, E0, NULL, NULL)
+
+@cython.cdivision(True)
+cdef double _newton_max_eigenvalue(const double *C, double guess,
+                                   int *n_iter) noexcept nogil:
+    """Newton iteration for a root of the characteristic polynomial
+    x^4 + C[2] x^2 + C[1] x + C[0] starting from `guess`."""
+
+    cdef int i
+    cdef double mxEigenV = guess
+    cdef double oldg, x2, b, a, delta
+    cdef double evalprec = 1e-14
+
+    for i in range(50):
+        oldg = mxEigenV
+        x2 = mxEigenV*mxEigenV
+        b = (x2 + C[2])*mxEigenV
+        a = b + C[1]
+        delta = ((a*mxEigenV + C[0])/(2.0*x2*mxEigenV + b + a))
+        mxEigenV -= delta
+        if (fabs(mxEigenV - oldg) < fabs((evalprec)*mxEigenV)):
+            break
+
+    #if (i == 50):
+    #   print "\nMore than %d iterations needed!\n" % (i)
+
+    n_iter[0] = i + 1
+
+    return mxEigenV
+
+cdef bint _is_largest_root(const double *C, double x) noexcept nogil:
+    """Whether `x`, a root of the characteristic polynomial, is its
+    largest root.
+
+    The polynomial only has real roots, so no root is larger than x
+    exactly when all the Taylor coefficients of the polynomial at x
+    are non-negative (the leading one is 1).
+    """
+
+    cdef double tol = 1e-10
+    cdef double x2 = x * x
+    cdef double scale = 4.0 * fabs(x2 * x) + 2.0 * fabs(C[2] * x) + fabs(C[1])
+
+    # the first, second / 2 and third / 6 derivatives at x
+    return ((4.0 * x2 * x + 2.0 * C[2] * x + C[1] >= -tol * scale) and
+            (6.0 * x2 + C[2] >= -tol * (6.0 * x2 + fabs(C[2]))) and
+            (x >= 0.0))
+
+cdef double _fast_calc_rmsd_and_rotation_guess(double *rot, double *quat,
+                                               const double *A,
+                                               double E0, int N, double guess,
+                                               int *n_iter,
+                                               double *eigenvalue) noexcept nogil:
+    """:func:`_fast_calc_rmsd_and_rotation` with the Newton iteration
+    for the largest eigenvalue started from `guess` instead of E0
+    (which is an upper bound of it).
+
+    If the guess is not below E0 it is not used. Starting below the
+    largest eigenvalue Newton's method may converge to a smaller
+    root, if so it is restarted from E0. The total number of
+    iterations is written to `n_iter` and the eigenvalue to
+    `eigenvalue` if they are not NULL.
+
+    If `quat` is not NULL the unit quaternion (w, x, y, z) of the
+    rotation is written to it, the rotation matrix written to `rot`
+    is the transpose of the usual matrix of this quaternion, as it
+    is applied to row vectors.
+    """
+
+    cdef int iters = 0
+    cdef int restart_iters = 0
+
     cdef double rmsd
     cdef double Sxx, Sxy, Sxz, Syx, Syy, Syz, Szx, Szy, Szz
     cdef double Szz2, Syy2, Sxx2, Sxy2, Syz2, Sxz2, Syx2, Szy2, Szx2,
@@ -318,11 +470,9 @@ def FastCalcRMSDAndRotation(np.ndarray[np.float64_t, ndim=1] rot,
     cdef double SxzpSzx, SyzpSzy, SxypSyx, SyzmSzy,
     cdef double SxzmSzx, SxymSyx, SxxpSyy, SxxmSyy
 
-    cdef np.ndarray[np.float64_t, ndim=1] C = np.zeros(4,)
-    cdef unsigned int i
+    cdef double C[4]
     cdef double mxEigenV
-    cdef double oldg = 0.0
-    cdef double b, a, delta, rms, qsqr
+    cdef double rms, qsqr
     cdef double q1, q2, q3, q4, normq
     cdef double a11, a12, a13, a14, a21, a22, a23, a24
     cdef double a31, a32, a33, a34, a41, a42, a43, a44
@@ -330,7 +480,6 @@ def FastCalcRMSDAndRotation(np.ndarray[np.float64_t, ndim=1] rot,
     cdef double xy, az, zx, ay, yz, ax
     cdef double a3344_4334, a3244_4234, a3243_4233, a3143_4133,a3144_4134, a3142_4132
     cdef double evecprec = 1e-6
-    cdef double evalprec = 1e-14
 
     cdef double a1324_1423, a1224_1422, a1223_1322, a1124_1421, a1123_1321, a1122_1221
     Sxx = A[0]
@@ -378,25 +527,26 @@ def FastCalcRMSDAndRotation(np.ndarray[np.float64_t, ndim=1] rot,
          + (+(SxypSyx)*(SyzpSzy)+(SxzpSzx)*(SxxmSyy+Szz)) * (-(SxymSyx)*(SyzmSzy)+(SxzpSzx)*(SxxpSyy+Szz))
          + (+(SxypSyx)*(SyzmSzy)+(SxzmSzx)*(SxxmSyy-Szz)) * (-(SxymSyx)*(SyzpSzy)+(SxzmSzx)*(SxxpSyy-Szz)))
 
-    mxEigenV = E0
-    for i in range(50):
-        oldg = mxEigenV
-        x2 = mxEigenV*mxEigenV
-        b = (x2 + C[2])*mxEigenV
-        a = b + C[1]
-        delta = ((a*mxEigenV + C[0])/(2.0*x2*mxEigenV + b + a))
-        mxEigenV -= delta
-        if (fabs(mxEigenV - oldg) < fabs((evalprec)*mxEigenV)):
-            break
+    if guess < E0 and guess > 0.0:
+        mxEigenV = _newton_max_eigenvalue(C, guess, &iters)
 
-    #if (i == 50):
-    #   print "\nMore than %d iterations needed!\n" % (i)
+        if not _is_largest_root(C, mxEigenV):
+            mxEigenV = _newton_max_eigenvalue(C, E0, &restart_iters)
+            iters += restart_iters
+    else:
+        mxEigenV = _newton_max_eigenvalue(C, E0, &iters)
+
+    if n_iter != NULL:
+        n_iter[0] = iters
+
+    if eigenvalue != NULL:
+        eigenvalue[0] = mxEigenV
 
     # the fabs() is to guard against extremely small,
     # but *negative* numbers due to floating point error
     rms = sqrt(fabs(2.0 * (E0 - mxEigenV)/N))
 
-    if (rot is None):
+    if (rot == NULL and quat == NULL):
         return rms # Don't bother with rotation.
 
     a11 = SxxpSyy + Szz-mxEigenV
@@ -463,10 +613,15 @@ def FastCalcRMSDAndRotation(np.ndarray[np.float64_t, ndim=1] rot,
 
                 if (qsqr < evecprec):
                     # if qsqr is still too small, return the identity matrix. #
-                    rot[0] = rot[4] = rot[8] = 1.0
-                    rot[1] = rot[2] = rot[3] = rot[5] = rot[6] = rot[7] = 0.0
+                    if rot != NULL:
+                        rot[0] = rot[4] = rot[8] = 1.0
+                        rot[1] = rot[2] = rot[3] = rot[5] = rot[6] = rot[7] = 0.0
+
+                    if quat != NULL:
+                        quat[0] = 1.0
+                        quat[1] = quat[2] = quat[3] = 0.0
 
-                    return
+                    return rms
 
 
     normq = sqrt(qsqr)
@@ -475,6 +630,15 @@ def FastCalcRMSDAndRotation(np.ndarray[np.float64_t, ndim=1] rot,
     q3 /= normq
     q4 /= normq
 
+    if quat != NULL:
+        quat[0] = q1
+        quat[1] = q2
+        quat[2] = q3
+        quat[3] = q4
+
+    if rot == NULL:
+        return rms
+
     a2 = q1 * q1
     x2 = q2 * q2
     y2 = q3 * q3
@@ -498,3 +662,1122 @@ def FastCalcRMSDAndRotation(np.ndarray[np.float64_t, ndim=1] rot,
     rot[8] = a2 - x2 - y2 + z2
 
     return rms
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef double _centered_inner_product(double *A,
+                                    const floating[:, ::1] conf,
+                                    const double[:, ::1] ref,
+                                    int N,
+                                    const double *weight,
+                                    double *centroid) noexcept nogil:
+    """Inner product of a candidate structure with an already centered
+    reference structure. The candidate is centered on the fly on its
+    (weighted) centroid which is written to `centroid`.
+
+    Returns the (weighted) self inner product G of the centered
+    candidate structure.
+    """
+
+    cdef unsigned int i
+    cdef double x1, y1, z1, x2, y2, z2, w
+    cdef double cx = 0.0
+    cdef double cy = 0.0
+    cdef double cz = 0.0
+    cdef double total_weight = 0.0
+    cdef double G = 0.0
+
+    A[0] = A[1] = A[2] = A[3] = A[4] = A[5] = A[6] = A[7] = A[8] = 0.0
+
+    # first pass: the centroid of the candidate
+    if weight != NULL:
+        for i in range(N):
+            w = weight[i]
+            cx += w * conf[i, 0]
+            cy += w * conf[i, 1]
+            cz += w * conf[i, 2]
+            total_weight += w
+    else:
+        for i in range(N):
+            cx += conf[i, 0]
+            cy += conf[i, 1]
+            cz += conf[i, 2]
+        total_weight = N
+
+    cx /= total_weight
+    cy /= total_weight
+    cz /= total_weight
+
+    centroid[0] = cx
+    centroid[1] = cy
+    centroid[2] = cz
+
+    # second pass: the inner product, same layout as InnerProduct
+    # with the candidate as coords1
+    for i in range(N):
+        x2 = conf[i, 0] - cx
+        y2 = conf[i, 1] - cy
+        z2 = conf[i, 2] - cz
+
+        if weight != NULL:
+            w = weight[i]
+        else:
+            w = 1.0
+
+        x1 = w * x2
+        y1 = w * y2
+        z1 = w * z2
+
+        G += x1 * x2 + y1 * y2 + z1 * z2
+
+        A[0] +=  (x1 * ref[i, 0])
+        A[1] +=  (x1 * ref[i, 1])
+        A[2] +=  (x1 * ref[i, 2])
+
+        A[3] +=  (y1 * ref[i, 0])
+        A[4] +=  (y1 * ref[i, 1])
+        A[5] +=  (y1 * ref[i, 2])
+
+        A[6] +=  (z1 * ref[i, 0])
+        A[7] +=  (z1 * ref[i, 1])
+        A[8] +=  (z1 * ref[i, 2])
+
+    return G
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef void _batch_frame(Py_ssize_t frame_idx,
+                       const double[:, ::1] ref,
+                       double ref_G,
+                       const floating[:, :, ::1] confs,
+                       int N,
+                       double[::1] rmsds,
+                       double *rots,
+                       double *centroids,
+                       double *quats,
+                       const double *weight) noexcept nogil:
+    """Align a single frame of a batch, the buffers are local to this
+    function so that it can be called from parallel threads."""
+
+    cdef double A[9]
+    cdef double centroid[3]
+    cdef double G, E0
+    cdef double *rot_ptr = NULL
+    cdef double *quat_ptr = NULL
+
+    G = _centered_inner_product(A, confs[frame_idx], ref, N,
+                                weight, centroid)
+
+    if rots != NULL:
+        rot_ptr = rots + 9 * frame_idx
+
+    if quats != NULL:
+        quat_ptr = quats + 4 * frame_idx
+
+    E0 = 0.5 * (G + ref_G)
+    rmsds[frame_idx] = _fast_calc_rmsd_and_rotation_guess(rot_ptr, quat_ptr, A,
+                                                          E0, N, E0, NULL, NULL)
+
+    if centroids != NULL:
+        centroids[3 * frame_idx] = centroid[0]
+        centroids[3 * frame_idx + 1] = centroid[1]
+        centroids[3 * frame_idx + 2] = centroid[2]
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def CalcRMSDRotationalMatrixBatch(const double[:, ::1] ref,
+                                  double ref_G,
+                                  const floating[:, :, ::1] confs,
+                                  int N,
+                                  double[::1] rmsds,
+                                  double[:, ::1] rots,
+                                  double[:, ::1] centroids,
+                                  const double[::1] weights,
+                                  int num_threads=0,
+                                  double[:, ::1] quats=None):
+    """
+    Calculate the RMSDs & rotational matrices of a stack of candidate
+    structures against a single reference.
+
+    The frames are distributed over OpenMP threads with the GIL
+    released.
+
+    Parameters
+    ----------
+    ref : memoryview, float64
+        reference structure coordinates, must already be centered
+    ref_G : float
+        (weighted) self inner product of the centered reference,
+        i.e. sum(w * ref**2)
+    confs : memoryview, float64 or float32
+        candidate structures, shape (n_frames, N, 3). Each frame is
+        centered on its (weighted) centroid internally.
+    N : int
+        size of the system
+    rmsds : memoryview, float64
+        array of shape (n_frames,) to store the RMSDs in
+    rots : memoryview, float64 (optional)
+        array of shape (n_frames, 9) to store the flat rotation
+        matrices in. If None, only the RMSDs are computed.
+    centroids : memoryview, float64 (optional)
+        array of shape (n_frames, 3) to store the centroids of the
+        candidate structures in.
+    weights : memoryview, float64 (optional)
+        weights for each component
+    num_threads : int (optional)
+        number of threads to use, if 0 the OpenMP default is used
+        (i.e. OMP_NUM_THREADS or the number of cores)
+    quats : memoryview, float64 (optional)
+        array of shape (n_frames, 4) to store the rotations as unit
+        quaternions (w, x, y, z) in.
+    """
+
+    cdef Py_ssize_t frame_idx
+    cdef Py_ssize_t n_frames = confs.shape[0]
+    cdef double *rots_ptr = NULL
+    cdef double *centroids_ptr = NULL
+    cdef double *quats_ptr = NULL
+    cdef const double *weight_ptr = NULL
+
+    if rots is not None and n_frames > 0:
+        rots_ptr = &rots[0, 0]
+
+    if centroids is not None and n_frames > 0:
+        centroids_ptr = &centroids[0, 0]
+
+    if quats is not None and n_frames > 0:
+        quats_ptr = &quats[0, 0]
+
+    if weights is not None:
+        weight_ptr = &weights[0]
+
+    if num_threads > 0:
+        for frame_idx in prange(n_frames, nogil=True, schedule='static',
+                                num_threads=num_threads):
+            _batch_frame(frame_idx, ref, ref_G, confs, N, rmsds,
+                         rots_ptr, centroids_ptr, quats_ptr, weight_ptr)
+    else:
+        for frame_idx in prange(n_frames, nogil=True, schedule='static'):
+            _batch_frame(frame_idx, ref, ref_G, confs, N, rmsds,
+                         rots_ptr, centroids_ptr, quats_ptr, weight_ptr)
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef void _cross_inner_product(double *A,
+                               const floating[:, ::1] coords1,
+                               const floating[:, ::1] coords2,
+                               int N,
+                               const double *weight) noexcept nogil:
+    """Only the A matrix of :func:`InnerProduct` for two already
+    centered structures whose self inner products are known."""
+
+    cdef unsigned int i
+    cdef double x1, y1, z1, x2, y2, z2
+
+    A[0] = A[1] = A[2] = A[3] = A[4] = A[5] = A[6] = A[7] = A[8] = 0.0
+
+    for i in range(N):
+        x1 = coords1[i, 0]
+        y1 = coords1[i, 1]
+        z1 = coords1[i, 2]
+
+        if weight != NULL:
+            x1 = weight[i] * x1
+            y1 = weight[i] * y1
+            z1 = weight[i] * z1
+
+        x2 = coords2[i, 0]
+        y2 = coords2[i, 1]
+        z2 = coords2[i, 2]
+
+        A[0] +=  (x1 * x2)
+        A[1] +=  (x1 * y2)
+        A[2] +=  (x1 * z2)
+
+        A[3] +=  (y1 * x2)
+        A[4] +=  (y1 * y2)
+        A[5] +=  (y1 * z2)
+
+        A[6] +=  (z1 * x2)
+        A[7] +=  (z1 * y2)
+        A[8] +=  (z1 * z2)
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+cdef void _pairwise_tile(Py_ssize_t row_start, Py_ssize_t row_stop,
+                         Py_ssize_t col_start, Py_ssize_t col_stop,
+                         const floating[:, :, ::1] confs,
+                         const double[::1] Gs,
+                         int N,
+                         double *out,
+                         bint condensed,
+                         const double *weight) noexcept nogil:
+    """Compute the RMSDs of one tile of the upper triangle of the
+    pairwise matrix and write them into the (flat) output."""
+
+    cdef Py_ssize_t i, j
+    cdef Py_ssize_t n_frames = confs.shape[0]
+    cdef double rmsd
+
+    for i in range(row_start, row_stop):
+        for j in range(col_start, col_stop):
+
+            if j < i:
+                continue
+
+            if j == i:
+                if not condensed:
+                    out[i * n_frames + i] = 0.0
+                continue
+
+            rmsd = _pair_rmsd(confs, Gs, i, j, N, weight)
+
+            if condensed:
+                out[n_frames * i - (i * (i + 1)) // 2 + j - i - 1] = rmsd
+            else:
+                out[i * n_frames + j] = rmsd
+                out[j * n_frames + i] = rmsd
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def PairwiseRMSDTiles(const floating[:, :, ::1] confs,
+                      const double[::1] Gs,
+                      int N,
+                      double[::1] out,
+                      bint condensed,
+                      const Py_ssize_t[::1] tile_rows,
+                      const Py_ssize_t[::1] tile_cols,
+                      Py_ssize_t tile_size,
+                      const double[::1] weights,
+                      int num_threads=0):
+    """
+    Calculate the RMSDs between all pairs of a stack of structures
+    tile by tile.
+
+    Parameters
+    ----------
+    confs : memoryview, float64 or float32
+        centered structures, shape (n_frames, N, 3)
+    Gs : memoryview, float64
+        (weighted) self inner products of each centered structure
+    N : int
+        size of the system
+    out : memoryview, float64
+        flat output, either the condensed upper triangle of length
+        n_frames * (n_frames - 1) / 2 or the full square matrix of
+        length n_frames * n_frames
+    condensed : bool
+        whether `out` is the condensed upper triangle
+    tile_rows, tile_cols : memoryview, intp
+        the row and column tile index of each tile to compute
+    tile_size : int
+        number of frames along each side of a tile
+    weights : memoryview, float64 (optional)
+        weights for each component
+    num_threads : int (optional)
+        number of threads to use, if 0 the OpenMP default is used
+    """
+
+    cdef Py_ssize_t tile_idx, row_start, col_start
+    cdef Py_ssize_t n_tiles = tile_rows.shape[0]
+    cdef Py_ssize_t n_frames = confs.shape[0]
+    cdef const double *weight_ptr = NULL
+
+    if weights is not None:
+        weight_ptr = &weights[0]
+
+    if out.shape[0] == 0:
+        return
+
+    if num_threads > 0:
+        for tile_idx in prange(n_tiles, nogil=True, schedule='dynamic',
+                               num_threads=num_threads):
+            row_start = tile_rows[tile_idx] * tile_size
+            col_start = tile_cols[tile_idx] * tile_size
+            _pairwise_tile(row_start, min(row_start + tile_size, n_frames),
+                           col_start, min(col_start + tile_size, n_frames),
+                           confs, Gs, N, &out[0], condensed, weight_ptr)
+    else:
+        for tile_idx in prange(n_tiles, nogil=True, schedule='dynamic'):
+            row_start = tile_rows[tile_idx] * tile_size
+            col_start = tile_cols[tile_idx] * tile_size
+            _pairwise_tile(row_start, min(row_start + tile_size, n_frames),
+                           col_start, min(col_start + tile_size, n_frames),
+                           confs, Gs, N, &out[0], condensed, weight_ptr)
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef double _centroid_and_G(const floating[:, ::1] conf,
+                            int N,
+                            const double *weight,
+                            double *centroid) noexcept nogil:
+    """Compute the (weighted) centroid of a structure and the
+    (weighted) inner product of the centered structure with itself
+    in a single pass.
+
+    The moments are taken relative to the first atom rather than the
+    origin to avoid cancellation for structures far from the origin.
+    """
+
+    cdef unsigned int i
+    cdef double x0, y0, z0, dx, dy, dz, w
+    cdef double sx = 0.0
+    cdef double sy = 0.0
+    cdef double sz = 0.0
+    cdef double sq = 0.0
+    cdef double total_weight = 0.0
+
+    x0 = conf[0, 0]
+    y0 = conf[0, 1]
+    z0 = conf[0, 2]
+
+    for i in range(N):
+        if weight != NULL:
+            w = weight[i]
+        else:
+            w = 1.0
+
+        dx = conf[i, 0] - x0
+        dy = conf[i, 1] - y0
+        dz = conf[i, 2] - z0
+
+        sx += w * dx
+        sy += w * dy
+        sz += w * dz
+        sq += w * (dx * dx + dy * dy + dz * dz)
+        total_weight += w
+
+    sx /= total_weight
+    sy /= total_weight
+    sz /= total_weight
+
+    centroid[0] = x0 + sx
+    centroid[1] = y0 + sy
+    centroid[2] = z0 + sz
+
+    return fabs(sq - total_weight * (sx * sx + sy * sy + sz * sz))
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef void _centered_cross_inner_product(double *A,
+                                        const floating[:, ::1] conf,
+                                        const double[:, ::1] ref,
+                                        int N,
+                                        const double *weight,
+                                        const double *centroid) noexcept nogil:
+    """Only the A matrix of the inner product of a candidate structure,
+    centered on the fly on the given centroid, with an already centered
+    reference."""
+
+    cdef unsigned int i
+    cdef double x1, y1, z1
+
+    A[0] = A[1] = A[2] = A[3] = A[4] = A[5] = A[6] = A[7] = A[8] = 0.0
+
+    for i in range(N):
+        x1 = conf[i, 0] - centroid[0]
+        y1 = conf[i, 1] - centroid[1]
+        z1 = conf[i, 2] - centroid[2]
+
+        if weight != NULL:
+            x1 = weight[i] * x1
+            y1 = weight[i] * y1
+            z1 = weight[i] * z1
+
+        A[0] +=  (x1 * ref[i, 0])
+        A[1] +=  (x1 * ref[i, 1])
+        A[2] +=  (x1 * ref[i, 2])
+
+        A[3] +=  (y1 * ref[i, 0])
+        A[4] +=  (y1 * ref[i, 1])
+        A[5] +=  (y1 * ref[i, 2])
+
+        A[6] +=  (z1 * ref[i, 0])
+        A[7] +=  (z1 * ref[i, 1])
+        A[8] +=  (z1 * ref[i, 2])
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef void _within_frame(Py_ssize_t frame_idx,
+                        const double[:, ::1] ref,
+                        double ref_G,
+                        const floating[:, :, ::1] confs,
+                        int N,
+                        double cutoff,
+                        double[::1] rmsds,
+                        const double *weight) noexcept nogil:
+    """RMSD of a single frame of a batch if it can be within the
+    cutoff, otherwise infinity."""
+
+    cdef double A[9]
+    cdef double centroid[3]
+    cdef double G, bound
+
+    G = _centroid_and_G(confs[frame_idx], N, weight, centroid)
+
+    # the largest eigenvalue is bounded by sqrt(G * ref_G) (by
+    # Cauchy-Schwarz) which gives a lower bound on the RMSD
+    bound = fabs(sqrt(G) - sqrt(ref_G)) / sqrt(<double> N)
+
+    if bound > cutoff:
+        rmsds[frame_idx] = INFINITY
+        return
+
+    _centered_cross_inner_product(A, confs[frame_idx], ref, N, weight,
+                                  centroid)
+    rmsds[frame_idx] = _fast_calc_rmsd_and_rotation(NULL, A,
+                                                    0.5 * (G + ref_G), N)
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def RMSDWithinBatch(const double[:, ::1] ref,
+                    double ref_G,
+                    const floating[:, :, ::1] confs,
+                    int N,
+                    double cutoff,
+                    double[::1] rmsds,
+                    const double[::1] weights,
+                    int num_threads=0):
+    """
+    Calculate the RMSDs of a stack of candidate structures to a single
+    reference, skipping the structures which cannot be within a cutoff.
+
+    The RMSD is bounded from below by the difference of the square
+    roots of the self inner products of the two structures (i.e. the
+    difference of their radii of gyration). For structures where this
+    bound is larger than the cutoff neither the inner product nor the
+    eigenvalue are computed and the RMSD is set to infinity.
+
+    Parameters
+    ----------
+    ref : memoryview, float64
+        reference structure coordinates, must already be centered
+    ref_G : float
+        (weighted) self inner product of the centered reference
+    confs : memoryview, float64 or float32
+        candidate structures, shape (n_frames, N, 3)
+    N : int
+        size of the system
+    cutoff : float
+        RMSD cutoff
+    rmsds : memoryview, float64
+        array of shape (n_frames,) to store the RMSDs in
+    weights : memoryview, float64 (optional)
+        weights for each component
+    num_threads : int (optional)
+        number of threads to use, if 0 the OpenMP default is used
+    """
+
+    cdef Py_ssize_t frame_idx
+    cdef Py_ssize_t n_frames = confs.shape[0]
+    cdef const double *weight_ptr = NULL
+
+    if weights is not None:
+        weight_ptr = &weights[0]
+
+    if num_threads > 0:
+        for frame_idx in prange(n_frames, nogil=True, schedule='static',
+                                num_threads=num_threads):
+            _within_frame(frame_idx, ref, ref_G, confs, N, cutoff, rmsds,
+                          weight_ptr)
+    else:
+        for frame_idx in prange(n_frames, nogil=True, schedule='static'):
+            _within_frame(frame_idx, ref, ref_G, confs, N, cutoff, rmsds,
+                          weight_ptr)
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def RMSDOneToMany(const floating[:, :, ::1] confs,
+                  const double[::1] Gs,
+                  Py_ssize_t ref_idx,
+                  const Py_ssize_t[::1] frame_idxs,
+                  int N,
+                  double[::1] rmsds,
+                  const double[::1] weights,
+                  int num_threads=0):
+    """
+    Calculate the RMSDs between one structure of a stack of centered
+    structures and a subset of the others.
+
+    Parameters
+    ----------
+    confs : memoryview, float64 or float32
+        centered structures, shape (n_frames, N, 3)
+    Gs : memoryview, float64
+        (weighted) self inner products of each centered structure
+    ref_idx : int
+        index of the structure to compute the RMSDs to
+    frame_idxs : memoryview, intp
+        indices of the structures to compute the RMSDs of
+    N : int
+        size of the system
+    rmsds : memoryview, float64
+        array of the same length as frame_idxs to store the RMSDs in
+    weights : memoryview, float64 (optional)
+        weights for each component
+    num_threads : int (optional)
+        number of threads to use, if 0 the OpenMP default is used
+    """
+
+    cdef Py_ssize_t k
+    cdef Py_ssize_t n_idxs = frame_idxs.shape[0]
+    cdef const double *weight_ptr = NULL
+
+    if weights is not None:
+        weight_ptr = &weights[0]
+
+    if num_threads > 0:
+        for k in prange(n_idxs, nogil=True, schedule='static',
+                        num_threads=num_threads):
+            rmsds[k] = _pair_rmsd(confs, Gs, ref_idx, frame_idxs[k], N,
+                                  weight_ptr)
+    else:
+        for k in prange(n_idxs, nogil=True, schedule='static'):
+            rmsds[k] = _pair_rmsd(confs, Gs, ref_idx, frame_idxs[k], N,
+                                  weight_ptr)
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef double _pair_rmsd(const floating[:, :, ::1] confs,
+                       const double[::1] Gs,
+                       Py_ssize_t i,
+                       Py_ssize_t j,
+                       int N,
+                       const double *weight) noexcept nogil:
+    """RMSD between two structures of a stack of centered structures."""
+
+    cdef double A[9]
+
+    _cross_inner_product(A, confs[i], confs[j], N, weight)
+
+    return _fast_calc_rmsd_and_rotation(NULL, A, 0.5 * (Gs[i] + Gs[j]), N)
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef void _assign_frame(Py_ssize_t frame_idx,
+                        const floating[:, :, ::1] confs,
+                        const double[:, :, ::1] refs,
+                        const double[::1] ref_Gs,
+                        const double[::1] ref_rgs,
+                        const double[:, ::1] ref_distances,
+                        int N,
+                        Py_ssize_t[::1] labels,
+                        double[::1] distances,
+                        Py_ssize_t[::1] n_evaluations,
+                        const double *weight) noexcept nogil:
+    """Find the closest reference to a single frame.
+
+    The references are sorted by their radius of gyration and are
+    visited outwards from the one closest to the frame's radius of
+    gyration, the search stops in a direction as soon as the radius of
+    gyration difference (a lower bound on the RMSD) exceeds the best
+    RMSD found so far.
+    """
+
+    cdef double A[9]
+    cdef double centroid[3]
+    cdef double G, rg, rmsd, bound
+    cdef double best = INFINITY
+    cdef Py_ssize_t best_k = -1
+    cdef Py_ssize_t n_refs = refs.shape[0]
+    cdef Py_ssize_t lo, hi, mid, k
+    cdef Py_ssize_t n_evals = 0
+    cdef bint go_down, go_up, down
+
+    G = _centroid_and_G(confs[frame_idx], N, weight, centroid)
+    rg = sqrt(G / N)
+
+    # binary search for the first reference with a larger radius of
+    # gyration
+    lo = 0
+    hi = n_refs
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if ref_rgs[mid] < rg:
+            lo = mid + 1
+        else:
+            hi = mid
+
+    # lo - 1 is the next one down, hi the next one up
+    lo = lo - 1
+    go_down = lo >= 0
+    go_up = hi < n_refs
+
+    while go_down or go_up:
+
+        # visit the side with the smaller bound first
+        if go_down and go_up:
+            down = (rg - ref_rgs[lo]) <= (ref_rgs[hi] - rg)
+        else:
+            down = go_down
+
+        if down:
+            k = lo
+            bound = rg - ref_rgs[k]
+            lo = lo - 1
+        else:
+            k = hi
+            bound = ref_rgs[k] - rg
+            hi = hi + 1
+
+        if bound >= best:
+            # all the others in this direction are even farther
+            if down:
+                go_down = False
+            else:
+                go_up = False
+            continue
+
+        # triangle inequality with the best reference so far, if
+        # d(best, k) >= 2 d(frame, best) then d(frame, k) >= d(frame, best)
+        if (best_k >= 0 and ref_distances.shape[0] > 0 and
+                ref_distances[best_k, k] >= 2.0 * best):
+            pass
+        else:
+            _centered_cross_inner_product(A, confs[frame_idx], refs[k], N,
+                                          weight, centroid)
+            rmsd = _fast_calc_rmsd_and_rotation(NULL, A,
+                                                0.5 * (G + ref_Gs[k]), N)
+            n_evals = n_evals + 1
+
+            if rmsd < best:
+                best = rmsd
+                best_k = k
+
+        if lo < 0:
+            go_down = False
+        if hi >= n_refs:
+            go_up = False
+
+    labels[frame_idx] = best_k
+    distances[frame_idx] = best
+    n_evaluations[frame_idx] = n_evals
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def AssignNearestBatch(const floating[:, :, ::1] confs,
+                       const double[:, :, ::1] refs,
+                       const double[::1] ref_Gs,
+                       const double[::1] ref_rgs,
+                       const double[:, ::1] ref_distances,
+                       int N,
+                       Py_ssize_t[::1] labels,
+                       double[::1] distances,
+                       Py_ssize_t[::1] n_evaluations,
+                       const double[::1] weights,
+                       int num_threads=0):
+    """
+    Find the reference with the smallest RMSD for each structure of a
+    stack of structures.
+
+    Parameters
+    ----------
+    confs : memoryview, float64 or float32
+        candidate structures, shape (n_frames, N, 3), centered
+        internally
+    refs : memoryview, float64
+        centered reference structures, shape (n_refs, N, 3), sorted by
+        their radius of gyration
+    ref_Gs : memoryview, float64
+        (weighted) self inner products of the references
+    ref_rgs : memoryview, float64
+        sqrt(ref_Gs / N) in increasing order
+    ref_distances : memoryview, float64
+        the RMSDs between the references, shape (n_refs, n_refs), or
+        an array of shape (0, 0) to not use them for pruning
+    N : int
+        size of the system
+    labels : memoryview, intp
+        array of shape (n_frames,) to store the index of the closest
+        reference in
+    distances : memoryview, float64
+        array of shape (n_frames,) to store the RMSD to the closest
+        reference in
+    n_evaluations : memoryview, intp
+        array of shape (n_frames,) to store the number of RMSDs that
+        were computed for each frame in
+    weights : memoryview, float64 (optional)
+        weights for each component
+    num_threads : int (optional)
+        number of threads to use, if 0 the OpenMP default is used
+    """
+
+    cdef Py_ssize_t frame_idx
+    cdef Py_ssize_t n_frames = confs.shape[0]
+    cdef const double *weight_ptr = NULL
+
+    if weights is not None:
+        weight_ptr = &weights[0]
+
+    if num_threads > 0:
+        for frame_idx in prange(n_frames, nogil=True, schedule='dynamic',
+                                num_threads=num_threads):
+            _assign_frame(frame_idx, confs, refs, ref_Gs, ref_rgs,
+                          ref_distances, N, labels, distances, n_evaluations,
+                          weight_ptr)
+    else:
+        for frame_idx in prange(n_frames, nogil=True, schedule='dynamic'):
+            _assign_frame(frame_idx, confs, refs, ref_Gs, ref_rgs,
+                          ref_distances, N, labels, distances, n_evaluations,
+                          weight_ptr)
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def CalcRMSDRotationalMatrixSequential(const double[:, ::1] ref,
+                                       double ref_G,
+                                       const floating[:, :, ::1] confs,
+                                       int N,
+                                       double[::1] rmsds,
+                                       double[:, ::1] rots,
+                                       double[:, ::1] centroids,
+                                       int[::1] n_iterations,
+                                       const double[::1] weights,
+                                       bint warm_start=True):
+    """
+    Calculate the RMSDs & rotational matrices of a time series of
+    candidate structures against a single reference, one frame after
+    the other.
+
+    With `warm_start` the Newton iteration for the largest eigenvalue
+    of each frame starts from the converged eigenvalue of the previous
+    frame (scaled by the ratio of their E0) instead of E0. For
+    consecutive frames of a trajectory the eigenvalues are close so
+    fewer iterations are needed. If this converges to a smaller
+    eigenvalue the frame is restarted from E0, so the results are
+    the same either way.
+
+    Parameters
+    ----------
+    ref : memoryview, float64
+        reference structure coordinates, must already be centered
+    ref_G : float
+        (weighted) self inner product of the centered reference
+    confs : memoryview, float64 or float32
+        candidate structures in order, shape (n_frames, N, 3), centered
+        internally
+    N : int
+        size of the system
+    rmsds : memoryview, float64
+        array of shape (n_frames,) to store the RMSDs in
+    rots : memoryview, float64 (optional)
+        array of shape (n_frames, 9) to store the flat rotation
+        matrices in. If None, only the RMSDs are computed.
+    centroids : memoryview, float64 (optional)
+        array of shape (n_frames, 3) to store the centroids of the
+        candidate structures in.
+    n_iterations : memoryview, int32
+        array of shape (n_frames,) to store the number of Newton
+        iterations of each frame in
+    weights : memoryview, float64 (optional)
+        weights for each component
+    warm_start : bool (optional)
+        whether to start from the previous frame's eigenvalue
+    """
+
+    cdef Py_ssize_t frame_idx
+    cdef Py_ssize_t n_frames = confs.shape[0]
+    cdef double A[9]
+    cdef double centroid[3]
+    cdef double G, E0, guess
+    cdef double eigenvalue = 0.0
+    cdef double prev_E0 = 0.0
+    cdef double *rot_ptr = NULL
+    cdef const double *weight_ptr = NULL
+
+    if weights is not None:
+        weight_ptr = &weights[0]
+
+    with nogil:
+        for frame_idx in range(n_frames):
+
+            G = _centered_inner_product(A, confs[frame_idx], ref, N,
+                                        weight_ptr, centroid)
+            E0 = 0.5 * (G + ref_G)
+
+            if warm_start and frame_idx > 0 and prev_E0 > 0.0:
+                guess = eigenvalue * (E0 / prev_E0)
+            else:
+                guess = E0
+
+            if rots is not None:
+                rot_ptr = &rots[frame_idx, 0]
+
+            rmsds[frame_idx] = _fast_calc_rmsd_and_rotation_guess(
+                rot_ptr, NULL, A, E0, N, guess, &n_iterations[frame_idx], &eigenvalue)
+
+            prev_E0 = E0
+
+            if centroids is not None:
+                centroids[frame_idx, 0] = centroid[0]
+                centroids[frame_idx, 1] = centroid[1]
+                centroids[frame_idx, 2] = centroid[2]
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef double _indexed_centered_inner_product(double *A,
+                                            const floating[:, ::1] conf,
+                                            const Py_ssize_t[::1] atom_idxs,
+                                            const double[:, ::1] ref,
+                                            int N,
+                                            const double *weight,
+                                            double *centroid) noexcept nogil:
+    """As `_centered_inner_product` but for the atoms `atom_idxs` of
+    a full candidate structure, so that the subset does not have to
+    be copied out beforehand."""
+
+    cdef unsigned int i
+    cdef Py_ssize_t atom_idx
+    cdef double x1, y1, z1, x2, y2, z2, w
+    cdef double cx = 0.0
+    cdef double cy = 0.0
+    cdef double cz = 0.0
+    cdef double total_weight = 0.0
+    cdef double G = 0.0
+
+    A[0] = A[1] = A[2] = A[3] = A[4] = A[5] = A[6] = A[7] = A[8] = 0.0
+
+    for i in range(N):
+        atom_idx = atom_idxs[i]
+
+        if weight != NULL:
+            w = weight[i]
+        else:
+            w = 1.0
+
+        cx += w * conf[atom_idx, 0]
+        cy += w * conf[atom_idx, 1]
+        cz += w * conf[atom_idx, 2]
+        total_weight += w
+
+    cx /= total_weight
+    cy /= total_weight
+    cz /= total_weight
+
+    centroid[0] = cx
+    centroid[1] = cy
+    centroid[2] = cz
+
+    for i in range(N):
+        atom_idx = atom_idxs[i]
+
+        x2 = conf[atom_idx, 0] - cx
+        y2 = conf[atom_idx, 1] - cy
+        z2 = conf[atom_idx, 2] - cz
+
+        if weight != NULL:
+            w = weight[i]
+        else:
+            w = 1.0
+
+        x1 = w * x2
+        y1 = w * y2
+        z1 = w * z2
+
+        G += x1 * x2 + y1 * y2 + z1 * z2
+
+        A[0] +=  (x1 * ref[i, 0])
+        A[1] +=  (x1 * ref[i, 1])
+        A[2] +=  (x1 * ref[i, 2])
+
+        A[3] +=  (y1 * ref[i, 0])
+        A[4] +=  (y1 * ref[i, 1])
+        A[5] +=  (y1 * ref[i, 2])
+
+        A[6] +=  (z1 * ref[i, 0])
+        A[7] +=  (z1 * ref[i, 1])
+        A[8] +=  (z1 * ref[i, 2])
+
+    return G
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef void _selections_frame(Py_ssize_t frame_idx,
+                            const double[:, ::1] ref,
+                            double ref_G,
+                            const double[:, ::1] full_ref,
+                            const floating[:, :, ::1] confs,
+                            const Py_ssize_t[::1] align_idxs,
+                            const Py_ssize_t[::1] selection_idxs,
+                            const Py_ssize_t[::1] selection_offsets,
+                            int N,
+                            double[::1] align_rmsds,
+                            double[:, ::1] rmsds,
+                            const double *weight) noexcept nogil:
+    """Align a single frame and compute the RMSD of each selection of
+    it after superposition."""
+
+    cdef Py_ssize_t sel_idx, k, atom_idx
+    cdef Py_ssize_t n_selections = selection_offsets.shape[0] - 1
+    cdef double A[9]
+    cdef double rot[9]
+    cdef double centroid[3]
+    cdef double G, x, y, z, dx, dy, dz, total
+
+    G = _indexed_centered_inner_product(A, confs[frame_idx], align_idxs,
+                                        ref, N, weight, centroid)
+
+    align_rmsds[frame_idx] = _fast_calc_rmsd_and_rotation(rot, A,
+                                                          0.5 * (G + ref_G), N)
+
+    for sel_idx in range(n_selections):
+        total = 0.0
+
+        for k in range(selection_offsets[sel_idx], selection_offsets[sel_idx + 1]):
+            atom_idx = selection_idxs[k]
+
+            x = confs[frame_idx, atom_idx, 0] - centroid[0]
+            y = confs[frame_idx, atom_idx, 1] - centroid[1]
+            z = confs[frame_idx, atom_idx, 2] - centroid[2]
+
+            # the rotation is applied as coords @ rot
+            dx = x * rot[0] + y * rot[3] + z * rot[6] - full_ref[atom_idx, 0]
+            dy = x * rot[1] + y * rot[4] + z * rot[7] - full_ref[atom_idx, 1]
+            dz = x * rot[2] + y * rot[5] + z * rot[8] - full_ref[atom_idx, 2]
+
+            total += dx * dx + dy * dy + dz * dz
+
+        rmsds[frame_idx, sel_idx] = sqrt(
+            total / (selection_offsets[sel_idx + 1] - selection_offsets[sel_idx]))
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def SelectionRMSDBatch(const double[:, ::1] ref,
+                       double ref_G,
+                       const double[:, ::1] full_ref,
+                       const floating[:, :, ::1] confs,
+                       const Py_ssize_t[::1] align_idxs,
+                       const Py_ssize_t[::1] selection_idxs,
+                       const Py_ssize_t[::1] selection_offsets,
+                       int N,
+                       double[::1] align_rmsds,
+                       double[:, ::1] rmsds,
+                       const double[::1] weights,
+                       int num_threads=0):
+    """
+    Align a stack of full candidate structures to a reference on one
+    subset of atoms and calculate the RMSDs of several other subsets
+    after the superposition, in a single pass over each frame.
+
+    Parameters
+    ----------
+    ref : memoryview, float64
+        aligned subset of the reference structure, must already be
+        centered
+    ref_G : float
+        (weighted) self inner product of the centered aligned subset
+    full_ref : memoryview, float64
+        all atoms of the reference structure, translated by the
+        centroid of the aligned subset, shape (n_atoms, 3)
+    confs : memoryview, float64 or float32
+        full candidate structures, shape (n_frames, n_atoms, 3)
+    align_idxs : memoryview, intp
+        indices of the N atoms to align on
+    selection_idxs : memoryview, intp
+        concatenated atom indices of all the selections
+    selection_offsets : memoryview, intp
+        start of each selection in `selection_idxs` and the end of
+        the last one, shape (n_selections + 1,)
+    N : int
+        size of the aligned subset
+    align_rmsds : memoryview, float64
+        array of shape (n_frames,) to store the RMSDs of the aligned
+        subset in
+    rmsds : memoryview, float64
+        array of shape (n_frames, n_selections) to store the RMSDs of
+        the selections in
+    weights : memoryview, float64 (optional)
+        weights for each component of the aligned subset
+    num_threads : int (optional)
+        number of threads to use, if 0 the OpenMP default is used
+    """
+
+    cdef Py_ssize_t frame_idx
+    cdef Py_ssize_t n_frames = confs.shape[0]
+    cdef const double *weight_ptr = NULL
+
+    if weights is not None:
+        weight_ptr = &weights[0]
+
+    if num_threads > 0:
+        for frame_idx in prange(n_frames, nogil=True, schedule='static',
+                                num_threads=num_threads):
+            _selections_frame(frame_idx, ref, ref_G, full_ref, confs,
+                              align_idxs, selection_idxs, selection_offsets,
+                              N, align_rmsds, rmsds, weight_ptr)
+    else:
+        for frame_idx in prange(n_frames, nogil=True, schedule='static'):
+            _selections_frame(frame_idx, ref, ref_G, full_ref, confs,
+                              align_idxs, selection_idxs, selection_offsets,
+                              N, align_rmsds, rmsds, weight_ptr)
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef void _weighted_frame(Py_ssize_t frame_idx,
+                          const double[:, :, ::1] refs,
+                          const double[:, :, ::1] confs,
+                          const double[:, ::1] weights,
+                          int N,
+                          double[::1] rmsds,
+                          double[:, ::1] rots) noexcept nogil:
+    """Align a single centered frame with its own weights, with the
+    frame as coords1 of the inner product."""
+
+    cdef double A[9]
+    cdef double E0
+
+    E0 = _inner_product[double](A, confs[frame_idx], refs[frame_idx], N,
+                                &weights[frame_idx, 0])
+    rmsds[frame_idx] = _fast_calc_rmsd_and_rotation(&rots[frame_idx, 0], A, E0, N)
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def WeightedRMSDRotationalMatrixBatch(const double[:, :, ::1] refs,
+                                      const double[:, :, ::1] confs,
+                                      const double[:, ::1] weights,
+                                      int N,
+                                      double[::1] rmsds,
+                                      double[:, ::1] rots,
+                                      int num_threads=0):
+    """
+    Calculate the RMSDs & rotational matrices of a stack of candidate
+    structures, each against its own copy of the reference with its
+    own weights.
+
+    Each structure is aligned with the weighted inner product of
+    :func:`InnerProduct`. As the weights differ, the reference has to
+    be centered on the weighted centroid for each structure
+    separately, so the centered copies are given.
+
+    Parameters
+    ----------
+    refs : memoryview, float64
+        the reference centered with the weights of each structure,
+        shape (n_frames, N, 3)
+    confs : memoryview, float64
+        candidate structures centered on their weighted centroids,
+        shape (n_frames, N, 3)
+    weights : memoryview, float64
+        weights of each component for each structure, shape
+        (n_frames, N)
+    N : int
+        size of the system
+    rmsds : memoryview, float64
+        array of shape (n_frames,) to store the weighted RMSDs in
+    rots : memoryview, float64
+        array of shape (n_frames, 9) to store the flat rotation
+        matrices in
+    num_threads : int (optional)
+        number of threads to use, if 0 the OpenMP default is used
+    """
+
+    cdef Py_ssize_t frame_idx
+    cdef Py_ssize_t n_frames = confs.shape[0]
+
+    if num_threads > 0:
+        for frame_idx in prange(n_frames, nogil=True, schedule='static',
+                                num_threads=num_threads):
+            _weighted_frame(frame_idx, refs, confs, weights, N, rmsds, rots)
+    else:
+        for frame_idx in prange(n_frames, nogil=True, schedule='static'):
+            _weighted_frame(frame_idx, refs, confs, weights, N, rmsds, rots)
@@ -36,3 +36,127 @@ def calc_rmsd(ref_coords, coords, idxs=None):
 
     return rmsd
 
+def _reuse_buffer(buffer, shape, dtype):
+    """Return `buffer` if it can hold an array of `shape` and `dtype`
+    (as a view of its first `shape[0]` elements), otherwise a new,
+    larger buffer. Used to avoid allocations for every chunk of a
+    stream of frames."""
+
+    if (buffer is None or
+        buffer.dtype != dtype or
+        buffer.shape[1:] != tuple(shape[1:]) or
+        buffer.shape[0] < shape[0]):
+
+        buffer = np.empty(shape, dtype=dtype)
+
+    return buffer
+
+def _gather(coords, idxs, buffer):
+    """Take the atoms `idxs` of a stack of frames into a reusable
+    buffer of the same dtype as the frames. Returns the gathered
+    frames and the (possibly new) buffer."""
+
+    shape = (coords.shape[0], idxs.shape[0]) + coords.shape[2:]
+    buffer = _reuse_buffer(buffer, shape, coords.dtype)
+    gathered = buffer[:coords.shape[0]]
+
+    # the idxs are checked beforehand, 'clip' avoids an extra buffer
+    np.take(coords, idxs, axis=1, out=gathered, mode='clip')
+
+    return gathered, buffer
+
+def iter_calc_rmsd(ref_coords, chunks, idxs=None):
+    """Calculate the RMSD (without superposition, as `calc_rmsd`) of
+    each frame in a stream of chunks of frames to the reference
+    coordinates.
+
+    All intermediate arrays are reused between chunks, so after the
+    largest chunk has been seen no memory is allocated.
+
+    Parameters
+    ----------
+
+    ref_coords : arraylike of shape (n_atoms, 3)
+        The refence coordinates.
+
+    chunks : iterable of arraylike of shape (chunk_n_frames, n_atoms, 3)
+        The frames in chunks, e.g. slices of an h5py dataset or
+        blocks of a memory-mapped array.
+
+    idxs : arraylike of int, optional
+        Indices of the atoms in the coords to actually compute the
+        RMSD for.
+       (Default = None)
+
+    Yields
+    ------
+
+    rmsds : arraylike of shape (chunk_n_frames,)
+        The RMSDs for the frames of each chunk. This is a view of an
+        internal buffer that is overwritten by the next chunk, so copy
+        it if you need to keep it.
+
+    """
+
+    assert len(ref_coords.shape) == 2 and ref_coords.shape[1] == 3, \
+        "Reference coordinates should be of shape (n_atoms, 3)"
+
+    n_atoms = ref_coords.shape[0]
+
+    if idxs is not None:
+        idxs = np.asarray(idxs)
+        # make sure the idxs are valid since they are not checked
+        # when gathering
+        ref_coords = ref_coords[idxs]
+        idxs = np.arange(n_atoms)[idxs]
+
+    ref_coords = np.asarray(ref_coords, dtype=np.float64)
+    n_idxs = ref_coords.shape[0]
+
+    gather_buffer = None
+    diff_buffer = None
+    rmsd_buffer = None
+
+    for chunk in chunks:
+
+        chunk = np.asarray(chunk)
+
+        assert len(chunk.shape) == 3 and chunk.shape[1:] == (n_atoms, 3), \
+            "chunks should be of shape (chunk_n_frames, n_atoms, 3)"
+
+        n_frames = chunk.shape[0]
+
+        diff_buffer = _reuse_buffer(diff_buffer, (n_frames, n_idxs, 3),
+                                    np.float64)
+        rmsd_buffer = _reuse_buffer(rmsd_buffer, (n_frames,), np.float64)
+
+        diff = diff_buffer[:n_frames]
+        rmsds = rmsd_buffer[:n_frames]
+
+        if idxs is not None:
+            chunk, gather_buffer = _gather(chunk, idxs, gather_buffer)
+
+        np.subtract(chunk, ref_coords, out=diff)
+
+        np.square(diff, out=diff)
+        np.sum(diff, axis=(1, 2), out=rmsds)
+        np.divide(rmsds, n_idxs, out=rmsds)
+        np.sqrt(rmsds, out=rmsds)
+
+        yield rmsds
+
+def calc_rmsd_chunks(ref_coords, chunks, idxs=None):
+    """Calculate the RMSD (without superposition, as `calc_rmsd`) of
+    all frames in a stream of chunks of frames, see `iter_calc_rmsd`.
+
+    Returns
+    -------
+
+    rmsds : arraylike of shape (n_frames,)
+        The RMSDs of all frames concatenated.
+
+    """
+
+    return np.concatenate([np.copy(rmsds) for rmsds
+                           in iter_calc_rmsd(ref_coords, chunks, idxs=idxs)] +
+                          [np.zeros((0,))])
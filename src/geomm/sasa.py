@@ -44,9 +44,181 @@
 # USE OR OTHER DEALINGS IN THE SOFTWARE.
 ##############################################################################
 
-def shrake_rupley(coords, radii, probe_radius=0.14, n_sphere_points=960):
+"""Solvent accessible surface areas (SASA) of atoms.
+
+"""
+
+import os
+import functools
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from geomm.neighbors import neighbor_pairs
+from geomm._sasa import NeighborLists, AtomAreas, AtomBurial, LCPOTerms
+
+def _golden_spiral_points(n_points):
+    """Points evenly distributed on the unit sphere with the golden
+    section spiral.
+
+    Parameters
+    ----------
+
+    n_points : int
+        The number of points.
+
+    Returns
+    -------
+
+    points : arraylike of shape (n_points, 3)
+
+    """
+
+    inc = np.pi * (3 - np.sqrt(5))
+    offset = 2.0 / n_points
+
+    k = np.arange(n_points)
+    y = k * offset - 1.0 + (offset / 2.0)
+    r = np.sqrt(1.0 - y * y)
+    phi = k * inc
+
+    return np.stack([np.cos(phi) * r, y, np.sin(phi) * r], axis=1)
+
+@functools.lru_cache(maxsize=128)
+def _unit_sphere_points(n_points):
+    """The read-only golden section spiral points on the unit sphere,
+    cached by the number of points (the least recently used are
+    evicted)."""
+
+    points = _golden_spiral_points(n_points)
+    points.flags.writeable = False
+
+    return points
+
+def sphere_points(n_points, radius=1.0):
+    """The golden section spiral points on a sphere of a radius
+    centered at the origin.
+
+    Only the unit meshes (which the kernels use) are cached, so
+    repeated calls on many small frames do not regenerate them. They
+    are shared between the callers so they are read-only, the meshes
+    of other radii are new arrays.
+
+    Parameters
+    ----------
+
+    n_points : int
+        The number of points.
+
+    radius : float, optional
+        The radius of the sphere.
+       (Default = 1.0)
+
+    Returns
+    -------
+
+    points : arraylike of shape (n_points, 3)
+
+    """
+
+    points = _unit_sphere_points(n_points)
+
+    if radius != 1.0:
+        points = radius * points
+
+    return points
+
+def _neighbor_lists(coords, radii, skin=0.0):
+    """The atoms whose spheres overlap with each atom's sphere, in a
+    compressed (CSR) form.
+
+    Parameters
+    ----------
+
+    coords : arraylike of shape (n_atoms, 3)
+
+    radii : arraylike of shape (n_atoms,)
+        The radii of the spheres.
+
+    skin : float, optional
+        Also include the atoms whose spheres are within this distance
+        of overlapping.
+       (Default = 0.0)
+
+    Returns
+    -------
+
+    neighbor_starts : arraylike of int of shape (n_atoms + 1,)
+        The neighbors of atom i are neighbor_idxs[neighbor_starts[i]:neighbor_starts[i+1]]
+
+    neighbor_idxs : arraylike of int
+
+    neighbor_distances : arraylike
+        The distance to each neighbor, in the order of neighbor_idxs.
+
     """
 
+    n_atoms = coords.shape[0]
+
+    pairs, distances = neighbor_pairs(coords, 2 * radii.max() + skin)
+
+    # only the spheres that actually overlap
+    overlap = distances < radii[pairs[:, 0]] + radii[pairs[:, 1]] + skin
+    pairs = pairs[overlap]
+    distances = distances[overlap]
+
+    neighbor_starts = np.empty((n_atoms + 1,), dtype=np.intp)
+    neighbor_idxs = np.empty((2 * pairs.shape[0],), dtype=np.intp)
+    neighbor_distances = np.empty((2 * pairs.shape[0],))
+    NeighborLists(np.ascontiguousarray(pairs), np.ascontiguousarray(distances, dtype=np.float64),
+                  neighbor_starts, neighbor_idxs, neighbor_distances)
+
+    return neighbor_starts, neighbor_idxs, neighbor_distances
+
+def _frame_areas(coords, radii, unit_points, out, num_threads=0):
+    """The accessible area of each atom in a single frame."""
+
+    neighbor_starts, neighbor_idxs, _ = _neighbor_lists(coords, radii)
+
+    AtomAreas(coords, radii, unit_points, neighbor_starts, neighbor_idxs, out,
+              num_threads=num_threads)
+
+    return out
+
+def shrake_rupley(coords, radii, probe_radius=0.14, n_sphere_points=960):
+    """Compute the solvent accessible surface area of each atom with the
+    Shrake-Rupley algorithm.
+
+    The atoms each sphere point is tested against are restricted to
+    those whose spheres overlap it, found with a neighbor search (see
+    `geomm.neighbors`), so the cost grows linearly with the number of
+    atoms.
+
+    Parameters
+    ----------
+
+    coords : arraylike of shape (n_atoms, 3) or (n_frames, n_atoms, 3)
+        The coordinates of a single frame or a stack of frames.
+
+    radii : arraylike of shape (n_atoms,)
+        The van der Waals radius of each atom, in the same units as
+        the coordinates.
+
+    probe_radius : float, optional
+        The radius of the solvent probe.
+       (Default = 0.14)
+
+    n_sphere_points : int, optional
+        The number of points on the sphere of each atom, more points
+        give more accurate areas.
+       (Default = 960)
+
+    Returns
+    -------
+
+    areas : arraylike of shape (n_atoms,) or (n_frames, n_atoms)
+        The solvent accessible area of each atom (for each frame).
 
     Notes
     -----
@@ -71,16 +243,576 @@ def shrake_rupley(coords, radii, probe_radius=0.14, n_sphere_points=960):
     points on the sphere, which is based on an icosahedral tesselation.
     roughly, the icosahedral tesselation works something like this
     http://www.ziyan.info/2008/11/sphere-tessellation-using-icosahedron.html
+
     References
     ----------
     .. [1] Shrake, A; Rupley, JA. (1973) J Mol Biol 79 (2): 351--71.
 
     """
 
-    # the code needs to be moved over from mdtraj in a distilled form
+    coords = np.asarray(coords)
+    assert coords.shape[-1] == 3 and len(coords.shape) in (2, 3), \
+        "coords should be of shape (n_atoms, 3) or (n_frames, n_atoms, 3)"
+
+    if coords.dtype not in (np.float32, np.float64):
+        coords = coords.astype(np.float64)
+
+    radii = np.asarray(radii, dtype=np.float64)
+    assert radii.shape == (coords.shape[-2],), \
+        "There should be a radius for each atom"
+
+    # the spheres are at the radius of the probe center
+    radii = radii + probe_radius
+
+    unit_points = sphere_points(n_sphere_points)
+
+    if len(coords.shape) == 2:
+        return _frame_areas(np.ascontiguousarray(coords), radii, unit_points,
+                            np.zeros((coords.shape[0],)))
+
+    areas = np.zeros(coords.shape[:2])
+    for frame_idx in range(coords.shape[0]):
+        _frame_areas(np.ascontiguousarray(coords[frame_idx]), radii, unit_points,
+                     areas[frame_idx])
+
+    return areas
+
+# the LCPO parameters of an sp3 carbon with two heavy atom neighbors
+# from Weiser et al. (1999), with P4 converted from 1/A^2 to 1/nm^2
+LCPO_DEFAULT_PARAMETERS = np.array([0.56482, -0.19608, -0.0010219, 0.02658])
+
+def _lcpo_terms(coords, radii):
+    """The four terms of the LCPO area of each atom, for a stack of
+    frames.
+
+    Parameters
+    ----------
+
+    coords : arraylike of shape (n_frames, n_atoms, 3)
+
+    radii : arraylike of shape (n_atoms,)
+        The radii of the spheres (including the probe radius).
+
+    Returns
+    -------
+
+    terms : arraylike of shape (n_frames, n_atoms, 4)
+
+    """
+
+    n_frames, n_atoms = coords.shape[:2]
+
+    # the frames are computed together as one system with the atom
+    # indices of each frame offset
+    starts = [np.zeros((1,), dtype=np.intp)]
+    idxs = []
+    overlaps = []
+    n_neighbors = 0
+    for frame_idx in range(n_frames):
+        neighbor_starts, neighbor_idxs, d = _neighbor_lists(coords[frame_idx], radii)
+        atom_idxs = np.repeat(np.arange(n_atoms), np.diff(neighbor_starts))
+
+        # the area of the sphere of each atom buried by each neighbor
+        r_i = radii[atom_idxs]
+        r_j = radii[neighbor_idxs]
+        overlap = np.pi * r_i * (2 * r_i - d - (r_i**2 - r_j**2) / d)
+        overlaps.append(np.clip(overlap, 0.0, 4.0 * np.pi * r_i**2))
+
+        starts.append(neighbor_starts[1:] + n_neighbors)
+        idxs.append(neighbor_idxs + frame_idx * n_atoms)
+        n_neighbors += neighbor_idxs.shape[0]
+
+    terms = np.empty((n_frames * n_atoms, 4))
+    LCPOTerms(np.tile(radii, n_frames), np.concatenate(starts), np.concatenate(idxs),
+              np.concatenate(overlaps), terms)
+
+    return terms.reshape((n_frames, n_atoms, 4))
+
+def lcpo(coords, radii, probe_radius=0.14, parameters=None):
+    """Estimate the solvent accessible surface area of each atom with
+    the analytical LCPO (linear combination of pairwise overlaps)
+    approximation.
+
+    This is much cheaper than `shrake_rupley` but only approximate,
+    its accuracy depends on the parameters, which can be fit to the
+    Shrake-Rupley areas of a similar system with
+    `fit_lcpo_parameters`. With the generic `LCPO_DEFAULT_PARAMETERS`
+    the total area of a protein is typically off by 20-25% (about 23%
+    for lysozyme), so fit parameters should be given whenever the
+    areas matter. The frames of a stack are computed together in a
+    single call of the compiled kernel.
+
+    Parameters
+    ----------
+
+    coords : arraylike of shape (n_atoms, 3) or (n_frames, n_atoms, 3)
+        The coordinates of a single frame or a stack of frames, in nm.
+
+    radii : arraylike of shape (n_atoms,)
+        The van der Waals radius of each atom, in nm.
+
+    probe_radius : float, optional
+        The radius of the solvent probe.
+       (Default = 0.14)
+
+    parameters : arraylike of shape (4,) or (n_atoms, 4), optional
+        The LCPO parameters P1 to P4 for all the atoms or for each
+        atom. If None `LCPO_DEFAULT_PARAMETERS` are used and a
+        warning is raised.
+       (Default = None)
+
+    Returns
+    -------
+
+    areas : arraylike of shape (n_atoms,) or (n_frames, n_atoms)
+        The estimated solvent accessible area of each atom.
+
+    References
+    ----------
+
+    .. [1] Weiser, J; Shenkin, PS; Still, WC. (1999) J Comput Chem 20 (2): 217--30.
+
+    """
+
+    coords = np.asarray(coords, dtype=np.float64)
+    assert coords.shape[-1] == 3 and len(coords.shape) in (2, 3), \
+        "coords should be of shape (n_atoms, 3) or (n_frames, n_atoms, 3)"
+
+    single_frame = len(coords.shape) == 2
+    if single_frame:
+        coords = coords[np.newaxis]
+
+    radii = np.asarray(radii, dtype=np.float64)
+    assert radii.shape == (coords.shape[1],), \
+        "There should be a radius for each atom"
+
+    if parameters is None:
+        warnings.warn('No LCPO parameters were given, the default parameters '
+                      'typically give areas off by 20-25%. Fit parameters with '
+                      'fit_lcpo_parameters for accurate areas.')
+        parameters = LCPO_DEFAULT_PARAMETERS
+
+    parameters = np.broadcast_to(np.asarray(parameters, dtype=np.float64),
+                                 (coords.shape[1], 4))
+
+    terms = _lcpo_terms(coords, radii + probe_radius)
+
+    areas = np.clip(np.einsum('fak,ak->fa', terms, parameters), 0.0, None)
+
+    if single_frame:
+        return areas[0]
+
+    return areas
+
+def fit_lcpo_parameters(coords, radii, areas, probe_radius=0.14, atom_types=None):
+    """Fit the LCPO parameters to reference areas (e.g. from
+    `shrake_rupley`) by linear least squares.
+
+    Parameters
+    ----------
+
+    coords : arraylike of shape (n_atoms, 3) or (n_frames, n_atoms, 3)
+        The coordinates of the frames to fit to.
+
+    radii : arraylike of shape (n_atoms,)
+        The van der Waals radius of each atom.
+
+    areas : arraylike of shape (n_atoms,) or (n_frames, n_atoms)
+        The reference areas of the atoms.
+
+    probe_radius : float, optional
+        The radius of the solvent probe.
+       (Default = 0.14)
+
+    atom_types : arraylike of int of shape (n_atoms,), optional
+        A type index for each atom, separate parameters are fit for
+        each type. If None one set is fit for all atoms.
+       (Default = None)
+
+    Returns
+    -------
+
+    parameters : arraylike of shape (4,) or (n_atoms, 4)
+        The fit parameters, for each atom if atom types were given.
+
+    """
+
+    coords = np.asarray(coords, dtype=np.float64)
+    if len(coords.shape) == 2:
+        coords = coords[np.newaxis]
+
+    n_frames, n_atoms = coords.shape[:2]
+
+    radii = np.asarray(radii, dtype=np.float64)
+    areas = np.reshape(areas, (n_frames, n_atoms))
+
+    terms = _lcpo_terms(coords, radii + probe_radius)
+
+    if atom_types is None:
+        return np.linalg.lstsq(terms.reshape((-1, 4)), areas.ravel(), rcond=None)[0]
+
+    atom_types = np.asarray(atom_types)
+    parameters = np.zeros((n_atoms, 4))
+    for atom_type in np.unique(atom_types):
+        type_idxs = np.flatnonzero(atom_types == atom_type)
+        parameters[type_idxs] = np.linalg.lstsq(terms[:, type_idxs].reshape((-1, 4)),
+                                                areas[:, type_idxs].ravel(),
+                                                rcond=None)[0]
+
+    return parameters
+
+def sasa(coords, radii, probe_radius=0.14, method='shrake_rupley', n_sphere_points=960,
+         lcpo_parameters=None):
+    """Compute the solvent accessible surface area of each atom.
+
+    Parameters
+    ----------
+
+    coords : arraylike of shape (n_atoms, 3) or (n_frames, n_atoms, 3)
+        The coordinates of a single frame or a stack of frames.
+
+    radii : arraylike of shape (n_atoms,)
+        The van der Waals radius of each atom.
+
+    probe_radius : float, optional
+        The radius of the solvent probe.
+       (Default = 0.14)
+
+    method : str, optional
+        Either 'shrake_rupley' for the numerical areas (see
+        `shrake_rupley`) or 'lcpo' for the faster analytical estimate
+        (see `lcpo`). Without `lcpo_parameters` the 'lcpo' areas are
+        typically off by 20-25%.
+       (Default = 'shrake_rupley')
+
+    n_sphere_points : int, optional
+        The number of sphere points, for 'shrake_rupley'.
+       (Default = 960)
+
+    lcpo_parameters : arraylike of shape (4,) or (n_atoms, 4), optional
+        The LCPO parameters, for 'lcpo', e.g. from
+        `fit_lcpo_parameters`. If None the defaults are used with a
+        warning.
+       (Default = None)
+
+    Returns
+    -------
+
+    areas : arraylike of shape (n_atoms,) or (n_frames, n_atoms)
+        The solvent accessible area of each atom (for each frame).
+
+    """
+
+    assert method in ('shrake_rupley', 'lcpo'), \
+        "method should be 'shrake_rupley' or 'lcpo'"
+
+    if method == 'lcpo':
+        return lcpo(coords, radii, probe_radius=probe_radius, parameters=lcpo_parameters)
+
+    return shrake_rupley(coords, radii, probe_radius=probe_radius,
+                         n_sphere_points=n_sphere_points)
+
+def shrake_rupley_traj(coords, radii, probe_radius=0.14, n_sphere_points=960,
+                       out=None, filename=None, num_threads=None):
+    """Compute the solvent accessible surface area of each atom for
+    each frame of a trajectory, with the frames split over a pool of
+    threads.
+
+    The compiled kernel releases the GIL, so the threads work on the
+    same coordinate array without it being copied or pickled, and
+    each frame's areas are written straight into the output. This
+    gives exactly the same areas as `shrake_rupley`.
+
+    Parameters
+    ----------
+
+    coords : arraylike of shape (n_frames, n_atoms, 3)
+        The trajectory.
+
+    radii : arraylike of shape (n_atoms,)
+        The van der Waals radius of each atom.
+
+    probe_radius : float, optional
+        The radius of the solvent probe.
+       (Default = 0.14)
+
+    n_sphere_points : int, optional
+        The number of points on the sphere of each atom.
+       (Default = 960)
+
+    out : arraylike of shape (n_frames, n_atoms), optional
+        A preallocated array to write the areas into.
+       (Default = None)
+
+    filename : str, optional
+        If given the output is created as a memory-mapped float64
+        '.npy' file at this path. Exclusive with `out`.
+       (Default = None)
+
+    num_threads : int, optional
+        The number of threads, if None the number of CPUs.
+       (Default = None)
+
+    Returns
+    -------
+
+    areas : arraylike of shape (n_frames, n_atoms)
+        The areas, this is `out` or the memory-mapped array if either
+        was given.
+
+    """
+
+    assert len(coords.shape) == 3 and coords.shape[2] == 3, \
+        "coords should be a rank 3 array of shape (n_frames, n_atoms, 3)"
+    assert not (out is not None and filename is not None), \
+        "Only one of out or filename can be given"
+
+    n_frames, n_atoms = coords.shape[:2]
+
+    # single precision coordinates are not upcast
+    if coords.dtype == np.float32:
+        coords = np.ascontiguousarray(coords)
+    else:
+        coords = np.ascontiguousarray(coords, dtype=np.float64)
+
+    radii = np.asarray(radii, dtype=np.float64)
+    assert radii.shape == (n_atoms,), \
+        "There should be a radius for each atom"
+
+    radii = radii + probe_radius
+
+    unit_points = sphere_points(n_sphere_points)
+
+    if filename is not None:
+        out = np.lib.format.open_memmap(filename, mode='w+',
+                                        dtype=np.float64, shape=(n_frames, n_atoms))
+    elif out is None:
+        out = np.empty((n_frames, n_atoms), dtype=np.float64)
+
+    assert out.shape == (n_frames, n_atoms), \
+        "out should be of shape {}".format((n_frames, n_atoms))
+
+    # frames can be written into the output directly when it is
+    # float64 and contiguous, otherwise they go through a buffer
+    direct = out.dtype == np.float64 and out.strides[1] == out.itemsize
+
+    def frame_task(frame_idx):
+
+        frame_out = out[frame_idx] if direct else np.empty((n_atoms,))
+
+        # the threads each take whole frames
+        _frame_areas(coords[frame_idx], radii, unit_points, frame_out,
+                     num_threads=1)
+
+        if not direct:
+            out[frame_idx] = frame_out
+
+    if num_threads is None:
+        num_threads = os.cpu_count() or 1
+
+    with ThreadPoolExecutor(max_workers=num_threads) as executor:
+        # consume the results so exceptions are raised here
+        for _ in executor.map(frame_task, range(n_frames)):
+            pass
+
+    return out
+
+class IncrementalSASA(object):
+    """Computes the Shrake-Rupley solvent accessible surface areas of
+    consecutive frames, recomputing only the atoms whose neighborhood
+    changed.
+
+    An atom is recomputed from scratch when it or any of its neighbors
+    has moved more than `tolerance` from its reference position, the
+    other atoms keep their areas. The reference position of an atom is
+    only updated when it has moved, at which point all of its
+    neighbors are recomputed too. The neighbor lists include the atoms
+    within `skin` of overlapping and are only rebuilt when an atom has
+    moved more than half the skin since they were built. Whether each
+    sphere point of the recomputed atoms is buried is kept as a
+    bitmask (see `burial_masks`), for inspection only.
+
+    With a tolerance of 0 the areas are the same as `shrake_rupley`.
+    Otherwise the area of each atom is that of the frame it was last
+    computed for, in which it and its neighbors were within the
+    tolerance of their reference positions, so they are at most twice
+    the tolerance from those positions now.
+
+    Parameters
+    ----------
+
+    radii : arraylike of shape (n_atoms,)
+        The van der Waals radius of each atom.
+
+    probe_radius : float, optional
+        The radius of the solvent probe.
+       (Default = 0.14)
+
+    n_sphere_points : int, optional
+        The number of points on the sphere of each atom.
+       (Default = 960)
+
+    tolerance : float, optional
+        The displacement below which an atom is considered not to have
+        moved.
+       (Default = 0.0)
+
+    skin : float, optional
+        The extra distance included in the neighbor lists.
+       (Default = 0.1)
+
+    num_threads : int, optional
+        Number of OpenMP threads to use, if None the OpenMP default is
+        used.
+       (Default = None)
+
+    Attributes
+    ----------
+
+    areas : arraylike of shape (n_atoms,)
+        The areas of the last frame.
+
+    n_frames : int
+        The number of frames computed.
+
+    n_computed : int
+        The total number of atoms recomputed over all frames.
+
+    n_skipped : int
+        The total number of atoms whose areas were kept over all frames.
+
+    n_neighbor_builds : int
+        The number of times the neighbor lists were built.
+
+    """
+
+    def __init__(self, radii, probe_radius=0.14, n_sphere_points=960, tolerance=0.0,
+                 skin=0.1, num_threads=None):
+
+        assert tolerance >= 0.0, "tolerance can't be negative"
+        assert skin >= 0.0, "skin can't be negative"
+
+        self.radii = np.asarray(radii, dtype=np.float64) + probe_radius
+        self.n_atoms = self.radii.shape[0]
+        self.n_sphere_points = n_sphere_points
+        self.tolerance = tolerance
+        self.skin = skin
+        self.num_threads = 0 if num_threads is None else num_threads
+
+        self._unit_points = sphere_points(n_sphere_points)
+
+        self.reset()
+
+    def reset(self):
+        """Forget the previous frames, the next one is fully computed."""
+
+        self.areas = np.zeros((self.n_atoms,))
+
+        self.n_frames = 0
+        self.n_computed = 0
+        self.n_skipped = 0
+        self.n_neighbor_builds = 0
+
+        self._burial = np.zeros((self.n_atoms, (self.n_sphere_points + 7) // 8),
+                                dtype=np.uint8)
+        self._ref_coords = None
+        self._build_coords = None
+        self._neighbor_starts = None
+        self._neighbor_idxs = None
+
+    @property
+    def burial_masks(self):
+        """Whether each sphere point of each atom was buried when it was
+        last computed, of shape (n_atoms, n_sphere_points)."""
+
+        return np.unpackbits(self._burial, axis=1,
+                             count=self.n_sphere_points).astype(bool)
+
+    @property
+    def skipped_fraction(self):
+        """The fraction of the atoms over all frames that were not
+        recomputed."""
+
+        total = self.n_computed + self.n_skipped
+        return self.n_skipped / total if total > 0 else 0.0
+
+    def _build_neighbors(self, coords):
+
+        self._neighbor_starts, self._neighbor_idxs, _ = _neighbor_lists(
+            coords, self.radii, skin=self.skin)
+        self._build_coords = coords.copy()
+        self.n_neighbor_builds += 1
+
+    def update(self, coords):
+        """Compute the areas of the next frame.
+
+        Parameters
+        ----------
+
+        coords : arraylike of shape (n_atoms, 3)
+            The coordinates of the frame.
+
+        Returns
+        -------
+
+        areas : arraylike of shape (n_atoms,)
+            The solvent accessible area of each atom.
+
+        """
+
+        assert coords.shape == (self.n_atoms, 3), \
+            "coords should be of shape (n_atoms, 3)"
+
+        # single precision coordinates are not upcast
+        if coords.dtype == np.float32:
+            coords = np.ascontiguousarray(coords)
+        else:
+            coords = np.ascontiguousarray(coords, dtype=np.float64)
+
+        if self._ref_coords is None:
+            self._build_neighbors(coords)
+            moved = np.ones((self.n_atoms,), dtype=bool)
+            recompute = moved
+
+        else:
+            neighbor_lists = [(self._neighbor_starts, self._neighbor_idxs)]
+
+            # the lists stay valid until an atom has moved half the skin
+            build_disp2 = np.sum((coords - self._build_coords)**2, axis=1)
+            if np.any(build_disp2 > (0.5 * self.skin)**2):
+                self._build_neighbors(coords)
+                neighbor_lists.append((self._neighbor_starts, self._neighbor_idxs))
+
+            disp2 = np.sum((coords - self._ref_coords)**2, axis=1)
+            moved = disp2 > self.tolerance**2
+
+            # the atoms that moved and the neighbors of those that did,
+            # in the old lists too for neighbors that moved out of them
+            recompute = moved.copy()
+            for starts, idxs in neighbor_lists:
+                owners = np.repeat(np.arange(self.n_atoms), np.diff(starts))
+                recompute[owners[moved[idxs]]] = True
+
+        atom_idxs = np.flatnonzero(recompute)
+
+        buried = np.empty((atom_idxs.shape[0], self.n_sphere_points), dtype=np.uint8)
+        AtomBurial(coords, self.radii, self._unit_points, self._neighbor_starts,
+                   self._neighbor_idxs, atom_idxs, buried,
+                   num_threads=self.num_threads)
+
+        self._burial[atom_idxs] = np.packbits(buried, axis=1)
+
+        radii = self.radii[atom_idxs]
+        n_accessible = self.n_sphere_points - buried.sum(axis=1)
+        self.areas[atom_idxs] = 4.0 * np.pi * radii * radii * n_accessible / self.n_sphere_points
+
+        if self._ref_coords is None:
+            self._ref_coords = coords.copy()
+        else:
+            self._ref_coords[moved] = coords[moved]
 
-    # currently it is implemented in C++ and the build process for
-    # that needs to be figured out
-    raise NotImplementedError
+        self.n_frames += 1
+        self.n_computed += atom_idxs.shape[0]
+        self.n_skipped += self.n_atoms - atom_idxs.shape[0]
 
-    pass
+        return self.areas.copy()
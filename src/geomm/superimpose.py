@@ -1,8 +1,10 @@
 import numpy as np
 
-from geomm.theobald_qcp import theobald_qcp
+from geomm.theobald_qcp import theobald_qcp, QCPReference, _coords_dtype
+from geomm.pyqcprot import SelectionRMSDBatch, WeightedRMSDRotationalMatrixBatch
 from geomm.centering import center
 from geomm.centroid import centroid
+from geomm.transforms import _transform_frames
 
 def superimpose(ref_coords, coords, idxs=None, weights=None):
     """Superimpose a set of coordinates to reference coordinates using the
@@ -69,6 +71,384 @@ def superimpose(ref_coords, coords, idxs=None, weights=None):
 
     return sup_coords, rotation_matrix, qcp_rmsd
 
+def superimpose_traj(ref_coords, coords, idxs=None, weights=None, out=None,
+                     block_size=2**20, num_threads=None):
+    """Superimpose a stack of frames onto reference coordinates using
+    the Theobald-QCP method.
+
+    All the rotations are computed in one batched call (see
+    `QCPReference`) and then applied together with the translations
+    with a batched matrix multiplication writing directly into the
+    output, which can be the input itself to superimpose in place.
+    Each frame is translated so the centroid of its aligned subset
+    is at the origin, rotated, and translated to the centroid of the
+    reference, so the frames do not need to be centered beforehand.
+
+    Parameters
+    ----------
+
+    ref_coords : arraylike of shape (n_atoms, 3)
+        The template coordinates that `coords` will be aligned to.
+
+    coords : arraylike of shape (n_frames, n_atoms, 3)
+        The frames which will be aligned to the template coordinates.
+
+    idxs : arraylike, optional
+        If given will superimpose the coordinates based only on the
+        alignment on this subset of atoms to the reference.
+       (Default = None)
+
+    weights : arraylike, optional
+        Give weights to the coordinates for a weighted centroid
+        ('center of mass') and alignment.
+       (Default = None)
+
+    out : arraylike of shape (n_frames, n_atoms, 3), optional
+        Array to write the superimposed coordinates into. Can be
+        `coords` itself to superimpose in place. If None a new float64
+        array is allocated.
+       (Default = None)
+
+    block_size : int, optional
+        When superimposing in place, the number of coordinates
+        (atoms times frames) transformed at a time through a temporary
+        buffer.
+       (Default = 2**20)
+
+    num_threads : int, optional
+        Number of OpenMP threads for computing the rotations.
+       (Default = None)
+
+    Returns
+    -------
+
+    superimposed_coords : arraylike of shape (n_frames, n_atoms, 3)
+        The transformed coordinates, this is `out` if it was given.
+
+    rotation_matrices : arraylike of shape (n_frames, 3, 3)
+        The rotation matrices from Theobald-QCP that minimized the RMSD
+
+    qcp_rmsds : arraylike of shape (n_frames,)
+        The RMSDs calculated from Theobald-QCP.
+
+    """
+
+    assert len(coords.shape) == 3, \
+        "coords should be a rank 3 array of shape (n_frames, n_atoms, 3)"
+
+    reference = QCPReference(ref_coords, idxs=idxs, weights=weights)
+
+    qcp_rmsds, rotation_matrices, centroids = reference._align(coords,
+                                                               num_threads=num_threads)
+
+    if out is None:
+        out = np.empty(coords.shape, dtype=np.float64)
+
+    assert out.shape == coords.shape, \
+        "out must be the same shape as coords"
+
+    # (x - c) R + c_ref = x R + (c_ref - c R), so the translations are
+    # applied after the rotation without a centered copy of the frames
+    translations = reference.centroid - np.matmul(centroids[:, np.newaxis, :],
+                                                  rotation_matrices)
+
+    _transform_frames(coords, rotation_matrices, translations, out,
+                      block_size=block_size)
+
+    return out, rotation_matrices, qcp_rmsds
+
+def superimpose_rmsds(ref_coords, coords, selections, idxs=None, weights=None,
+                      num_threads=None):
+    """Superimpose frames onto reference coordinates on one subset of
+    atoms and calculate the RMSD of each of several other subsets of
+    atoms after the superposition.
+
+    This gives the same RMSDs as `superimpose` followed by `calc_rmsd`
+    for each selection, but the frames are only read once and no
+    copies of the superimposed coordinates or the selections are made:
+    the atom indices of all the selections are concatenated once and
+    each frame is aligned and measured in a single pass.
+
+    Parameters
+    ----------
+
+    ref_coords : arraylike of shape (n_atoms, 3)
+        The template coordinates that `coords` will be aligned to.
+
+    coords : arraylike of shape (n_atoms, 3) or (n_frames, n_atoms, 3)
+        A single frame or a stack of frames which will be aligned to
+        the template coordinates. They do not need to be centered.
+
+    selections : list of arraylike of int
+        The atom indices (or boolean masks) of each subset to
+        calculate the RMSD of.
+
+    idxs : arraylike, optional
+        The atoms to superimpose the coordinates on. If None all atoms
+        are used.
+       (Default = None)
+
+    weights : arraylike, optional
+        Weights of the atoms in `idxs` for the alignment.
+       (Default = None)
+
+    num_threads : int, optional
+        Number of OpenMP threads to use.
+       (Default = None)
+
+    Returns
+    -------
+
+    rmsds : arraylike of shape (n_selections,) or (n_frames, n_selections)
+        The RMSD of each selection after superposition.
+
+    qcp_rmsds : float or arraylike of shape (n_frames,)
+        The RMSDs of the aligned atoms calculated from Theobald-QCP.
+
+    """
+
+    single_frame = len(coords.shape) == 2
+    if single_frame:
+        coords = coords[np.newaxis]
+
+    assert len(coords.shape) == 3, \
+        "coords should be of shape (n_atoms, 3) or (n_frames, n_atoms, 3)"
+
+    reference = QCPReference(ref_coords, idxs=idxs, weights=weights)
+
+    assert coords.shape[1] == reference.n_atoms, \
+        "Number of coordinates are not the same"
+
+    atom_idxs = np.arange(reference.n_atoms)
+
+    if reference.idxs is not None:
+        align_idxs = np.ascontiguousarray(reference.idxs, dtype=np.intp)
+    else:
+        align_idxs = atom_idxs
+
+    # the gather indices of all the selections, selection i is
+    # selection_idxs[offsets[i]:offsets[i+1]]
+    selections = [atom_idxs[selection] for selection in selections]
+    assert all(selection.shape[0] > 0 for selection in selections), \
+        "Selections must not be empty"
+
+    selection_offsets = np.zeros((len(selections) + 1,), dtype=np.intp)
+    selection_offsets[1:] = np.cumsum([selection.shape[0] for selection in selections])
+    if len(selections) > 0:
+        selection_idxs = np.concatenate(selections).astype(np.intp)
+    else:
+        selection_idxs = np.zeros((0,), dtype=np.intp)
+
+    # the reference in the frame of the centered alignment atoms
+    full_ref = np.ascontiguousarray(np.asarray(ref_coords, dtype=np.float64)
+                                    - reference.centroid)
+
+    coords = np.ascontiguousarray(coords, dtype=_coords_dtype(coords))
+
+    n_frames = coords.shape[0]
+    qcp_rmsds = np.empty((n_frames,), dtype=np.float64)
+    rmsds = np.empty((n_frames, len(selections)), dtype=np.float64)
+
+    if num_threads is None:
+        num_threads = 0
+
+    SelectionRMSDBatch(reference.coords, reference.G, full_ref, coords,
+                       align_idxs, selection_idxs, selection_offsets,
+                       reference.n_coords, qcp_rmsds, rmsds, reference.weights,
+                       num_threads=num_threads)
+
+    if single_frame:
+        return rmsds[0], qcp_rmsds[0]
+
+    return rmsds, qcp_rmsds
+
+def robust_superimpose_traj(ref_coords, coords, idxs=None, sigma=None,
+                            tol=1e-3, max_iterations=20, out=None,
+                            num_threads=None):
+    """Superimpose a stack of frames onto reference coordinates with
+    Gaussian weights that down-weight the atoms that deviate from the
+    reference, so that the frames are aligned on their rigid core.
+
+    Starting from uniform weights, each frame is aligned with the
+    weighted Theobald-QCP method and the weight of each atom is set
+    to exp(-d**2 / (2 sigma**2)) where d is the distance of the atom
+    from the reference after the superposition (less than that of
+    the closest atom). This is repeated until the weights of a frame
+    change less than `tol`, frames that have converged are not aligned
+    again. All the frames of an iteration are aligned in one batched
+    call.
+
+    Parameters
+    ----------
+
+    ref_coords : arraylike of shape (n_atoms, 3)
+        The template coordinates that `coords` will be aligned to.
+
+    coords : arraylike of shape (n_frames, n_atoms, 3)
+        The frames which will be aligned to the template coordinates.
+        They do not need to be centered.
+
+    idxs : arraylike, optional
+        If given will superimpose the coordinates based only on the
+        alignment on this subset of atoms to the reference.
+       (Default = None)
+
+    sigma : float, optional
+        The width of the Gaussian weights in the units of the
+        coordinates. The width starts at the RMSD of each frame after
+        the unweighted alignment and is halved every iteration until
+        it reaches sigma. If None, the initial width is kept.
+       (Default = None)
+
+    tol : float, optional
+        The largest change of any weight of a frame for it to be
+        converged.
+       (Default = 1e-3)
+
+    max_iterations : int, optional
+        The maximum number of reweighted alignments of a frame.
+       (Default = 20)
+
+    out : arraylike of shape (n_frames, n_atoms, 3), optional
+        Array to write the superimposed coordinates into. Can be
+        `coords` itself to superimpose in place. If None a new float64
+        array is allocated.
+       (Default = None)
+
+    num_threads : int, optional
+        Number of OpenMP threads to use.
+       (Default = None)
+
+    Returns
+    -------
+
+    superimposed_coords : arraylike of shape (n_frames, n_atoms, 3)
+        The transformed coordinates, this is `out` if it was given.
+
+    rotation_matrices : arraylike of shape (n_frames, 3, 3)
+        The rotation matrices of the final weighted alignments.
+
+    rmsds : arraylike of shape (n_frames,)
+        The (unweighted) RMSDs of the aligned atoms after the
+        superposition.
+
+    weights : arraylike of shape (n_frames, n_idxs)
+        The weights of the aligned atoms in the final alignment of
+        each frame.
+
+    n_iterations : arraylike of int of shape (n_frames,)
+        The number of alignments done for each frame.
+
+    """
+
+    assert len(coords.shape) == 3, \
+        "coords should be a rank 3 array of shape (n_frames, n_atoms, 3)"
+    assert len(ref_coords.shape) == 2 and ref_coords.shape[1] == 3, \
+        "Reference coordinates should be of shape (n_atoms, 3)"
+    assert coords.shape[1:] == ref_coords.shape, \
+        "Number of coordinates are not the same"
+
+    if idxs is not None:
+        align_ref = np.ascontiguousarray(ref_coords[idxs], dtype=np.float64)
+        align_coords = coords[:, idxs]
+    else:
+        align_ref = np.ascontiguousarray(ref_coords, dtype=np.float64)
+        align_coords = coords
+
+    align_coords = np.ascontiguousarray(align_coords,
+                                        dtype=_coords_dtype(align_coords))
+
+    n_frames, n_coords = align_coords.shape[:2]
+
+    rotation_matrices = np.empty((n_frames, 3, 3), dtype=np.float64)
+    ref_centroids = np.empty((n_frames, 3), dtype=np.float64)
+    centroids = np.empty((n_frames, 3), dtype=np.float64)
+    sq_deviations = np.empty((n_frames, n_coords), dtype=np.float64)
+    weights = np.ones((n_frames, n_coords), dtype=np.float64)
+    n_iterations = np.zeros((n_frames,), dtype=np.intc)
+
+    if num_threads is None:
+        num_threads = 0
+
+    sigmas = None
+    frame_idxs = np.arange(n_frames, dtype=np.intp)
+    for iteration in range(max_iterations):
+
+        if frame_idxs.shape[0] == 0:
+            break
+
+        # center the frames and the reference on the weighted
+        # centroids of each frame
+        frame_weights = np.ascontiguousarray(weights[frame_idxs])
+        total_weights = frame_weights.sum(axis=1)[:, np.newaxis]
+        frame_centroids = np.einsum('fn,fni->fi', frame_weights,
+                                    align_coords[frame_idxs]) / total_weights
+        frame_ref_centroids = frame_weights @ align_ref / total_weights
+
+        centered_coords = np.ascontiguousarray(
+            align_coords[frame_idxs] - frame_centroids[:, np.newaxis, :],
+            dtype=np.float64)
+        centered_refs = np.ascontiguousarray(
+            align_ref[np.newaxis] - frame_ref_centroids[:, np.newaxis, :])
+
+        frame_rmsds = np.empty((frame_idxs.shape[0],), dtype=np.float64)
+        frame_rots = np.empty((frame_idxs.shape[0], 9), dtype=np.float64)
+        WeightedRMSDRotationalMatrixBatch(centered_refs, centered_coords,
+                                          frame_weights, n_coords, frame_rmsds,
+                                          frame_rots, num_threads=num_threads)
+
+        frame_rots = frame_rots.reshape((-1, 3, 3))
+        rotation_matrices[frame_idxs] = frame_rots
+        centroids[frame_idxs] = frame_centroids
+        ref_centroids[frame_idxs] = frame_ref_centroids
+        sq_deviations[frame_idxs] = np.sum(
+            np.square(np.matmul(centered_coords, frame_rots) - centered_refs), axis=2)
+        n_iterations[frame_idxs] += 1
+
+        # the weights of the frames that are not aligned again are
+        # the ones of their last alignment
+        if iteration == max_iterations - 1:
+            break
+
+        if sigmas is None:
+            # start from the RMSDs of the unweighted alignment
+            sigmas = np.sqrt(np.mean(sq_deviations, axis=1))
+            # identical frames have nothing to reweight
+            frame_idxs = frame_idxs[sigmas[frame_idxs] > 0.0]
+        elif sigma is not None:
+            # narrow the weights down to sigma gradually, starting
+            # narrow lets the weights collapse onto a few atoms
+            sigmas[frame_idxs] = np.maximum(0.5 * sigmas[frame_idxs], sigma)
+
+        # relative to the closest atom so not all weights underflow
+        frame_sq_deviations = sq_deviations[frame_idxs]
+        frame_sq_deviations -= np.min(frame_sq_deviations, axis=1)[:, np.newaxis]
+
+        new_weights = np.exp(-frame_sq_deviations /
+                             (2 * np.square(sigmas[frame_idxs, np.newaxis])))
+
+        changes = np.max(np.abs(new_weights - weights[frame_idxs]), axis=1)
+
+        # only the frames that are aligned again get the new weights
+        frame_idxs = frame_idxs[changes > tol]
+        weights[frame_idxs] = new_weights[changes > tol]
+
+    # the RMSDs and superposition of the last alignment of each frame
+    rmsds = np.sqrt(np.mean(sq_deviations, axis=1))
+
+    if out is None:
+        out = np.empty(coords.shape, dtype=np.float64)
+
+    assert out.shape == coords.shape, \
+        "out must be the same shape as coords"
+
+    translations = ref_centroids[:, np.newaxis, :] - \
+        np.matmul(centroids[:, np.newaxis, :], rotation_matrices)
+
+    _transform_frames(coords, rotation_matrices, translations, out)
+
+    return out, rotation_matrices, rmsds, weights, n_iterations
+
 # the following method contains portions of the software mdtraj which
 # is distributed under the following license
 ##############################################################################
@@ -157,3 +537,59 @@ def alt_superimpose(ref_coords, coords):
     translation = mu2 - mu1.dot(rotation)
 
     return translation, rotation
+
+def alt_superimpose_traj(ref_coords, coords):
+    """Batched version of `alt_superimpose` which returns the
+    translations and rotations mapping each frame of a stack of frames
+    onto the reference.
+
+    All the correlation matrices are built with a single einsum and
+    decomposed with one stacked SVD, with reflections fixed using the
+    determinants of all frames at once. This is a pure numpy
+    alternative to `superimpose_traj`.
+
+    Parameters
+    ----------
+
+    ref_coords : ndarray, shape = (n_atoms, 3)
+        xyz coordinates of the frame to align onto.
+
+    coords : ndarray, shape = (n_frames, n_atoms, 3)
+        xyz coordinates of the frames to be aligned onto `ref_coords`.
+
+    Returns
+    -------
+
+    translations : ndarray, shape=(n_frames, 3)
+        Difference between the centroids of each frame and the
+        rotated centroid of the reference.
+
+    rotations : ndarray, shape=(n_frames, 3, 3)
+        Rotation matrices, as in `alt_superimpose`, for each frame.
+
+    """
+
+    assert len(coords.shape) == 3, \
+        "coords should be a rank 3 array of shape (n_frames, n_atoms, 3)"
+    assert ref_coords.shape == coords.shape[1:], \
+        "Number of coordinates are not the same"
+
+    mu1 = ref_coords.mean(0)
+    mu2 = coords.mean(1)
+
+    ref_coords = ref_coords - mu1
+
+    # since the centered reference sums to zero the frames do not need
+    # to be centered for their correlation matrices
+    correlation_matrices = np.einsum('ni,fnj->fij', ref_coords, coords)
+
+    V, S, W_tr = np.linalg.svd(correlation_matrices)
+
+    is_reflection = (np.linalg.det(V) * np.linalg.det(W_tr)) < 0.0
+    V[is_reflection, :, -1] = -V[is_reflection, :, -1]
+
+    rotations = np.matmul(V, W_tr)
+
+    translations = mu2 - np.einsum('i,fij->fj', mu1, rotations)
+
+    return translations, rotations
@@ -1,8 +1,23 @@
 import numpy as np
 
-from geomm.pyqcprot import CalcRMSDRotationalMatrix
+from geomm.pyqcprot import CalcRMSDRotationalMatrix, CalcRMSDRotationalMatrixBatch, \
+    RMSDWithinBatch, CalcRMSDRotationalMatrixSequential
+from geomm.centroid import centroid
+from geomm.rmsd import _reuse_buffer, _gather
+from geomm.transforms import RigidTransform
 
-def theobald_qcp(ref_coords, coords, idxs=None, weights=None):
+def _coords_dtype(*coords):
+    """The floating point type the QCP kernels should work on for
+    these coordinates, float32 if all of them are single precision
+    otherwise float64."""
+
+    if all(np.asarray(c).dtype == np.float32 for c in coords):
+        return np.float32
+    else:
+        return np.float64
+
+def theobald_qcp(ref_coords, coords, idxs=None, weights=None,
+                 return_quaternion=False):
     """Wrapper around the pyqcprot implementation of the Theobald-QCP
     method for the calculation of RMSD and the RMSD minimizing rotation
     matrix. This function just gives a more pythonic API to the
@@ -26,6 +41,11 @@ def theobald_qcp(ref_coords, coords, idxs=None, weights=None):
         array of those weights
        (Default = None)
 
+    return_quaternion : bool, optional
+        Also return the rotation as a unit quaternion, see
+        `geomm.transforms`.
+       (Default = False)
+
     Returns
     -------
 
@@ -35,6 +55,10 @@ def theobald_qcp(ref_coords, coords, idxs=None, weights=None):
     rotation_matrix : arraylike
         The rotation matrix that minimizes the RMSD.
 
+    quaternion : arraylike of shape (4,)
+        The rotation as a unit quaternion (w, x, y, z), only if
+        `return_quaternion` is True.
+
     """
 
     # make sure the coords are the same size
@@ -45,24 +69,28 @@ def theobald_qcp(ref_coords, coords, idxs=None, weights=None):
     assert (ref_coords.shape[1] == 3) and (coords.shape[1] == 3), \
         "Number of dimensions are not the same"
 
-    # copy the coordinates to make sure we are not modifying them in
-    # place
-    ref_coords_copy = np.array(ref_coords.copy(), dtype=np.float64)
-    coords_copy = np.array(coords.copy(), dtype=np.float64)
+    # the kernels never modify the coordinates so they are only
+    # copied if they need to be converted. Single precision
+    # coordinates are kept as they are since the kernels accumulate
+    # in double precision anyway
+    dtype = _coords_dtype(ref_coords, coords)
+    ref_coords = np.asarray(ref_coords, dtype=dtype)
+    coords = np.asarray(coords, dtype=dtype)
 
     # if idxs were given we use just those for aligning
     if idxs is not None:
-        align_ref_coords = ref_coords_copy[idxs]
-        align_coords = coords_copy[idxs]
+        align_ref_coords = ref_coords[idxs]
+        align_coords = coords[idxs]
     else:
-        align_ref_coords = ref_coords_copy
-        align_coords = coords_copy
+        align_ref_coords = ref_coords
+        align_coords = coords
 
     # the number of coordinates (atoms)
     n_coords = align_ref_coords.shape[0]
 
     # make sure the weights if given are the right size
     if weights is not None:
+        weights = np.ascontiguousarray(weights, dtype=np.float64)
         assert weights.shape[0] == n_coords, \
             "Number of weights given does not match the number of coordinates"
 
@@ -70,9 +98,729 @@ def theobald_qcp(ref_coords, coords, idxs=None, weights=None):
     # this is always an array of length 9
     rotation_matrix = np.zeros((9,), dtype=np.float64)
 
+    if return_quaternion:
+        quaternion = np.zeros((4,), dtype=np.float64)
+    else:
+        quaternion = None
+
     # calculate the rmsd, and the rotation matrix which is modified in-place
     rmsd = CalcRMSDRotationalMatrix(align_ref_coords, align_coords,
-                                    n_coords, rotation_matrix, weights)
+                                    n_coords, rotation_matrix, weights,
+                                    quat=quaternion)
 
     # reshape the rotation matrix to be 2D
+    if return_quaternion:
+        return rmsd, rotation_matrix.reshape( (3, 3) ), quaternion
+
     return rmsd, rotation_matrix.reshape( (3, 3) )
+
+def theobald_qcp_traj(ref_coords, coords, idxs=None, weights=None,
+                      num_threads=None, return_quaternion=False):
+    """Batched version of `theobald_qcp` which aligns a whole stack of
+    frames to a single reference in one call to pyqcprot.
+
+    The reference is centered and its inner product is computed only
+    once, the frames are centered on the fly inside the kernel. So
+    unlike `theobald_qcp` the coordinates do not need to be centered
+    beforehand, for centered coordinates the results are the same.
+
+    Parameters
+    ----------
+
+    ref_coords : arraylike of shape (n_atoms, 3)
+        The refence coordinates that will be aligned to.
+
+    coords : arraylike of shape (n_frames, n_atoms, 3)
+        The frames that will be rotated to match ref_coords.
+
+    idxs : arraylike of int, optional
+        Indices of the atoms that you want to align.
+       (Default = None)
+
+    weights : arraylike, optional
+        If your coordinates are weighted (e.g. mass) this is an
+        array of those weights
+       (Default = None)
+
+    num_threads : int, optional
+        Number of OpenMP threads the frames are split over. If None
+        the OpenMP default is used (OMP_NUM_THREADS or all cores).
+       (Default = None)
+
+    return_quaternion : bool, optional
+        Also return the rotations as unit quaternions, see
+        `geomm.transforms`.
+       (Default = False)
+
+    Returns
+    -------
+
+    rmsds : arraylike of shape (n_frames,)
+        The rmsd of each frame to the reference.
+
+    rotation_matrices : arraylike of shape (n_frames, 3, 3)
+        The rotation matrices that minimize the RMSD for each frame.
+
+    quaternions : arraylike of shape (n_frames, 4)
+        The rotations as unit quaternions (w, x, y, z), only if
+        `return_quaternion` is True.
+
+    """
+
+    assert len(coords.shape) == 3, \
+        "coords should be a rank 3 array of shape (n_frames, n_atoms, 3)"
+
+    reference = QCPReference(ref_coords, idxs=idxs, weights=weights)
+
+    if return_quaternion:
+        rmsds, rotation_matrices, _, quaternions = reference._align(
+            coords, num_threads=num_threads, quaternions=True)
+
+        return rmsds, rotation_matrices, quaternions
+
+    rmsds, rotation_matrices, _ = reference._align(coords,
+                                                   num_threads=num_threads)
+
+    return rmsds, rotation_matrices
+
+def theobald_qcp_sequential(ref_coords, coords, idxs=None, weights=None,
+                            warm_start=True):
+    """Align the frames of a trajectory, in order, to a single reference
+    warm starting the eigenvalue search of each frame from the
+    previous one.
+
+    The Theobald-QCP method finds the largest eigenvalue of the key
+    matrix by Newton's method, normally starting from an upper bound
+    (E0). For consecutive frames of a trajectory the eigenvalues are
+    nearly the same, so starting from the previous frame's eigenvalue
+    needs fewer iterations, which matters for small alignment
+    selections. Should this converge to the wrong root the frame is
+    restarted from E0 so the results are the same as for
+    `theobald_qcp_traj`. The frames are processed serially.
+
+    Parameters
+    ----------
+
+    ref_coords : arraylike of shape (n_atoms, 3)
+        The refence coordinates that will be aligned to.
+
+    coords : arraylike of shape (n_frames, n_atoms, 3)
+        The frames, in trajectory order.
+
+    idxs : arraylike of int, optional
+        Indices of the atoms that you want to align.
+       (Default = None)
+
+    weights : arraylike, optional
+        If your coordinates are weighted (e.g. mass) this is an
+        array of those weights
+       (Default = None)
+
+    warm_start : bool, optional
+        If False every frame starts from E0, useful to compare the
+        number of iterations.
+       (Default = True)
+
+    Returns
+    -------
+
+    rmsds : arraylike of shape (n_frames,)
+        The rmsd of each frame to the reference.
+
+    rotation_matrices : arraylike of shape (n_frames, 3, 3)
+        The rotation matrices that minimize the RMSD for each frame.
+
+    n_iterations : arraylike of int of shape (n_frames,)
+        The number of Newton iterations for each frame.
+
+    """
+
+    assert len(coords.shape) == 3, \
+        "coords should be a rank 3 array of shape (n_frames, n_atoms, 3)"
+
+    reference = QCPReference(ref_coords, idxs=idxs, weights=weights)
+
+    align_coords = reference._align_coords(coords)
+    n_frames = align_coords.shape[0]
+
+    rmsds = np.empty((n_frames,), dtype=np.float64)
+    rotation_matrices = np.empty((n_frames, 9), dtype=np.float64)
+    n_iterations = np.empty((n_frames,), dtype=np.intc)
+
+    CalcRMSDRotationalMatrixSequential(reference.coords, reference.G,
+                                       align_coords, reference.n_coords,
+                                       rmsds, rotation_matrices, None,
+                                       n_iterations, reference.weights,
+                                       warm_start=warm_start)
+
+    return rmsds, rotation_matrices.reshape((n_frames, 3, 3)), n_iterations
+
+def iter_theobald_qcp(ref_coords, chunks, idxs=None, weights=None,
+                      rotations=False, num_threads=None):
+    """Streaming version of `theobald_qcp_traj` over an iterable of
+    chunks of frames.
+
+    The reference is prepared once (see `QCPReference`) and all the
+    arrays for the aligned subsets and the results are reused between
+    chunks, so after the largest chunk has been seen no memory is
+    allocated.
+
+    Parameters
+    ----------
+
+    ref_coords : arraylike of shape (n_atoms, 3)
+        The refence coordinates that will be aligned to.
+
+    chunks : iterable of arraylike of shape (chunk_n_frames, n_atoms, 3)
+        The frames in chunks, e.g. slices of an h5py dataset or
+        blocks of a memory-mapped array. float32 chunks are not
+        upcast.
+
+    idxs : arraylike of int, optional
+        Indices of the atoms that you want to align.
+       (Default = None)
+
+    weights : arraylike, optional
+        If your coordinates are weighted (e.g. mass) this is an
+        array of those weights
+       (Default = None)
+
+    rotations : bool, optional
+        Whether to compute the rotation matrices as well.
+       (Default = False)
+
+    num_threads : int, optional
+        Number of OpenMP threads the frames are split over.
+       (Default = None)
+
+    Yields
+    ------
+
+    rmsds : arraylike of shape (chunk_n_frames,)
+        The RMSDs for the frames of the chunk.
+
+    rotation_matrices : arraylike of shape (chunk_n_frames, 3, 3) or None
+        The rotation matrices for the frames of the chunk if
+        `rotations` is True.
+
+    Warnings
+    --------
+
+    The yielded arrays are views of internal buffers which are
+    overwritten by the next chunk, copy them if you need to keep them.
+
+    """
+
+    reference = QCPReference(ref_coords, idxs=idxs, weights=weights)
+
+    gather_buffer = None
+    rmsd_buffer = None
+    rotation_buffer = None
+    centroid_buffer = None
+
+    for chunk in chunks:
+
+        chunk = np.asarray(chunk)
+
+        assert len(chunk.shape) == 3 and chunk.shape[1:] == (reference.n_atoms, 3), \
+            "chunks should be of shape (chunk_n_frames, n_atoms, 3)"
+
+        if chunk.dtype not in (np.float32, np.float64):
+            chunk = chunk.astype(np.float64)
+
+        n_frames = chunk.shape[0]
+
+        if reference.idxs is not None:
+            align_coords, gather_buffer = _gather(chunk, reference.idxs,
+                                                  gather_buffer)
+        else:
+            align_coords = np.ascontiguousarray(chunk)
+
+        rmsd_buffer = _reuse_buffer(rmsd_buffer, (n_frames,), np.float64)
+        centroid_buffer = _reuse_buffer(centroid_buffer, (n_frames, 3),
+                                        np.float64)
+
+        rmsds = rmsd_buffer[:n_frames]
+
+        if rotations:
+            rotation_buffer = _reuse_buffer(rotation_buffer, (n_frames, 9),
+                                            np.float64)
+            rotation_matrices = rotation_buffer[:n_frames]
+        else:
+            rotation_matrices = None
+
+        reference._align_subset(align_coords, rmsds, rotation_matrices,
+                                centroid_buffer[:n_frames],
+                                num_threads=num_threads)
+
+        if rotations:
+            rotation_matrices = rotation_matrices.reshape((n_frames, 3, 3))
+
+        yield rmsds, rotation_matrices
+
+def theobald_qcp_chunks(ref_coords, chunks, idxs=None, weights=None,
+                        rotations=False, num_threads=None):
+    """Align all frames of an iterable of chunks of frames to a
+    reference and concatenate the results, see `iter_theobald_qcp`.
+
+    Returns
+    -------
+
+    rmsds : arraylike of shape (n_frames,)
+        The rmsd of each frame to the reference.
+
+    rotation_matrices : arraylike of shape (n_frames, 3, 3) or None
+        The rotation matrices if `rotations` is True.
+
+    """
+
+    all_rmsds = [np.zeros((0,))]
+    all_rotation_matrices = [np.zeros((0, 3, 3))]
+
+    for rmsds, rotation_matrices in iter_theobald_qcp(ref_coords, chunks,
+                                                      idxs=idxs,
+                                                      weights=weights,
+                                                      rotations=rotations,
+                                                      num_threads=num_threads):
+        all_rmsds.append(np.copy(rmsds))
+
+        if rotations:
+            all_rotation_matrices.append(np.copy(rotation_matrices))
+
+    if rotations:
+        return np.concatenate(all_rmsds), np.concatenate(all_rotation_matrices)
+    else:
+        return np.concatenate(all_rmsds), None
+
+def theobald_qcp_within(ref_coords, coords, cutoff, idxs=None, weights=None,
+                        num_threads=None):
+    """Find the frames which are within an RMSD cutoff (after optimal
+    superposition) of a reference.
+
+    Frames which can not be within the cutoff, because the difference
+    of their radius of gyration to the one of the reference is already
+    larger, are skipped without doing the QCP calculation. See
+    `QCPReference.within`.
+
+    Parameters
+    ----------
+
+    ref_coords : arraylike of shape (n_atoms, 3)
+        The refence coordinates.
+
+    coords : arraylike of shape (n_frames, n_atoms, 3)
+        The frames to search.
+
+    cutoff : float
+        The RMSD cutoff, frames with an RMSD less than or equal to
+        this are returned.
+
+    idxs : arraylike of int, optional
+        Indices of the atoms that you want to align.
+       (Default = None)
+
+    weights : arraylike, optional
+        If your coordinates are weighted (e.g. mass) this is an
+        array of those weights
+       (Default = None)
+
+    num_threads : int, optional
+        Number of OpenMP threads.
+       (Default = None)
+
+    Returns
+    -------
+
+    frame_idxs : arraylike of int
+        The indices of the frames within the cutoff.
+
+    rmsds : arraylike of float
+        The RMSDs of those frames.
+
+    """
+
+    reference = QCPReference(ref_coords, idxs=idxs, weights=weights)
+
+    return reference.within(coords, cutoff, num_threads=num_threads)
+
+class QCPReference(object):
+    """A reference structure prepared once for repeated Theobald-QCP
+    alignments to it.
+
+    The aligned subset of the reference is copied, centered on its
+    (weighted) centroid and its inner product is computed on
+    construction, so that each alignment only has to do the work for
+    the frame itself.
+
+    The methods accept either a single frame of shape (n_atoms, 3) or
+    a stack of frames of shape (n_frames, n_atoms, 3) in which case
+    the results are arrays over the frames. The frames do not need to
+    be centered beforehand.
+
+    Parameters
+    ----------
+
+    ref_coords : arraylike of shape (n_atoms, 3)
+        The refence coordinates that will be aligned to.
+
+    idxs : arraylike of int, optional
+        Indices of the atoms that you want to align.
+       (Default = None)
+
+    weights : arraylike, optional
+        If your coordinates are weighted (e.g. mass) this is an
+        array of those weights
+       (Default = None)
+
+    Attributes
+    ----------
+
+    coords : arraylike of shape (n_idxs, 3)
+        The centered, C-contiguous float64 aligned subset of the
+        reference.
+
+    centroid : arraylike of shape (3,)
+        The (weighted) centroid of the aligned subset of the
+        reference.
+
+    G : float
+        The (weighted) inner product of the centered subset with
+        itself.
+
+    """
+
+    def __init__(self, ref_coords, idxs=None, weights=None):
+
+        # make sure the number of dimensions is 3
+        assert len(ref_coords.shape) == 2 and ref_coords.shape[1] == 3, \
+            "Reference coordinates should be of shape (n_atoms, 3)"
+
+        self.n_atoms = ref_coords.shape[0]
+
+        if idxs is not None:
+            # normalize the idxs (negative, boolean) to positive indices
+            self.idxs = np.arange(self.n_atoms)[idxs]
+            align_ref_coords = np.asarray(ref_coords, dtype=np.float64)[self.idxs]
+        else:
+            self.idxs = None
+            align_ref_coords = np.asarray(ref_coords, dtype=np.float64)
+
+        self.n_coords = align_ref_coords.shape[0]
+
+        if weights is not None:
+            weights = np.ascontiguousarray(weights, dtype=np.float64)
+            assert weights.shape[0] == self.n_coords, \
+                "Number of weights given does not match the number of coordinates"
+
+        self.weights = weights
+
+        # center the reference and compute its inner product
+        self.centroid = centroid(align_ref_coords, weights=weights)
+        self.coords = np.ascontiguousarray(align_ref_coords - self.centroid)
+
+        if weights is None:
+            self.G = np.sum(np.square(self.coords))
+        else:
+            self.G = np.sum(weights[:, np.newaxis] * np.square(self.coords))
+
+    def _align_coords(self, coords):
+        """The aligned subset of a stack of frames in a form the
+        kernels accept."""
+
+        # make sure the coords are the same size
+        assert coords.shape[1] == self.n_atoms, \
+            "Number of coordinates are not the same"
+
+        # make sure the number of dimensions is 3
+        assert coords.shape[2] == 3, \
+            "Number of dimensions are not the same"
+
+        # only take the subset once for the whole stack, if it is
+        # already a C-contiguous float32 or float64 array no copy is
+        # made
+        if self.idxs is not None:
+            align_coords = coords[:, self.idxs]
+        else:
+            align_coords = coords
+
+        # float32 frames are passed through without upcasting
+        align_coords = np.ascontiguousarray(align_coords,
+                                            dtype=_coords_dtype(align_coords))
+
+        return align_coords
+
+    def _align(self, coords, rotations=True, num_threads=None,
+               quaternions=False):
+        """Align a stack of frames, returns the RMSDs, the rotation
+        matrices (if `rotations` is True) and the centroids of the
+        aligned subset of each frame, and the quaternions of the
+        rotations if `quaternions` is True."""
+
+        align_coords = self._align_coords(coords)
+
+        n_frames = align_coords.shape[0]
+
+        rmsds = np.empty((n_frames,), dtype=np.float64)
+        centroids = np.empty((n_frames, 3), dtype=np.float64)
+
+        if rotations:
+            rotation_matrices = np.empty((n_frames, 9), dtype=np.float64)
+        else:
+            rotation_matrices = None
+
+        if quaternions:
+            quats = np.empty((n_frames, 4), dtype=np.float64)
+        else:
+            quats = None
+
+        self._align_subset(align_coords, rmsds, rotation_matrices, centroids,
+                           num_threads=num_threads, quaternions=quats)
+
+        if rotations:
+            rotation_matrices = rotation_matrices.reshape((n_frames, 3, 3))
+
+        if quaternions:
+            return rmsds, rotation_matrices, centroids, quats
+
+        return rmsds, rotation_matrices, centroids
+
+    def _align_subset(self, align_coords, rmsds, rotation_matrices, centroids,
+                      num_threads=None, quaternions=None):
+        """Run the kernel on the already prepared aligned subset of a
+        stack of frames, writing into the given output arrays."""
+
+        if num_threads is None:
+            num_threads = 0
+
+        CalcRMSDRotationalMatrixBatch(self.coords, self.G,
+                                      align_coords, self.n_coords,
+                                      rmsds, rotation_matrices, centroids,
+                                      self.weights, num_threads=num_threads,
+                                      quats=quaternions)
+
+    def rmsd(self, coords, num_threads=None):
+        """The RMSD after optimal superposition of the frame(s) to the
+        reference, the rotation matrix is not computed.
+
+        Parameters
+        ----------
+
+        coords : arraylike of shape ([n_frames,] n_atoms, 3)
+            The frame or stack of frames to align.
+
+        num_threads : int, optional
+            Number of OpenMP threads for stacks of frames.
+           (Default = None)
+
+        Returns
+        -------
+
+        rmsd : float or arraylike of shape (n_frames,)
+
+        """
+
+        if len(coords.shape) == 2:
+            return self._align(coords[np.newaxis], rotations=False)[0][0]
+
+        return self._align(coords, rotations=False, num_threads=num_threads)[0]
+
+    def rotation(self, coords, num_threads=None):
+        """The rotation matrix that minimizes the RMSD of the frame(s)
+        to the reference.
+
+        Parameters
+        ----------
+
+        coords : arraylike of shape ([n_frames,] n_atoms, 3)
+            The frame or stack of frames to align.
+
+        num_threads : int, optional
+            Number of OpenMP threads for stacks of frames.
+           (Default = None)
+
+        Returns
+        -------
+
+        rotation_matrix : arraylike of shape ([n_frames,] 3, 3)
+            The rotation matrix, which is applied to the centered
+            coordinates as `np.dot(coords, rotation_matrix)`.
+
+        """
+
+        if len(coords.shape) == 2:
+            return self._align(coords[np.newaxis])[1][0]
+
+        return self._align(coords, num_threads=num_threads)[1]
+
+    def within(self, coords, cutoff, num_threads=None):
+        """Find the frames whose RMSD to the reference is within a
+        cutoff.
+
+        The radius of gyration difference of each frame is a cheap
+        lower bound on the RMSD, for frames where it is already above
+        the cutoff the QCP calculation is skipped entirely.
+
+        Parameters
+        ----------
+
+        coords : arraylike of shape (n_frames, n_atoms, 3)
+            The frames to search.
+
+        cutoff : float
+            The RMSD cutoff, frames with an RMSD less than or equal to
+            this are returned.
+
+        num_threads : int, optional
+            Number of OpenMP threads.
+           (Default = None)
+
+        Returns
+        -------
+
+        frame_idxs : arraylike of int
+            The indices of the frames within the cutoff.
+
+        rmsds : arraylike of float
+            The RMSDs of those frames.
+
+        """
+
+        assert len(coords.shape) == 3, \
+            "coords should be a rank 3 array of shape (n_frames, n_atoms, 3)"
+
+        align_coords = self._align_coords(coords)
+
+        rmsds = np.empty((align_coords.shape[0],), dtype=np.float64)
+
+        if num_threads is None:
+            num_threads = 0
+
+        RMSDWithinBatch(self.coords, self.G, align_coords, self.n_coords,
+                        cutoff, rmsds, self.weights, num_threads=num_threads)
+
+        frame_idxs = np.flatnonzero(rmsds <= cutoff)
+
+        return frame_idxs, rmsds[frame_idxs]
+
+    def superimpose(self, coords, num_threads=None):
+        """Superimpose the frame(s) onto the reference.
+
+        The frames are translated so the centroid of their aligned
+        subset is at the origin, rotated, and then translated to the
+        centroid of the reference. For coordinates centered as
+        `geomm.superimpose.superimpose` assumes, the results are the
+        same.
+
+        Parameters
+        ----------
+
+        coords : arraylike of shape ([n_frames,] n_atoms, 3)
+            The frame or stack of frames to superimpose. All atoms
+            are transformed, not only the aligned subset.
+
+        num_threads : int, optional
+            Number of OpenMP threads for stacks of frames.
+           (Default = None)
+
+        Returns
+        -------
+
+        superimposed_coords : arraylike of float
+            The transformed coordinates.
+
+        rotation_matrix : arraylike
+            The rotation matrix from Theobald-QCP that minimized the RMSD
+
+        qcp_rmsd : float or arraylike
+            The RMSD calculated from Theobald-QCP.
+
+        """
+
+        if len(coords.shape) == 2:
+            sup_coords, rotation_matrices, rmsds = \
+                self.superimpose(coords[np.newaxis])
+            return sup_coords[0], rotation_matrices[0], rmsds[0]
+
+        rmsds, rotation_matrices, centroids = self._align(coords,
+                                                          num_threads=num_threads)
+
+        # (x - c) R + c_ref = x R + (c_ref - c R)
+        sup_coords = np.matmul(coords, rotation_matrices)
+        sup_coords += self.centroid - np.matmul(centroids[:, np.newaxis, :],
+                                                rotation_matrices)
+
+        return sup_coords, rotation_matrices, rmsds
+
+    def transform(self, coords, num_threads=None):
+        """The rigid transformations that superimpose the frame(s)
+        onto the reference, as `superimpose` does.
+
+        Parameters
+        ----------
+
+        coords : arraylike of shape ([n_frames,] n_atoms, 3)
+            The frame or stack of frames to align.
+
+        num_threads : int, optional
+            Number of OpenMP threads for stacks of frames.
+           (Default = None)
+
+        Returns
+        -------
+
+        transform : geomm.transforms.RigidTransform
+            A single transformation for a single frame, otherwise a
+            batch of one per frame.
+
+        """
+
+        if len(coords.shape) == 2:
+            return self.transform(coords[np.newaxis])[0]
+
+        _, _, centroids, quaternions = self._align(coords, rotations=False,
+                                                   num_threads=num_threads,
+                                                   quaternions=True)
+
+        transform = RigidTransform.from_quaternions(quaternions)
+
+        # x R + (c_ref - c R)
+        transform.transforms[:, 4:] = self.centroid - np.matmul(
+            centroids[:, np.newaxis, :], transform.rotation_matrices)[:, 0]
+
+        return transform
+
+def _centered_frames(coords, idxs=None, weights=None):
+    """Take the aligned subset of a stack of frames, center each frame
+    on its (weighted) centroid and compute the self inner product
+    (G) of each centered frame.
+
+    Returns a C-contiguous array of the centered subsets (float32 if
+    the frames are single precision, otherwise float64) and an array
+    of the inner products which can be reused for any number of QCP
+    evaluations.
+
+    """
+
+    if idxs is not None:
+        coords = coords[:, idxs]
+
+    centered_coords = np.array(coords, dtype=_coords_dtype(coords), order='C')
+
+    # the centroids and inner products are always computed in double
+    # precision, even if the centered frames are kept in single
+    if weights is None:
+        centroids = centered_coords.mean(axis=1, dtype=np.float64)
+    else:
+        centroids = np.einsum('fij,i->fj', centered_coords, weights,
+                              dtype=np.float64) / weights.sum()
+
+    centered_coords -= centroids[:, np.newaxis, :].astype(centered_coords.dtype)
+
+    if weights is None:
+        Gs = np.einsum('fij,fij->f', centered_coords, centered_coords,
+                       dtype=np.float64)
+    else:
+        Gs = np.einsum('fij,fij,i->f', centered_coords, centered_coords,
+                       weights, dtype=np.float64)
+
+    return centered_coords, Gs
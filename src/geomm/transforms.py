@@ -0,0 +1,356 @@
+"""Rigid body transformations (rotation and translation) of
+coordinates.
+
+A `RigidTransform` holds one or more transformations as an array of
+shape (n, 7) with a unit quaternion (w, x, y, z) followed by a
+translation for each. A transformation maps a point x to R(q) x + t,
+which for the row vectors of coordinate arrays is the same as
+coords @ R(q).T + t. The rotation matrices used elsewhere in geomm
+(e.g. from `geomm.theobald_qcp.theobald_qcp`) are applied as
+coords @ rotation_matrix, so they are R(q).T.
+
+"""
+
+import numpy as np
+
+def _quaternion_multiply(p, q):
+    """The Hamilton products of two arrays of quaternions of shape
+    (..., 4), broadcasting over the leading dimensions."""
+
+    pw, px, py, pz = np.moveaxis(p, -1, 0)
+    qw, qx, qy, qz = np.moveaxis(q, -1, 0)
+
+    return np.stack([pw * qw - px * qx - py * qy - pz * qz,
+                     pw * qx + px * qw + py * qz - pz * qy,
+                     pw * qy - px * qz + py * qw + pz * qx,
+                     pw * qz + px * qy - py * qx + pz * qw],
+                    axis=-1)
+
+def _quaternion_rotation_matrices(quaternions):
+    """The rotation matrices of unit quaternions of shape (n, 4) in
+    the geomm convention, i.e. applied as coords @ rotation_matrix.
+
+    The layout is the same as the rotation matrices from pyqcprot."""
+
+    w, x, y, z = quaternions.T
+
+    rotation_matrices = np.empty((quaternions.shape[0], 3, 3), dtype=np.float64)
+
+    rotation_matrices[:, 0, 0] = w * w + x * x - y * y - z * z
+    rotation_matrices[:, 0, 1] = 2 * (x * y + w * z)
+    rotation_matrices[:, 0, 2] = 2 * (z * x - w * y)
+    rotation_matrices[:, 1, 0] = 2 * (x * y - w * z)
+    rotation_matrices[:, 1, 1] = w * w - x * x + y * y - z * z
+    rotation_matrices[:, 1, 2] = 2 * (y * z + w * x)
+    rotation_matrices[:, 2, 0] = 2 * (z * x + w * y)
+    rotation_matrices[:, 2, 1] = 2 * (y * z - w * x)
+    rotation_matrices[:, 2, 2] = w * w - x * x - y * y + z * z
+
+    return rotation_matrices
+
+def _rotation_matrix_quaternions(rotation_matrices):
+    """The unit quaternions of rotation matrices of shape (n, 3, 3) in
+    the geomm convention (the inverse of
+    `_quaternion_rotation_matrices`).
+
+    Uses Shepperd's method: the component of the quaternion with the
+    largest magnitude is computed from the diagonal and the others
+    from the off-diagonal elements divided by it, which is stable
+    for all rotations."""
+
+    # the usual (column vector) matrices
+    R = np.swapaxes(rotation_matrices, 1, 2)
+
+    diagonals = np.stack([R[:, 0, 0] + R[:, 1, 1] + R[:, 2, 2],
+                          R[:, 0, 0], R[:, 1, 1], R[:, 2, 2]], axis=1)
+    largest = np.argmax(diagonals, axis=1)
+
+    quaternions = np.empty((R.shape[0], 4), dtype=np.float64)
+
+    # w is the largest
+    mask = largest == 0
+    r = R[mask]
+    s = 2 * np.sqrt(1 + r[:, 0, 0] + r[:, 1, 1] + r[:, 2, 2])
+    quaternions[mask] = np.stack([0.25 * s,
+                                  (r[:, 2, 1] - r[:, 1, 2]) / s,
+                                  (r[:, 0, 2] - r[:, 2, 0]) / s,
+                                  (r[:, 1, 0] - r[:, 0, 1]) / s], axis=1)
+
+    # x is the largest
+    mask = largest == 1
+    r = R[mask]
+    s = 2 * np.sqrt(1 + r[:, 0, 0] - r[:, 1, 1] - r[:, 2, 2])
+    quaternions[mask] = np.stack([(r[:, 2, 1] - r[:, 1, 2]) / s,
+                                  0.25 * s,
+                                  (r[:, 0, 1] + r[:, 1, 0]) / s,
+                                  (r[:, 0, 2] + r[:, 2, 0]) / s], axis=1)
+
+    # y is the largest
+    mask = largest == 2
+    r = R[mask]
+    s = 2 * np.sqrt(1 - r[:, 0, 0] + r[:, 1, 1] - r[:, 2, 2])
+    quaternions[mask] = np.stack([(r[:, 0, 2] - r[:, 2, 0]) / s,
+                                  (r[:, 0, 1] + r[:, 1, 0]) / s,
+                                  0.25 * s,
+                                  (r[:, 1, 2] + r[:, 2, 1]) / s], axis=1)
+
+    # z is the largest
+    mask = largest == 3
+    r = R[mask]
+    s = 2 * np.sqrt(1 - r[:, 0, 0] - r[:, 1, 1] + r[:, 2, 2])
+    quaternions[mask] = np.stack([(r[:, 1, 0] - r[:, 0, 1]) / s,
+                                  (r[:, 0, 2] + r[:, 2, 0]) / s,
+                                  (r[:, 1, 2] + r[:, 2, 1]) / s,
+                                  0.25 * s], axis=1)
+
+    return quaternions
+
+def _transform_frames(coords, rotation_matrices, translations, out,
+                      block_size=2**20):
+    """Write coords @ rotation + translation of each frame into `out`,
+    which may be `coords` itself."""
+
+    if np.shares_memory(out, coords):
+
+        # the matrix multiplication can not be done in place, so go
+        # through a temporary buffer for a block of frames at a time
+        n_block_frames = max(1, block_size // max(1, coords.shape[1]))
+        buffer = np.empty((min(n_block_frames, coords.shape[0]),) + coords.shape[1:],
+                          dtype=np.result_type(coords, rotation_matrices))
+
+        for start in range(0, coords.shape[0], n_block_frames):
+            stop = min(start + n_block_frames, coords.shape[0])
+            block = buffer[:stop - start]
+
+            np.matmul(coords[start:stop], rotation_matrices[start:stop],
+                      out=block)
+            np.add(block, translations[start:stop], out=out[start:stop],
+                   casting='unsafe')
+
+    else:
+        np.matmul(coords, rotation_matrices, out=out, casting='unsafe')
+        np.add(out, translations, out=out, casting='unsafe')
+
+class RigidTransform(object):
+    """One or a batch of rigid body transformations, stored as unit
+    quaternions and translations.
+
+    Transformations are composed with `*`, where (a * b) applies b
+    first and then a, and inverted with `inv`. Both work on whole
+    batches at once, a single transformation is broadcast against a
+    batch.
+
+    Parameters
+    ----------
+
+    transforms : arraylike of shape (7,) or (n, 7)
+        The quaternions (w, x, y, z) and translations (x, y, z) of
+        the transformations. The quaternions are normalized.
+
+    Attributes
+    ----------
+
+    transforms : arraylike of shape (n, 7)
+        The quaternions and translations, a single transformation is
+        stored as a batch of one.
+
+    single : bool
+        Whether this is a single transformation rather than a batch.
+
+    """
+
+    def __init__(self, transforms):
+
+        transforms = np.array(transforms, dtype=np.float64)
+
+        assert transforms.ndim in (1, 2) and transforms.shape[-1] == 7, \
+            "transforms should be of shape (7,) or (n, 7)"
+
+        self.single = transforms.ndim == 1
+        self.transforms = np.ascontiguousarray(transforms.reshape((-1, 7)))
+
+        norms = np.linalg.norm(self.transforms[:, :4], axis=1)
+        assert np.all(norms > 0.0), \
+            "Quaternions must not be zero"
+
+        self.transforms[:, :4] /= norms[:, np.newaxis]
+
+    @classmethod
+    def from_quaternions(cls, quaternions, translations=None):
+        """Make transformations from quaternions (w, x, y, z) of shape
+        (4,) or (n, 4) and optionally translations of shape (3,) or
+        (n, 3)."""
+
+        quaternions = np.asarray(quaternions, dtype=np.float64)
+
+        if translations is None:
+            translations = np.zeros(quaternions.shape[:-1] + (3,))
+
+        translations = np.asarray(translations, dtype=np.float64)
+        single = quaternions.ndim == 1 and translations.ndim == 1
+
+        quaternions = quaternions.reshape((-1, 4))
+        translations = translations.reshape((-1, 3))
+        n = max(quaternions.shape[0], translations.shape[0])
+
+        transforms = np.concatenate([np.broadcast_to(quaternions, (n, 4)),
+                                     np.broadcast_to(translations, (n, 3))],
+                                    axis=1)
+
+        if single:
+            transforms = transforms[0]
+
+        return cls(transforms)
+
+    @classmethod
+    def from_rotation_matrices(cls, rotation_matrices, translations=None):
+        """Make transformations from rotation matrices of shape (3, 3)
+        or (n, 3, 3), applied as coords @ rotation_matrix like the
+        rest of geomm, and optionally translations."""
+
+        rotation_matrices = np.asarray(rotation_matrices, dtype=np.float64)
+        single = rotation_matrices.ndim == 2
+
+        quaternions = _rotation_matrix_quaternions(rotation_matrices.reshape((-1, 3, 3)))
+
+        if single:
+            quaternions = quaternions[0]
+
+        return cls.from_quaternions(quaternions, translations=translations)
+
+    @classmethod
+    def identity(cls, n=None):
+        """The identity transformation, or a batch of `n` of them."""
+
+        transforms = np.zeros((1 if n is None else n, 7))
+        transforms[:, 0] = 1.0
+
+        if n is None:
+            return cls(transforms[0])
+
+        return cls(transforms)
+
+    def _unbatch(self, array):
+        """Drop the batch dimension for single transformations."""
+
+        if self.single:
+            return array[0]
+
+        return array
+
+    @property
+    def quaternions(self):
+        """The unit quaternions (w, x, y, z) of the rotations."""
+        return self._unbatch(self.transforms[:, :4])
+
+    @property
+    def translations(self):
+        """The translations, applied after the rotations."""
+        return self._unbatch(self.transforms[:, 4:])
+
+    @property
+    def rotation_matrices(self):
+        """The rotation matrices, applied as coords @ rotation_matrix."""
+        return self._unbatch(_quaternion_rotation_matrices(self.transforms[:, :4]))
+
+    def __len__(self):
+        return self.transforms.shape[0]
+
+    def __getitem__(self, idx):
+        return RigidTransform(self.transforms[idx])
+
+    def __repr__(self):
+        return "RigidTransform({})".format(repr(self._unbatch(self.transforms)))
+
+    def __mul__(self, other):
+        """The composition of transformations which applies `other`
+        and then this one."""
+
+        assert (len(self) == len(other) or len(self) == 1 or len(other) == 1), \
+            "Batches of transformations must be the same size or of one"
+
+        quaternions = _quaternion_multiply(self.transforms[:, :4],
+                                           other.transforms[:, :4])
+
+        # R_a (R_b x + t_b) + t_a
+        translations = np.matmul(other.transforms[:, np.newaxis, 4:],
+                                 _quaternion_rotation_matrices(self.transforms[:, :4]))[:, 0]
+        translations += self.transforms[:, 4:]
+
+        transforms = np.concatenate([quaternions, translations], axis=1)
+
+        if self.single and other.single:
+            transforms = transforms[0]
+
+        return RigidTransform(transforms)
+
+    def inv(self):
+        """The inverse transformations."""
+
+        quaternions = self.transforms[:, :4] * np.array([1.0, -1.0, -1.0, -1.0])
+
+        # x = R^-1 (y - t)
+        translations = -np.matmul(self.transforms[:, np.newaxis, 4:],
+                                  _quaternion_rotation_matrices(quaternions))[:, 0]
+
+        return RigidTransform(self._unbatch(np.concatenate([quaternions, translations],
+                                                           axis=1)))
+
+    def apply(self, coords, out=None):
+        """Transform coordinates.
+
+        Parameters
+        ----------
+
+        coords : arraylike of shape (n_atoms, 3) or (n_frames, n_atoms, 3)
+            A single frame or a stack of frames. A batch of
+            transformations is applied frame by frame (a single frame
+            is transformed by each of them), a single transformation
+            to all frames.
+
+        out : arraylike, optional
+            Array of the shape of the result to write into, can be
+            `coords` itself.
+           (Default = None)
+
+        Returns
+        -------
+
+        transformed_coords : arraylike
+            The transformed coordinates, this is `out` if it was given.
+
+        """
+
+        coords = np.asarray(coords)
+
+        assert coords.ndim in (2, 3) and coords.shape[-1] == 3, \
+            "coords should be of shape (n_atoms, 3) or (n_frames, n_atoms, 3)"
+
+        single_frame = coords.ndim == 2 and self.single
+
+        frames = coords if coords.ndim == 3 else coords[np.newaxis]
+        n_frames = max(frames.shape[0], len(self))
+
+        assert frames.shape[0] in (1, n_frames) and len(self) in (1, n_frames), \
+            "The number of transformations and frames do not match"
+
+        shape = (n_frames,) + frames.shape[1:]
+
+        if out is None:
+            out = np.empty(shape[1:] if single_frame else shape,
+                           dtype=np.result_type(coords.dtype, np.float64))
+
+        out_frames = out[np.newaxis] if single_frame else out
+
+        assert out_frames.shape == shape, \
+            "out is not the shape of the transformed coordinates"
+
+        rotation_matrices = np.broadcast_to(
+            _quaternion_rotation_matrices(self.transforms[:, :4]), (n_frames, 3, 3))
+        translations = np.broadcast_to(self.transforms[:, np.newaxis, 4:],
+                                       (n_frames, 1, 3))
+
+        _transform_frames(np.broadcast_to(frames, shape), rotation_matrices,
+                          translations, out_frames)
+
+        return out
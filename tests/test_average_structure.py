@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+from geomm.average_structure import iterative_average_structure
+from geomm.theobald_qcp import theobald_qcp
+
+def test_iterative_average_structure_chunks():
+    rng = np.random.default_rng(7)
+    structure = rng.normal(size=(12, 3)) * 3.0
+    frames = []
+    for _ in range(60):
+        rot, _ = np.linalg.qr(rng.normal(size=(3, 3)))
+        rot *= np.sign(np.linalg.det(rot))
+        frames.append((structure + rng.normal(scale=0.1, size=structure.shape)) @ rot
+                      + rng.normal(size=3))
+    frames = np.array(frames)
+
+    chunks = [frames[i:i+7] for i in range(0, 60, 7)]
+    average, n_iterations = iterative_average_structure(chunks, tol=1e-8)
+    whole_average, _ = iterative_average_structure([frames], tol=1e-8)
+
+    np.testing.assert_allclose(average, whole_average, atol=1e-6)
+    assert n_iterations > 1
+
+    centered_average = average - average.mean(axis=0)
+    rmsd, _ = theobald_qcp(structure - structure.mean(axis=0), centered_average)
+    assert rmsd < 0.05
+
+def test_iterative_average_structure_callable():
+    rng = np.random.default_rng(8)
+    frames = rng.normal(size=(10, 5, 3))
+    from_list, _ = iterative_average_structure([frames[:5], frames[5:]])
+    from_callable, _ = iterative_average_structure(lambda: iter([frames[:5], frames[5:]]))
+    np.testing.assert_allclose(from_list, from_callable)
+
+    with pytest.raises(TypeError):
+        iterative_average_structure(iter([frames]))
@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+from geomm.clustering import kcenters, kmedoids, assign_nearest
+from geomm.theobald_qcp import QCPReference
+from geomm.pairwise_rmsd import pairwise_rmsd
+
+@pytest.fixture
+def clustered_frames():
+    rng = np.random.default_rng(11)
+    states = [rng.normal(size=(9, 3)) * 2.0 for _ in range(3)]
+    frames = []
+    for i in range(45):
+        rot, _ = np.linalg.qr(rng.normal(size=(3, 3)))
+        rot *= np.sign(np.linalg.det(rot))
+        frames.append((states[i % 3] + rng.normal(scale=0.1, size=(9, 3))) @ rot)
+    return np.array(frames)
+
+def test_kcenters_matches_brute_force(clustered_frames):
+    matrix = pairwise_rmsd(clustered_frames, condensed=False)
+    center_idxs, labels, distances = kcenters(clustered_frames, 5)
+
+    # brute force farthest point clustering
+    expected_centers = [0]
+    for _ in range(4):
+        expected_centers.append(int(np.argmax(matrix[expected_centers].min(axis=0))))
+
+    np.testing.assert_array_equal(center_idxs, expected_centers)
+    np.testing.assert_allclose(distances, matrix[center_idxs].min(axis=0), atol=1e-6)
+    np.testing.assert_array_equal(center_idxs[labels], center_idxs[np.argmin(matrix[center_idxs], axis=0)])
+
+def test_kmedoids(clustered_frames):
+    matrix = pairwise_rmsd(clustered_frames, condensed=False)
+    medoid_idxs, labels, distances = kmedoids(clustered_frames, 3)
+
+    # recovers the three states
+    for state in range(3):
+        assert len(set(labels[state::3])) == 1
+    assert len(set(labels)) == 3
+
+    np.testing.assert_allclose(distances, matrix[medoid_idxs[labels], np.arange(45)], atol=1e-6)
+    # each medoid is the member with the smallest total distance
+    for cluster_i, medoid_idx in enumerate(medoid_idxs):
+        members = np.flatnonzero(labels == cluster_i)
+        costs = matrix[np.ix_(members, members)].sum(axis=1)
+        assert np.isclose(costs.min(), matrix[medoid_idx, members].sum())
+
+def test_kmedoids_pruning(clustered_frames):
+    matrix = pairwise_rmsd(clustered_frames, condensed=False)
+
+    # small blocks stop the sums of the candidates early
+    medoid_idxs, labels, _ = kmedoids(clustered_frames, 3, n_medoid_candidates=None,
+                                      block_size=2)
+
+    for cluster_i, medoid_idx in enumerate(medoid_idxs):
+        members = np.flatnonzero(labels == cluster_i)
+        costs = matrix[np.ix_(members, members)].sum(axis=1)
+        assert np.isclose(costs.min(), matrix[medoid_idx, members].sum())
+
+def test_clustering_duplicate_frames():
+    # only two distinct frames, the copies are at an RMSD of exactly 0
+    states = np.array([[[1.0, 0.0, 0.0], [-1.0, 0.0, 0.0], [0.0, 1.0, 0.0], [0.0, -1.0, 0.0]],
+                       [[2.0, 0.0, 0.0], [-2.0, 0.0, 0.0], [0.0, 1.0, 0.0], [0.0, -1.0, 0.0]]])
+    frames = np.repeat(states, 3, axis=0)
+
+    for cluster in (kcenters, kmedoids):
+        center_idxs, labels, distances = cluster(frames, 4)
+
+        assert center_idxs.shape == (2,)
+        assert len(set(center_idxs // 3)) == 2
+        np.testing.assert_array_equal(labels, np.repeat(labels[::3], 3))
+        np.testing.assert_array_equal(np.bincount(labels), [3, 3])
+        np.testing.assert_array_equal(distances, 0.0)
+
+@pytest.mark.parametrize('ref_distances', [True, False])
+def test_assign_nearest(clustered_frames, ref_distances):
+    rng = np.random.default_rng(12)
+    refs = clustered_frames[rng.choice(45, size=10, replace=False)] + \
+        rng.normal(scale=0.05, size=(10, 9, 3))
+    idxs = np.arange(1, 9)
+
+    labels, distances = assign_nearest(clustered_frames, refs, idxs=idxs,
+                                       ref_distances=ref_distances)
+
+    brute_force = np.array([QCPReference(ref, idxs=idxs).rmsd(clustered_frames)
+                            for ref in refs])
+    np.testing.assert_array_equal(labels, np.argmin(brute_force, axis=0))
+    np.testing.assert_allclose(distances, brute_force.min(axis=0))
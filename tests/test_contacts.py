@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+from geomm.contacts import group_index_array, contact_pairs, ContactFrequencies
+from geomm.neighbors import minimum_image
+
+def brute_force_contacts(coords, group_idxs, cutoff, unitcell_side_lengths=None):
+    diffs = coords[np.newaxis, :, :] - coords[:, np.newaxis, :]
+    if unitcell_side_lengths is not None:
+        diffs = minimum_image(diffs, unitcell_side_lengths=unitcell_side_lengths)
+    i, j = np.nonzero(np.linalg.norm(diffs, axis=2) <= cutoff)
+    gi, gj = group_idxs[i], group_idxs[j]
+    keep = (gi >= 0) & (gj >= 0) & (gi < gj)
+    return set(zip(gi[keep], gj[keep]))
+
+@pytest.mark.parametrize("unitcell_side_lengths", [None, np.array([3.0, 3.5, 4.0])])
+def test_contact_frequencies(unitcell_side_lengths):
+    rng = np.random.default_rng(20)
+    n_atoms = 60
+    coords = rng.uniform(0, 3, size=(5, n_atoms, 3))
+    # 12 residues of 4 atoms and some atoms that are not in any
+    group_idxs = group_index_array([np.arange(4 * i, 4 * i + 4) for i in range(12)],
+                                   n_atoms)
+    assert np.all(group_idxs[48:] == -1)
+
+    weights = rng.uniform(size=5)
+    cutoff = 0.6
+
+    expected = np.zeros((12, 12))
+    for frame, weight in zip(coords, weights):
+        contacts = brute_force_contacts(frame, group_idxs, cutoff,
+                                        unitcell_side_lengths=unitcell_side_lengths)
+        assert set(map(tuple, contact_pairs(frame, group_idxs, cutoff,
+                                            unitcell_side_lengths=unitcell_side_lengths))) \
+            == contacts
+        for i, j in contacts:
+            expected[i, j] += weight
+            expected[j, i] += weight
+
+    # a small buffer so the contacts are summed several times
+    contact_frequencies = ContactFrequencies(group_idxs, cutoff,
+                                             unitcell_side_lengths=unitcell_side_lengths,
+                                             buffer_size=10)
+    contact_frequencies.add_frames(coords[:3], weights=weights[:3])
+    for frame, weight in zip(coords[3:], weights[3:]):
+        contact_frequencies.add_frame(frame, weight=weight)
+
+    assert contact_frequencies.n_frames == 5
+    np.testing.assert_allclose(contact_frequencies.counts().toarray(), expected)
+    np.testing.assert_allclose(contact_frequencies.frequencies().toarray(),
+                               expected / weights.sum())
+    np.testing.assert_allclose(contact_frequencies.counts(symmetric=False).toarray(),
+                               np.triu(expected))
@@ -1,6 +1,7 @@
 import numpy as np
 import pytest
-from geomm.distance import minimum_distance
+import scipy.spatial.distance as dist
+from geomm.distance import minimum_distance, minimum_distance_trajectory, distance, atom_pairs
 
 def test_minimum_distance_simple():
     coordsA = np.array([[0, 0, 0], [1, 1, 1]])
@@ -28,4 +29,132 @@ def test_minimum_distance_assertion_error():
     coordsA = np.array([[0, 0], [1, 1]])  # Not 3D
     coordsB = np.array([[2, 2], [3, 3]])
     with pytest.raises(AssertionError):
-        minimum_distance(coordsA, coordsB)
\ No newline at end of file
+        minimum_distance(coordsA, coordsB)
+
+@pytest.mark.parametrize("unitcell_side_lengths", [None, np.array([10.0, 10.0, 10.0])])
+def test_minimum_distance_at_cutoff(unitcell_side_lengths):
+    coordsA = np.array([[1.0, 1.0, 1.0]])
+    coordsB = np.array([[1.5, 1.0, 1.0]])
+    assert minimum_distance(coordsA, coordsB, unitcell_side_lengths=unitcell_side_lengths,
+                            cutoff=0.5) == 0.5
+    assert minimum_distance(coordsA, coordsB, unitcell_side_lengths=unitcell_side_lengths,
+                            cutoff=0.4) == np.inf
+
+def test_distance_pairs_and_blocks():
+    rng = np.random.default_rng(17)
+    coords = rng.normal(size=(4, 12, 3))
+    idxs_a, idxs_b = np.arange(3), np.arange(5, 12)
+
+    distances = distance(coords, atom_pairs(idxs_a, idxs_b), block_size=5)
+    assert distances.shape == (4, 21)
+    for frame, frame_distances in zip(coords, distances):
+        np.testing.assert_allclose(frame_distances.reshape((3, 7)),
+                                   dist.cdist(frame[idxs_a], frame[idxs_b]))
+
+    # all unique pairs of a single frame
+    np.testing.assert_allclose(distance(coords[0]), dist.pdist(coords[0]))
+
+def test_distance_minimum_image(tmp_path):
+    rng = np.random.default_rng(18)
+    lengths = np.array([[2.0, 3.0, 4.0], [2.5, 3.5, 4.5]])
+    coords = rng.uniform(-5, 5, size=(2, 6, 3))
+    pairs = atom_pairs(np.arange(6))
+
+    distances = distance(coords, pairs, unitcell_side_lengths=lengths,
+                         filename=str(tmp_path / "distances.npy"), block_size=7)
+    assert isinstance(distances, np.memmap)
+
+    # the shortest distance over the neighbouring images
+    shifts = np.array(np.meshgrid(*[np.arange(-6, 7)] * 3)).reshape((3, -1)).T
+    for frame, box, frame_distances in zip(coords, lengths, distances):
+        diffs = frame[pairs[:, 1]] - frame[pairs[:, 0]]
+        expected = np.min(np.linalg.norm(diffs[:, np.newaxis] + shifts * box, axis=2),
+                          axis=1)
+        np.testing.assert_allclose(frame_distances, expected)
+        assert np.all(frame_distances <= np.linalg.norm(box) / 2 + 1e-12)
+
+    out = np.zeros((2, pairs.shape[0]))
+    assert distance(coords, pairs, unitcell_side_lengths=lengths[0], out=out) is out
+    np.testing.assert_allclose(out[0], distances[0])
+
+def test_distance_float32_out():
+    rng = np.random.default_rng(19)
+    coords = rng.normal(size=(5, 8, 3))
+    pairs = atom_pairs([0, 1], [4, 5, 6])
+
+    out = np.empty((5, 6), dtype=np.float32)
+    distance(coords.astype(np.float32), pairs, out=out, block_size=10)
+    np.testing.assert_allclose(out, distance(coords, pairs), rtol=1e-5)
+
+@pytest.mark.parametrize("unitcell_side_lengths", [None, np.array([3.0, 3.0, 3.0])])
+def test_minimum_distance_trajectory(unitcell_side_lengths):
+    rng = np.random.default_rng(20)
+    coords = rng.uniform(0, 3, size=(6, 40, 3))
+    idxs_a, idxs_b = np.arange(30), np.arange(30, 40)
+
+    expected = [minimum_distance(frame[idxs_a], frame[idxs_b],
+                                 unitcell_side_lengths=unitcell_side_lengths)
+                for frame in coords]
+
+    min_distances, pairs = minimum_distance_trajectory(
+        coords, idxs_a, idxs_b, unitcell_side_lengths=unitcell_side_lengths,
+        return_pairs=True)
+    np.testing.assert_allclose(min_distances, expected)
+    assert np.all(np.isin(pairs[:, 0], idxs_a)) and np.all(np.isin(pairs[:, 1], idxs_b))
+    np.testing.assert_allclose(
+        [minimum_distance(frame[[i]], frame[[j]], unitcell_side_lengths=unitcell_side_lengths)
+         for frame, (i, j) in zip(coords, pairs)], expected)
+
+    cutoff = np.median(expected)
+    below, below_pairs = minimum_distance_trajectory(
+        coords, idxs_a, idxs_b, unitcell_side_lengths=unitcell_side_lengths,
+        cutoff=cutoff, below_cutoff=True, return_pairs=True, block_size=3)
+    np.testing.assert_array_equal(below, np.array(expected) <= cutoff)
+    for frame, is_below, (i, j) in zip(coords, below, below_pairs):
+        if is_below:
+            assert minimum_distance(frame[[i]], frame[[j]],
+                                    unitcell_side_lengths=unitcell_side_lengths) <= cutoff
+        else:
+            assert i == -1 and j == -1
+
+@pytest.mark.parametrize("unitcell_side_lengths", [None, np.array([10.0, 10.0, 10.0])])
+def test_minimum_distance_trajectory_at_cutoff(unitcell_side_lengths):
+    coords = np.array([[[1.0, 1.0, 1.0], [1.5, 1.0, 1.0]]])
+
+    min_distances, pairs = minimum_distance_trajectory(
+        coords, [0], [1], unitcell_side_lengths=unitcell_side_lengths,
+        cutoff=0.5, return_pairs=True)
+    np.testing.assert_allclose(min_distances, [0.5])
+    np.testing.assert_array_equal(pairs, [[0, 1]])
+
+    below, below_pairs = minimum_distance_trajectory(
+        coords, [0], [1], unitcell_side_lengths=unitcell_side_lengths,
+        cutoff=0.5, below_cutoff=True, return_pairs=True)
+    np.testing.assert_array_equal(below, [True])
+    np.testing.assert_array_equal(below_pairs, [[0, 1]])
+
+def test_minimum_distance_trajectory_tree_reuse():
+    rng = np.random.default_rng(21)
+    steps = rng.normal(scale=0.05, size=(20, 40, 3))
+    coords = rng.uniform(0, 3, size=(1, 40, 3)) + np.cumsum(steps, axis=0)
+    idxs_a, idxs_b = np.arange(30), np.arange(30, 40)
+
+    expected = np.array([minimum_distance(frame[idxs_a], frame[idxs_b])
+                         for frame in coords])
+    cutoff = np.median(expected)
+    for skin in (0.0, 0.1, 10.0):
+        below = minimum_distance_trajectory(coords, idxs_a, idxs_b, cutoff=cutoff,
+                                            below_cutoff=True, skin=skin)
+        np.testing.assert_array_equal(below, expected <= cutoff)
+
+    for skin in (None, 0.0, 0.1, 10.0):
+        min_distances, pairs = minimum_distance_trajectory(coords, idxs_a, idxs_b, skin=skin,
+                                                           return_pairs=True)
+        np.testing.assert_allclose(min_distances, expected)
+        np.testing.assert_allclose(np.linalg.norm(coords[np.arange(20), pairs[:, 0]] -
+                                                  coords[np.arange(20), pairs[:, 1]], axis=1),
+                                   expected)
+
+        min_distances = minimum_distance_trajectory(coords, idxs_a, idxs_b, cutoff=cutoff,
+                                                    skin=skin)
+        np.testing.assert_allclose(min_distances, np.where(expected <= cutoff, expected, np.inf))
@@ -0,0 +1,76 @@
+import itertools as it
+
+import numpy as np
+import pytest
+from geomm.neighbors import (CellList, periodic_minimum_distance, minimum_image,
+                             neighbor_pairs)
+from geomm.distance import minimum_distance
+from geomm.box_vectors import lengths_and_angles_to_box_vectors
+
+def brute_force_distances(coordsA, coordsB, box_vectors):
+    shifts = np.array(list(it.product(range(-2, 3), repeat=3))) @ box_vectors
+    diffs = coordsB[np.newaxis, :, :] - coordsA[:, np.newaxis, :]
+    return np.min(np.linalg.norm(diffs[:, :, np.newaxis, :] + shifts, axis=3), axis=2)
+
+@pytest.fixture(params=['rectangular', 'triclinic'])
+def box(request):
+    if request.param == 'rectangular':
+        return np.diag([3.0, 4.0, 5.0])
+    else:
+        return np.array(lengths_and_angles_to_box_vectors([4.0, 4.0, 4.0],
+                                                          [60.0, 60.0, 90.0]))
+
+def test_minimum_image(box):
+    rng = np.random.default_rng(18)
+    diffs = rng.uniform(-4, 4, size=(50, 3))
+    expected = brute_force_distances(np.zeros((1, 3)), diffs, box)[0]
+    np.testing.assert_allclose(np.linalg.norm(minimum_image(diffs, box_vectors=box), axis=1),
+                               expected)
+
+def test_periodic_minimum_distance(box):
+    rng = np.random.default_rng(19)
+    fractional = rng.uniform(-0.5, 1.5, size=(200, 3))
+    coords = fractional @ box
+    coordsA, coordsB = coords[:5], coords[5:]
+
+    distances = brute_force_distances(coordsA, coordsB, box)
+    i, j = np.unravel_index(np.argmin(distances), distances.shape)
+
+    min_distance, pair = periodic_minimum_distance(coordsA, coordsB, box_vectors=box,
+                                                   return_pair=True)
+    assert np.isclose(min_distance, distances[i, j])
+    assert pair == (i, j)
+    assert np.isclose(minimum_distance(coordsA, coordsB, box_vectors=box), distances[i, j])
+
+    # with a cutoff
+    cutoff = distances[i, j] * 1.5
+    assert np.isclose(minimum_distance(coordsA, coordsB, box_vectors=box, cutoff=cutoff),
+                      distances[i, j])
+    assert minimum_distance(coordsA, coordsB, box_vectors=box,
+                            cutoff=distances[i, j] * 0.9) == np.inf
+
+    # all the neighbours within a cutoff
+    cell_list = CellList(coordsB, 1.0, box_vectors=box)
+    pairs, pair_distances = cell_list.neighbors(coordsA)
+    expected_pairs = np.argwhere(distances <= 1.0)
+    assert sorted(map(tuple, pairs)) == sorted(map(tuple, expected_pairs))
+    np.testing.assert_allclose(pair_distances, distances[pairs[:, 0], pairs[:, 1]])
+
+def test_minimum_distance_rectangular_lengths():
+    coordsA = np.array([[0.1, 0.1, 0.1]])
+    coordsB = np.array([[2.9, 0.1, 0.1], [1.5, 1.5, 1.5]])
+
+    # across the boundary
+    assert np.isclose(minimum_distance(coordsA, coordsB,
+                                       unitcell_side_lengths=np.array([3.0, 3.0, 3.0])),
+                      0.2)
+    assert np.isclose(minimum_distance(coordsA, coordsB), np.sqrt(3 * 1.4**2))
+
+def test_neighbor_pairs_at_cutoff():
+    coords = np.array([[0.0, 0.0, 0.0], [0.5, 0.0, 0.0], [2.0, 0.0, 0.0]])
+
+    # a pair at exactly the cutoff is included with or without a box
+    for lengths in (None, np.array([10.0, 10.0, 10.0])):
+        pairs, distances = neighbor_pairs(coords, 0.5, unitcell_side_lengths=lengths)
+        np.testing.assert_array_equal(pairs, [[0, 1]])
+        np.testing.assert_allclose(distances, [0.5])
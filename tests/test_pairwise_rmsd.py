@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+from geomm.theobald_qcp import theobald_qcp
+from geomm.pairwise_rmsd import pairwise_rmsd, condensed_index
+
+@pytest.fixture
+def frames():
+    rng = np.random.default_rng(3)
+    return rng.normal(size=(11, 7, 3))
+
+def reference_matrix(frames, idxs=None):
+    if idxs is not None:
+        frames = frames[:, idxs]
+    centered = frames - frames.mean(axis=1, keepdims=True)
+    n_frames = frames.shape[0]
+    matrix = np.zeros((n_frames, n_frames))
+    for i in range(n_frames):
+        for j in range(n_frames):
+            if i != j:
+                matrix[i, j] = theobald_qcp(centered[i], centered[j])[0]
+    return matrix
+
+def test_pairwise_rmsd_square(frames):
+    expected = reference_matrix(frames)
+    # tile size that does not divide the number of frames
+    result = pairwise_rmsd(frames, condensed=False, tile_size=4)
+    np.testing.assert_allclose(result, expected, atol=1e-10)
+
+def test_pairwise_rmsd_condensed(frames):
+    idxs = np.array([0, 2, 3, 6])
+    expected = reference_matrix(frames, idxs=idxs)
+    result = pairwise_rmsd(frames, idxs=idxs, tile_size=3)
+
+    assert result.shape == (11 * 10 // 2,)
+    for i in range(11):
+        for j in range(i + 1, 11):
+            assert np.isclose(result[condensed_index(11, i, j)], expected[i, j])
+
+def test_pairwise_rmsd_memmap(frames, tmp_path):
+    path = str(tmp_path / "rmsds.npy")
+    result = pairwise_rmsd(frames, filename=path, tile_size=5)
+    np.testing.assert_allclose(np.load(path), pairwise_rmsd(frames))
+    assert isinstance(result, np.memmap)
+
+def test_pairwise_rmsd_float32(frames):
+    np.testing.assert_allclose(pairwise_rmsd(frames.astype(np.float32)),
+                               pairwise_rmsd(frames), rtol=1e-5)
@@ -1,6 +1,6 @@
 import numpy as np
 import pytest
-from geomm.rmsd import calc_rmsd
+from geomm.rmsd import calc_rmsd, calc_rmsd_chunks, iter_calc_rmsd
 
 def test_rmsd_identical_coords():
     ref = np.array([[0.0, 0.0, 0.0],
@@ -44,4 +44,18 @@ def test_rmsd_rank_assertion():
     ref = np.zeros((3, 3))
     coords = np.zeros((3, 3, 1))
     with pytest.raises(AssertionError):
-        calc_rmsd(ref, coords)
\ No newline at end of file
+        calc_rmsd(ref, coords)
+
+def test_calc_rmsd_chunks():
+    rng = np.random.default_rng(5)
+    ref = rng.normal(size=(6, 3))
+    frames = rng.normal(size=(10, 6, 3)).astype(np.float32)
+    idxs = np.array([0, 2, -1])
+    chunks = [frames[:4], frames[4:8], frames[8:]]
+
+    expected = np.array([calc_rmsd(ref, frame, idxs=idxs) for frame in frames])
+    np.testing.assert_allclose(calc_rmsd_chunks(ref, chunks, idxs=idxs), expected)
+
+    # the yielded arrays are reused buffers
+    first, second = [rmsds for rmsds in iter_calc_rmsd(ref, chunks[:2])]
+    assert np.shares_memory(first, second)
@@ -0,0 +1,253 @@
+import numpy as np
+import pytest
+
+from geomm.sasa import (shrake_rupley, shrake_rupley_traj, sphere_points, IncrementalSASA,
+                        lcpo, fit_lcpo_parameters, sasa, _lcpo_terms)
+
+def brute_force_sasa(coords, radii, probe_radius, n_sphere_points):
+
+    radii = radii + probe_radius
+    unit_points = sphere_points(n_sphere_points)
+
+    areas = np.zeros((coords.shape[0],))
+    for i in range(coords.shape[0]):
+        points = coords[i] + radii[i] * unit_points
+        dists = np.linalg.norm(points[:, None, :] - coords[None, :, :], axis=2)
+        dists[:, i] = np.inf
+        accessible = np.all(dists >= radii[None, :], axis=1)
+        areas[i] = 4 * np.pi * radii[i]**2 * accessible.mean()
+
+    return areas
+
+def test_sphere_points_cache():
+
+    points = sphere_points(300)
+
+    assert points is sphere_points(300)
+    assert points is sphere_points(300, 1.0)
+    assert not points.flags.writeable
+    assert np.allclose(np.linalg.norm(points, axis=1), 1.0)
+
+    scaled = sphere_points(300, 0.25)
+    assert np.allclose(scaled, 0.25 * points)
+
+def test_isolated_atom():
+
+    area = shrake_rupley(np.zeros((1, 3)), np.array([0.15]))
+
+    assert np.allclose(area, 4 * np.pi * 0.29**2)
+
+def test_two_atoms_cap():
+
+    # the first sphere loses a cap cut by the plane of intersection
+    coords = np.array([[0.0, 0.0, 0.0], [0.3, 0.0, 0.0]])
+    radii = np.array([0.16, 0.16])
+
+    areas = shrake_rupley(coords, radii, probe_radius=0.14, n_sphere_points=5000)
+
+    R = 0.3
+    cap_height = R - 0.3 / 2
+    expected = 4 * np.pi * R**2 - 2 * np.pi * R * cap_height
+
+    assert np.allclose(areas, expected, rtol=1e-3)
+
+def test_shrake_rupley_brute_force():
+
+    rng = np.random.RandomState(3)
+    coords = rng.uniform(0.0, 2.0, size=(300, 3))
+    radii = rng.uniform(0.1, 0.2, size=(300,))
+
+    areas = shrake_rupley(coords, radii, n_sphere_points=200)
+
+    assert np.allclose(areas, brute_force_sasa(coords, radii, 0.14, 200))
+
+def test_shrake_rupley_frames():
+
+    rng = np.random.RandomState(4)
+    coords = rng.uniform(0.0, 2.0, size=(3, 200, 3)).astype(np.float32)
+    radii = rng.uniform(0.1, 0.2, size=(200,))
+
+    areas = shrake_rupley(coords, radii, n_sphere_points=100)
+
+    assert areas.shape == (3, 200)
+    for frame_idx in range(3):
+        assert np.allclose(areas[frame_idx],
+                           shrake_rupley(coords[frame_idx].astype(np.float64), radii,
+                                         n_sphere_points=100),
+                           atol=1e-6)
+
+def test_shrake_rupley_traj(tmp_path):
+
+    rng = np.random.RandomState(5)
+    coords = rng.uniform(0.0, 2.0, size=(7, 150, 3))
+    radii = rng.uniform(0.1, 0.2, size=(150,))
+
+    serial = shrake_rupley(coords, radii, n_sphere_points=100)
+
+    areas = shrake_rupley_traj(coords, radii, n_sphere_points=100, num_threads=3)
+    assert np.array_equal(areas, serial)
+
+    filename = str(tmp_path / 'areas.npy')
+    shrake_rupley_traj(coords, radii, n_sphere_points=100, filename=filename,
+                       num_threads=2)
+    assert np.array_equal(np.load(filename), serial)
+
+    out = np.zeros((7, 150), dtype=np.float32)
+    shrake_rupley_traj(coords, radii, n_sphere_points=100, out=out)
+    assert np.array_equal(out, serial.astype(np.float32))
+
+def test_incremental_sasa():
+
+    rng = np.random.RandomState(6)
+    n_atoms = 300
+    coords = rng.uniform(0.0, 2.0, size=(n_atoms, 3))
+    radii = rng.uniform(0.1, 0.2, size=(n_atoms,))
+
+    calc = IncrementalSASA(radii, n_sphere_points=100, skin=0.05)
+
+    for frame_idx in range(10):
+        # only a few atoms move between frames
+        movers = rng.choice(n_atoms, size=5, replace=False)
+        coords[movers] += rng.normal(scale=0.02, size=(5, 3))
+
+        areas = calc.update(coords)
+
+        assert np.allclose(areas, shrake_rupley(coords, radii, n_sphere_points=100),
+                           rtol=1e-12, atol=0.0)
+
+    assert calc.n_frames == 10
+    assert calc.n_computed + calc.n_skipped == 10 * n_atoms
+    assert calc.skipped_fraction > 0.5
+    assert calc.burial_masks.shape == (n_atoms, 100)
+
+def test_incremental_sasa_tolerance():
+
+    rng = np.random.RandomState(7)
+    coords = rng.uniform(0.0, 2.0, size=(200, 3))
+    radii = rng.uniform(0.1, 0.2, size=(200,))
+
+    calc = IncrementalSASA(radii, n_sphere_points=100, tolerance=0.01)
+    first = calc.update(coords)
+
+    # motions under the tolerance recompute nothing
+    areas = calc.update(coords + rng.uniform(-0.005, 0.005, size=coords.shape))
+
+    assert calc.n_skipped == 200
+    assert np.array_equal(areas, first)
+
+def test_incremental_sasa_tolerance_bound():
+
+    rng = np.random.RandomState(12)
+    n_atoms = 60
+    coords = rng.uniform(0.0, 1.5, size=(n_atoms, 3))
+    radii = rng.uniform(0.1, 0.2, size=(n_atoms,))
+    tolerance = 0.02
+
+    calc = IncrementalSASA(radii, n_sphere_points=100, tolerance=tolerance)
+
+    frames = []
+    references = []
+    for frame_idx in range(15):
+        coords = coords + rng.normal(scale=0.005, size=coords.shape)
+        areas = calc.update(coords)
+
+        frames.append(coords)
+        references.append(shrake_rupley(coords, radii, n_sphere_points=100))
+
+        # each area is that of an earlier frame in which the atom and
+        # the atoms overlapping it were within twice the tolerance of
+        # where they are now
+        for atom_idx in range(n_atoms):
+            assert any(
+                np.isclose(areas[atom_idx], reference[atom_idx])
+                and np.all(np.linalg.norm(frame - coords, axis=1)[
+                    np.linalg.norm(frame - frame[atom_idx], axis=1)
+                    < radii + radii[atom_idx] + 2 * 0.14] <= 2 * tolerance)
+                for frame, reference in zip(frames, references))
+
+    assert calc.n_skipped > 0
+    assert calc.n_computed > n_atoms
+
+def brute_force_lcpo_terms(coords, radii):
+
+    n_atoms = coords.shape[0]
+    dists = np.linalg.norm(coords[:, None] - coords[None, :], axis=2)
+
+    def overlap(i, j):
+        d = dists[i, j]
+        if i == j or d >= radii[i] + radii[j]:
+            return 0.0
+        area = np.pi * radii[i] * (2 * radii[i] - d - (radii[i]**2 - radii[j]**2) / d)
+        return np.clip(area, 0.0, 4 * np.pi * radii[i]**2)
+
+    terms = np.zeros((n_atoms, 4))
+    for i in range(n_atoms):
+        neighbors = [j for j in range(n_atoms) if j != i and dists[i, j] < radii[i] + radii[j]]
+        terms[i, 0] = 4 * np.pi * radii[i]**2
+        for j in neighbors:
+            neighbor_sum = sum(overlap(j, k) for k in neighbors if k != j)
+            terms[i, 1] += overlap(i, j)
+            terms[i, 2] += neighbor_sum
+            terms[i, 3] += overlap(i, j) * neighbor_sum
+
+    return terms
+
+def test_lcpo_terms():
+
+    rng = np.random.RandomState(8)
+    coords = rng.uniform(0.0, 1.5, size=(2, 80, 3))
+    radii = rng.uniform(0.25, 0.35, size=(80,))
+
+    terms = _lcpo_terms(coords, radii)
+
+    for frame_idx in range(2):
+        assert np.allclose(terms[frame_idx], brute_force_lcpo_terms(coords[frame_idx], radii))
+
+def test_lcpo_two_atoms():
+
+    # only the pairwise term is needed for two spheres
+    coords = np.array([[0.0, 0.0, 0.0], [0.3, 0.0, 0.0]])
+    radii = np.array([0.16, 0.16])
+
+    areas = lcpo(coords, radii, parameters=[1.0, -1.0, 0.0, 0.0])
+
+    R = 0.3
+    expected = 4 * np.pi * R**2 - 2 * np.pi * R * (R - 0.3 / 2)
+
+    assert np.allclose(areas, expected)
+
+def test_lcpo_default_parameters_warn():
+
+    coords = np.array([[0.0, 0.0, 0.0], [0.3, 0.0, 0.0]])
+    radii = np.array([0.16, 0.16])
+
+    with pytest.warns(UserWarning):
+        lcpo(coords, radii)
+
+def test_lcpo_fit():
+
+    rng = np.random.RandomState(9)
+    coords = rng.uniform(0.0, 2.0, size=(4, 200, 3))
+    radii = rng.uniform(0.1, 0.2, size=(200,))
+
+    reference = shrake_rupley(coords, radii, n_sphere_points=200)
+    parameters = fit_lcpo_parameters(coords[:2], radii, reference[:2])
+
+    areas = sasa(coords[2:], radii, method='lcpo', lcpo_parameters=parameters)
+
+    assert areas.shape == (2, 200)
+    assert np.allclose(areas.sum(axis=1), reference[2:].sum(axis=1), rtol=0.05)
+
+def test_incremental_sasa_beyond_skin():
+
+    coords = np.array([[0.0, 0.0, 0.0], [0.3, 0.0, 0.0]])
+    radii = np.array([0.15, 0.15])
+
+    calc = IncrementalSASA(radii, n_sphere_points=200, skin=0.1)
+    calc.update(coords)
+
+    # the neighbor moves out of the lists in a single frame
+    coords[1, 0] = 5.0
+    areas = calc.update(coords)
+
+    assert np.allclose(areas, shrake_rupley(coords, radii, n_sphere_points=200))
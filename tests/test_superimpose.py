@@ -0,0 +1,134 @@
+import numpy as np
+import pytest
+from geomm.superimpose import superimpose, superimpose_traj, superimpose_rmsds, \
+    robust_superimpose_traj, \
+    alt_superimpose, alt_superimpose_traj
+from geomm.rmsd import calc_rmsd
+from geomm.theobald_qcp import QCPReference
+
+@pytest.fixture
+def frames():
+    rng = np.random.default_rng(21)
+    ref = rng.normal(size=(10, 3))
+    frames = []
+    for _ in range(6):
+        rot, _ = np.linalg.qr(rng.normal(size=(3, 3)))
+        rot *= np.sign(np.linalg.det(rot))
+        frames.append((ref + rng.normal(scale=0.2, size=ref.shape)) @ rot
+                      + rng.normal(size=3))
+    return ref, np.array(frames)
+
+def test_superimpose_traj_matches_superimpose(frames):
+    ref, coords = frames
+    ref = ref - ref.mean(axis=0)
+    centered = coords - coords.mean(axis=1, keepdims=True)
+
+    sup_coords, rots, rmsds = superimpose_traj(ref, coords)
+
+    for frame, sup_frame, rot, rmsd in zip(centered, sup_coords, rots, rmsds):
+        expected_coords, expected_rot, expected_rmsd = superimpose(ref, frame)
+        np.testing.assert_allclose(sup_frame, expected_coords, atol=1e-10)
+        np.testing.assert_allclose(rot, expected_rot, atol=1e-10)
+        assert np.isclose(rmsd, expected_rmsd)
+
+def test_superimpose_traj_out_and_in_place(frames):
+    ref, coords = frames
+    idxs = np.arange(2, 9)
+    expected, _, _ = QCPReference(ref, idxs=idxs).superimpose(coords)
+
+    out = np.empty_like(coords)
+    result, _, _ = superimpose_traj(ref, coords, idxs=idxs, out=out)
+    assert result is out
+    np.testing.assert_allclose(out, expected, atol=1e-10)
+
+    # in place, with blocks that do not divide the frames
+    in_place = coords.copy()
+    superimpose_traj(ref, in_place, idxs=idxs, out=in_place, block_size=40)
+    np.testing.assert_allclose(in_place, expected, atol=1e-10)
+
+def test_alt_superimpose_traj(frames):
+    ref, coords = frames
+    # include a reflected frame
+    coords = np.concatenate([coords, -coords[:1]])
+
+    translations, rotations = alt_superimpose_traj(ref, coords)
+
+    assert translations.shape == (7, 3)
+    assert rotations.shape == (7, 3, 3)
+    for frame, translation, rotation in zip(coords, translations, rotations):
+        expected_translation, expected_rotation = alt_superimpose(ref, frame)
+        np.testing.assert_allclose(translation, expected_translation, atol=1e-10)
+        np.testing.assert_allclose(rotation, expected_rotation, atol=1e-10)
+        assert np.isclose(np.linalg.det(rotation), 1.0)
+
+def test_superimpose_rmsds_matches_superimpose_traj(frames):
+    ref, coords = frames
+    align_idxs = np.arange(6)
+    selections = [np.arange(6, 10), np.array([0, 9]), np.arange(10) % 3 == 0]
+
+    rmsds, qcp_rmsds = superimpose_rmsds(ref, coords, selections, idxs=align_idxs)
+    sup_coords, _, expected_qcp_rmsds = superimpose_traj(ref, coords, idxs=align_idxs)
+
+    assert rmsds.shape == (coords.shape[0], len(selections))
+    np.testing.assert_allclose(qcp_rmsds, expected_qcp_rmsds)
+    for frame_rmsds, sup_frame in zip(rmsds, sup_coords):
+        expected = [calc_rmsd(ref, sup_frame, idxs=np.arange(10)[selection])
+                    for selection in selections]
+        np.testing.assert_allclose(frame_rmsds, expected, atol=1e-10)
+
+    # a single float32 frame
+    frame_rmsds, qcp_rmsd = superimpose_rmsds(ref, coords[0].astype(np.float32),
+                                              selections, idxs=align_idxs)
+    np.testing.assert_allclose(frame_rmsds, rmsds[0], atol=1e-5)
+    assert np.isclose(qcp_rmsd, qcp_rmsds[0], atol=1e-5)
+
+def test_robust_superimpose_traj_finds_core():
+    rng = np.random.default_rng(15)
+    ref = rng.normal(size=(20, 3))
+    frames = []
+    for _ in range(8):
+        frame = ref + rng.normal(scale=0.01, size=ref.shape)
+        # a floppy loop
+        frame[15:] += rng.normal(scale=2.0, size=(5, 3))
+        rot, _ = np.linalg.qr(rng.normal(size=(3, 3)))
+        rot *= np.sign(np.linalg.det(rot))
+        frames.append(frame @ rot + rng.normal(size=3))
+    frames = np.array(frames)
+
+    # a single iteration is the unweighted alignment
+    _, rots, _, _, n_iterations = robust_superimpose_traj(ref, frames, max_iterations=1)
+    _, expected_rots, _ = superimpose_traj(ref, frames)
+    np.testing.assert_allclose(rots, expected_rots, atol=1e-10)
+    assert np.all(n_iterations == 1)
+
+    sup_coords, rots, rmsds, weights, n_iterations = robust_superimpose_traj(
+        ref, frames, sigma=0.1)
+
+    assert weights.shape == (8, 20)
+    assert np.all(weights[:, :15] > 0.9) and np.all(weights[:, 15:] < 0.1)
+    core_rmsds = np.sqrt(np.mean(np.sum(np.square(sup_coords[:, :15] - ref[:15]), axis=2),
+                                 axis=1))
+    assert np.all(core_rmsds < 0.03)
+    assert np.all(n_iterations < 20)
+
+    # the returned weights are the ones of the returned alignment,
+    # also for frames stopped before converging
+    sup_coords_3, rots_3, _, weights_3, _ = robust_superimpose_traj(
+        ref, frames, sigma=0.1, max_iterations=3)
+    for frame_idx in range(8):
+        # weighted Kabsch alignment
+        w = weights_3[frame_idx][:, np.newaxis]
+        ref_center = np.sum(w * ref, axis=0) / w.sum()
+        center = np.sum(w * frames[frame_idx], axis=0) / w.sum()
+        U, _, Vt = np.linalg.svd(((frames[frame_idx] - center) * w).T @ (ref - ref_center))
+        expected_rot = U @ np.diag([1.0, 1.0, np.sign(np.linalg.det(U @ Vt))]) @ Vt
+
+        np.testing.assert_allclose(rots_3[frame_idx], expected_rot, atol=1e-8)
+        np.testing.assert_allclose(sup_coords_3[frame_idx],
+                                   (frames[frame_idx] - center) @ expected_rot + ref_center,
+                                   atol=1e-8)
+
+    # in place with float32 frames
+    frames32 = frames.astype(np.float32)
+    robust_superimpose_traj(ref, frames32, sigma=0.1, out=frames32)
+    np.testing.assert_allclose(frames32, sup_coords, atol=1e-4)
@@ -0,0 +1,166 @@
+import numpy as np
+import pytest
+from geomm.theobald_qcp import theobald_qcp, theobald_qcp_traj, theobald_qcp_within, \
+    theobald_qcp_chunks, iter_theobald_qcp, theobald_qcp_sequential, QCPReference
+from geomm.superimpose import superimpose
+
+def random_rotation(rng):
+    q = rng.normal(size=4)
+    q /= np.linalg.norm(q)
+    a, b, c, d = q
+    return np.array([[a*a + b*b - c*c - d*d, 2*(b*c - a*d), 2*(b*d + a*c)],
+                     [2*(b*c + a*d), a*a - b*b + c*c - d*d, 2*(c*d - a*b)],
+                     [2*(b*d - a*c), 2*(c*d + a*b), a*a - b*b - c*c + d*d]])
+
+@pytest.fixture
+def traj():
+    rng = np.random.default_rng(0)
+    ref = rng.normal(size=(20, 3))
+    ref -= ref.mean(axis=0)
+    frames = np.array([(ref + rng.normal(scale=0.3, size=ref.shape)) @ random_rotation(rng)
+                       for _ in range(8)])
+    frames -= frames.mean(axis=1, keepdims=True)
+    return ref, frames
+
+def test_theobald_qcp_traj_matches_single(traj):
+    ref, frames = traj
+    rmsds, rots = theobald_qcp_traj(ref, frames)
+
+    assert rmsds.shape == (8,)
+    assert rots.shape == (8, 3, 3)
+    for frame, rmsd, rot in zip(frames, rmsds, rots):
+        single_rmsd, single_rot = theobald_qcp(ref, frame)
+        assert np.isclose(rmsd, single_rmsd)
+        np.testing.assert_allclose(rot, single_rot, atol=1e-10)
+
+def test_theobald_qcp_traj_uncentered_idxs_weights(traj):
+    ref, frames = traj
+    idxs = np.arange(0, 20, 2)
+    weights = np.linspace(1.0, 2.0, idxs.shape[0])
+    rmsds, rots = theobald_qcp_traj(ref + 5.0, frames - 3.0, idxs=idxs, weights=weights)
+
+    for frame, rmsd, rot in zip(frames, rmsds, rots):
+        sub_ref = ref[idxs] - np.average(ref[idxs], axis=0, weights=weights)
+        sub_frame = frame[idxs] - np.average(frame[idxs], axis=0, weights=weights)
+        single_rmsd, single_rot = theobald_qcp(sub_ref, sub_frame, weights=weights)
+        assert np.isclose(rmsd, single_rmsd)
+        np.testing.assert_allclose(rot, single_rot, atol=1e-10)
+
+def test_theobald_qcp_traj_recovers_rotation():
+    rng = np.random.default_rng(1)
+    ref = rng.normal(size=(15, 3))
+    ref -= ref.mean(axis=0)
+    rot = random_rotation(rng)
+    rmsds, rots = theobald_qcp_traj(ref, (ref @ rot)[np.newaxis])
+    assert np.isclose(rmsds[0], 0.0, atol=1e-6)
+    np.testing.assert_allclose(ref @ rot @ rots[0], ref, atol=1e-6)
+
+def test_theobald_qcp_traj_num_threads(traj):
+    ref, frames = traj
+    frames = np.concatenate([frames] * 50)
+    serial_rmsds, serial_rots = theobald_qcp_traj(ref, frames, num_threads=1)
+    rmsds, rots = theobald_qcp_traj(ref, frames, num_threads=4)
+    np.testing.assert_array_equal(rmsds, serial_rmsds)
+    np.testing.assert_array_equal(rots, serial_rots)
+
+def test_qcp_reference_single_frame(traj):
+    ref, frames = traj
+    idxs = np.arange(5, 15)
+    reference = QCPReference(ref, idxs=idxs)
+    frame = frames[0] - frames[0][idxs].mean(axis=0)
+    sub_ref = ref - ref[idxs].mean(axis=0)
+
+    expected_coords, expected_rot, expected_rmsd = superimpose(sub_ref, frame, idxs=idxs)
+    sup_coords, rot, rmsd = reference.superimpose(frame)
+
+    assert np.isclose(reference.rmsd(frame), expected_rmsd)
+    np.testing.assert_allclose(reference.rotation(frame), expected_rot, atol=1e-10)
+    np.testing.assert_allclose(sup_coords, expected_coords + ref[idxs].mean(axis=0), atol=1e-10)
+    assert np.isclose(rmsd, expected_rmsd)
+
+def test_qcp_reference_frame_stack(traj):
+    ref, frames = traj
+    weights = np.linspace(0.5, 1.5, 20)
+    reference = QCPReference(ref, weights=weights)
+    sup_coords, rots, rmsds = reference.superimpose(frames + 2.0)
+
+    assert sup_coords.shape == frames.shape
+    np.testing.assert_allclose(reference.rmsd(frames), rmsds)
+    for frame, sup_frame, rot in zip(frames, sup_coords, rots):
+        single_sup, single_rot, _ = reference.superimpose(frame)
+        np.testing.assert_allclose(sup_frame, single_sup, atol=1e-10)
+        np.testing.assert_allclose(rot, single_rot, atol=1e-10)
+
+def test_qcp_float32_matches_float64(traj):
+    ref, frames = traj
+    frames32 = frames.astype(np.float32)
+    ref32 = ref.astype(np.float32)
+
+    rmsds, rots = theobald_qcp_traj(ref, frames)
+    rmsds32, rots32 = theobald_qcp_traj(ref32, frames32)
+    # the only error is from rounding the inputs
+    np.testing.assert_allclose(rmsds32, rmsds, rtol=1e-5)
+    np.testing.assert_allclose(rots32, rots, atol=1e-5)
+
+    rmsd32, rot32 = theobald_qcp(ref32, frames32[0])
+    assert np.isclose(rmsd32, rmsds[0], rtol=1e-5)
+    np.testing.assert_allclose(rot32, rots[0], atol=1e-5)
+
+def test_theobald_qcp_within(traj):
+    ref, frames = traj
+    # frames that are scaled up can be pruned by their radius of gyration
+    frames = np.concatenate([frames, frames * 3.0])
+    rmsds, _ = theobald_qcp_traj(ref, frames)
+    cutoff = np.median(rmsds)
+
+    frame_idxs, hit_rmsds = theobald_qcp_within(ref, frames, cutoff)
+
+    np.testing.assert_array_equal(frame_idxs, np.flatnonzero(rmsds <= cutoff))
+    np.testing.assert_allclose(hit_rmsds, rmsds[frame_idxs])
+
+def test_theobald_qcp_chunks(traj):
+    ref, frames = traj
+    idxs = np.arange(3, 17)
+    chunks = [frames[:3], frames[3:6], frames[6:]]
+    expected_rmsds, expected_rots = theobald_qcp_traj(ref, frames, idxs=idxs)
+
+    rmsds, rots = theobald_qcp_chunks(ref, chunks, idxs=idxs, rotations=True)
+    np.testing.assert_allclose(rmsds, expected_rmsds)
+    np.testing.assert_allclose(rots, expected_rots)
+
+    rmsds, rots = theobald_qcp_chunks(ref, (chunk for chunk in chunks), idxs=idxs)
+    np.testing.assert_allclose(rmsds, expected_rmsds)
+    assert rots is None
+
+    first, second = [rmsds for rmsds, _ in iter_theobald_qcp(ref, chunks[:2], idxs=idxs)]
+    assert np.shares_memory(first, second)
+
+def test_theobald_qcp_sequential_warm_start():
+    rng = np.random.default_rng(13)
+    ref = rng.normal(size=(8, 3))
+    # a smooth trajectory drifting away from the reference
+    frames = [ref]
+    for _ in range(40):
+        frames.append(frames[-1] + rng.normal(scale=0.02, size=ref.shape))
+    frames = np.array(frames)
+
+    expected_rmsds, expected_rots = theobald_qcp_traj(ref, frames)
+    cold_rmsds, cold_rots, cold_iterations = theobald_qcp_sequential(ref, frames,
+                                                                     warm_start=False)
+    rmsds, rots, n_iterations = theobald_qcp_sequential(ref, frames)
+
+    np.testing.assert_allclose(cold_rmsds, expected_rmsds)
+    np.testing.assert_allclose(rmsds, expected_rmsds, atol=1e-8)
+    np.testing.assert_allclose(rots, expected_rots, atol=1e-6)
+    assert n_iterations.sum() < cold_iterations.sum()
+
+def test_theobald_qcp_sequential_wrong_root_restarts(traj):
+    ref, _ = traj
+    # unrelated consecutive frames, the warm start may land on the
+    # wrong root but the results must be the same
+    rng = np.random.default_rng(14)
+    frames = rng.normal(size=(50, 20, 3))
+    expected_rmsds, expected_rots = theobald_qcp_traj(ref, frames)
+    rmsds, rots, _ = theobald_qcp_sequential(ref, frames)
+    np.testing.assert_allclose(rmsds, expected_rmsds, atol=1e-8)
+    np.testing.assert_allclose(rots, expected_rots, atol=1e-6)
@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+from geomm.transforms import RigidTransform
+from geomm.theobald_qcp import theobald_qcp, theobald_qcp_traj, QCPReference
+
+@pytest.fixture
+def transforms():
+    rng = np.random.default_rng(16)
+    return RigidTransform(np.concatenate([rng.normal(size=(5, 4)),
+                                         rng.normal(size=(5, 3))], axis=1))
+
+def test_rotation_matrices_roundtrip(transforms):
+    rotation_matrices = transforms.rotation_matrices
+    np.testing.assert_allclose(np.matmul(rotation_matrices,
+                                         np.swapaxes(rotation_matrices, 1, 2)),
+                               np.broadcast_to(np.eye(3), (5, 3, 3)), atol=1e-12)
+    np.testing.assert_allclose(np.linalg.det(rotation_matrices), 1.0)
+
+    roundtrip = RigidTransform.from_rotation_matrices(rotation_matrices,
+                                                      transforms.translations)
+    np.testing.assert_allclose(roundtrip.rotation_matrices, rotation_matrices, atol=1e-12)
+    np.testing.assert_allclose(roundtrip.translations, transforms.translations)
+
+def test_compose_and_invert(transforms):
+    rng = np.random.default_rng(17)
+    coords = rng.normal(size=(5, 8, 3))
+
+    expected = coords @ transforms.rotation_matrices + transforms.translations[:, np.newaxis]
+    np.testing.assert_allclose(transforms.apply(coords), expected)
+
+    # composition applies the right hand side first, also broadcasting
+    # a single transformation
+    np.testing.assert_allclose((transforms[0] * transforms).apply(coords),
+                               transforms[0].apply(transforms.apply(coords)))
+    np.testing.assert_allclose((transforms * transforms[::-1]).apply(coords),
+                               transforms.apply(transforms[::-1].apply(coords)))
+
+    np.testing.assert_allclose((transforms.inv() * transforms).apply(coords),
+                               coords, atol=1e-12)
+
+    single = transforms[2]
+    assert single.single
+    assert single.apply(coords[0]).shape == (8, 3)
+    np.testing.assert_allclose(single.inv().apply(single.apply(coords[0])),
+                               coords[0], atol=1e-12)
+
+    # in place
+    out = coords.copy()
+    transforms.apply(out, out=out)
+    np.testing.assert_allclose(out, expected)
+
+def test_qcp_quaternions():
+    rng = np.random.default_rng(18)
+    ref = rng.normal(size=(12, 3))
+    ref -= ref.mean(axis=0)
+    frames = rng.normal(size=(4, 12, 3))
+
+    rmsd, rotation_matrix, quaternion = theobald_qcp(ref, frames[0] - frames[0].mean(axis=0),
+                                                     return_quaternion=True)
+    np.testing.assert_allclose(RigidTransform.from_quaternions(quaternion).rotation_matrices,
+                               rotation_matrix, atol=1e-12)
+
+    rmsds, rotation_matrices, quaternions = theobald_qcp_traj(ref, frames,
+                                                              return_quaternion=True)
+    np.testing.assert_allclose(RigidTransform.from_quaternions(quaternions).rotation_matrices,
+                               rotation_matrices, atol=1e-12)
+
+    # the transformations superimpose the frames
+    reference = QCPReference(ref)
+    sup_coords, _, _ = reference.superimpose(frames)
+    np.testing.assert_allclose(reference.transform(frames).apply(frames), sup_coords,
+                               atol=1e-12)
+    np.testing.assert_allclose(reference.transform(frames[1]).apply(frames[1]),
+                               sup_coords[1], atol=1e-12)